@@ -1,42 +1,172 @@
-from ollama import chat
+import threading
+import time
+import httpx
+from ollama import Client
 from prompt import *
+from tracing import tracer
+from tokenizer import summary_token_budget
+from executor import Cancelled
+
+MODEL_NAME = 'llama3.1:latest'
+DEFAULT_OPTIONS = {
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "top_k": 40,
+    "repeat_penalty": 1.15,
+}
+
+# Số kết nối HTTP tối đa tới mỗi Ollama server, dùng chung cho mọi thread của process
+MAX_CONNECTIONS = 16
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(host=None):
+    """
+    ollama.Client dùng chung trong process cho mỗi host: các worker LLM dùng lại kết nối
+    trong connection pool của httpx (thread-safe) thay vì mở kết nối mới cho mỗi request
+    """
+    client = _clients.get(host)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(host)
+            if client is None:
+                limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+                client = _clients[host] = Client(host=host, limits=limits)
+    return client
+
+
 class Agent:
-    def __init__(self, system="", max_length=0.1):
+    def __init__(self, system="", max_length=0.1, model=MODEL_NAME, options=None,
+                 cache=None, bypass_cache=False, echo=True, prompt_builder=generate_prompt,
+                 cancel_event=None, keep_alive=None, host=None):
+        """
+        cache: SummaryCache dùng chung, bỏ qua LLM nếu prompt đã được tóm tắt trước đó
+        bypass_cache: Không đọc cache (vẫn ghi kết quả mới vào cache)
+        echo: In prompt và từng token ra stdout
+        prompt_builder: Hàm (chunk, max_length) -> prompt, vd. generate_reduce_prompt khi gộp các tóm tắt
+        cancel_event: threading.Event, khi được set thì ngắt stream đang chạy và raise Cancelled
+        keep_alive: Thời gian Ollama giữ model (và KV cache) sau request, vd. "30m". None: mặc định của server
+        host: Địa chỉ Ollama server (mặc định lấy từ OLLAMA_HOST), request đi qua shared_client(host)
+        """
         self.system = system
         self.max_length = max_length
+        self.model = model
+        self.options = dict(DEFAULT_OPTIONS if options is None else options)
+        self.cache = cache
+        self.bypass_cache = bypass_cache
+        self.echo = echo
+        self.prompt_builder = prompt_builder
+        self.cancel_event = cancel_event
+        self.keep_alive = keep_alive
+        self.host = host
         self.messages = []
+        self.last_eval_count = 0
+        self.last_prompt_eval_count = 0
+        self.last_ttft = None
+        self._checked_key = None
+        self._prepared = None
 
         if self.system:
             self.messages.append({"role": "system", "content": system})
 
+    def _cache_key(self, message):
+        messages = self.messages + [{"role": "user", "content": message}]
+        return self.cache.make_key(messages, self.model, self.options)
+
+    def _apply_token_budget(self, chunk):
+        """Chunk có token_count (đo bằng tokenizer): giới hạn số token sinh ra theo độ dài tóm tắt"""
+        if "token_count" in chunk:
+            self.options["num_predict"] = summary_token_budget(chunk["token_count"], self.max_length / 100)
+
+    def prepare(self, chunk):
+        """Dựng prompt cho chunk một lần, cached_summary và __call__ dùng lại prompt này"""
+        if self._prepared is None or self._prepared[0] is not chunk:
+            self._apply_token_budget(chunk)
+            with tracer.span("prompt_build"):
+                self._prepared = (chunk, self.prompt_builder(chunk, self.max_length))
+        return self._prepared[1]
+
+    def cached_summary(self, chunk):
+        """Kết quả tóm tắt đã có trong cache cho chunk này (None nếu chưa có)"""
+        if self.cache is None or self.bypass_cache:
+            return None
+        key = self._cache_key(self.prepare(chunk))
+        if key == self._checked_key:
+            return None
+        cached = self.cache.get(key)
+        if cached is None:
+            # Đã tra cache cho prompt này, __call__ không cần tra lại
+            self._checked_key = key
+        return cached
+
     def __call__(self, chunk):
-        message = generate_prompt(chunk, self.max_length)
-        print("message :", message)
+        message = self.prepare(chunk)
+        if self.echo:
+            print("message :", message)
+
+        key = None
+        if self.cache is not None:
+            key = self._cache_key(message)
+            if not self.bypass_cache and key != self._checked_key:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+
         self.messages.append({"role": "user", "content": message})
+        start = time.perf_counter()
         result = self.execute()
+        if key is not None:
+            self.cache.put(key, result, tokens=self.last_eval_count, seconds=time.perf_counter() - start)
         return result
 
     def execute(self):
         """
         Streaming + trả về toàn bộ chuỗi sau khi hoàn tất.
         """
-        stream = chat(
-            model='llama3.1:latest',
+        start = time.perf_counter()
+        first_token = None
+        stream = shared_client(self.host).chat(
+            model=self.model,
             messages=self.messages,
-            options={
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "top_k": 40,
-                "repeat_penalty": 1.15,
-            },
-            stream=True
+            options=self.options,
+            stream=True,
+            **self._request_kwargs()
         )
 
-        full_text = ""
+        parts = []
 
         for chunk in stream:
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                # Đóng kết nối để Ollama dừng sinh token cho request này
+                stream.close()
+                raise Cancelled()
+            if first_token is None:
+                first_token = time.perf_counter()
             text = chunk["message"]["content"]
-            full_text += text
-            print(text, end='', flush=True)
+            parts.append(text)
+            if self.echo:
+                print(text, end='', flush=True)
+            if chunk.get("done"):
+                self._record_counts(chunk)
+
+        self._record_timings(start, first_token, len(parts))
+        return "".join(parts)
+
+    def _request_kwargs(self):
+        return {"keep_alive": self.keep_alive} if self.keep_alive is not None else {}
+
+    def _record_counts(self, done_chunk):
+        """Số token sinh ra và số token prompt server phải xử lý (không tính phần lấy từ KV cache)"""
+        self.last_eval_count = done_chunk.get("eval_count") or 0
+        self.last_prompt_eval_count = done_chunk.get("prompt_eval_count") or 0
 
-        return full_text
\ No newline at end of file
+    def _record_timings(self, start, first_token, n_parts):
+        """Ghi time-to-first-token và thời gian sinh token vào tracer"""
+        end = time.perf_counter()
+        first_token = first_token or end
+        self.last_ttft = first_token - start
+        # tokens: số token prompt server thực sự xử lý (prefill), phần dùng lại từ KV cache không được tính
+        tracer.record("llm_ttft", start, first_token, count=1, tokens=self.last_prompt_eval_count)
+        tracer.record("llm_generate", first_token, end, count=1, tokens=self.last_eval_count or n_parts)
@@ -0,0 +1,352 @@
+"""
+Xử lý hàng loạt toàn bộ file .txt trong thư mục (mặc định ./raw_text) không cần giao diện Gradio
+
+- Chunking + NER chạy trên nhiều process, mỗi process giữ một bản model
+- Tóm tắt của tất cả văn bản đi qua chung một giới hạn số request đồng thời + token bucket
+- Mỗi văn bản có một file kết quả riêng: <output-dir>/<tên file>.jsonl và .json
+
+Chạy: python batch.py --input-dir ./raw_text --output-dir ./output --workers 2 --concurrency 4
+"""
+
+import argparse
+import glob
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import model_registry
+from agent import DEFAULT_OPTIONS, Agent
+from embeddings import BACKENDS
+from entity_index import CONTEXT_ENTITIES, MAX_PROMPT_ENTITIES, EntityIndex
+from dedup import copy_from_original, mark_duplicates
+from executor import Backpressure, TokenBucket, summarize_chunk
+from ner import GLINER_MODEL, get_entity_names_batch
+from result_writer import JsonlResultWriter, completed_chunk_ids, make_doc_id
+from semantic_chungking import SemanticNewsChunker, register_sentence_model
+from summary_cache import SummaryCache
+from prompt import generate_prefix_prompt, prefix_system_prompt
+from tokenizer import chunk_token_budget, load_token_counter
+from utils import load_prompt
+
+DEFAULT_LABELS = "tên sự kiện, tên người, tên tổ chức, mốc thời gian, vị trí, tiền tệ, phần trăm"
+EMBEDDING_MODEL = "keepitreal/vietnamese-sbert"
+
+
+def _init_worker(threads_per_worker, embedding_backend, embedding_batch_size):
+    """Load model một lần cho mỗi process worker"""
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+    embedding_key = register_sentence_model(
+        EMBEDDING_MODEL, embedding_backend, batch_size=embedding_batch_size, threads=threads_per_worker
+    )
+    model_registry.warmup([embedding_key, GLINER_MODEL])
+
+
+def chunk_and_extract(path, labels, chunk_params, skip_chunk_ids, ner_batch_size, tokenizer_name=None, context_limit=None,
+                      embedding_backend="sentence-transformers", embedding_batch_size=32, dedup_threshold=0.0,
+                      dedup_min_text_overlap=0.6):
+    """
+    Chạy trong process worker: chunk văn bản theo luồng và trích xuất entity.
+    Các chunk đã có kết quả từ lần chạy trước và các chunk trùng lặp (duplicate_of)
+    được trả về nhưng không chạy NER.
+    Trả về (chunks, tổng thời gian, thời gian NER trung bình mỗi chunk)
+    """
+    start = time.perf_counter()
+    token_counter = load_token_counter(tokenizer_name) if tokenizer_name else None
+    chunker = SemanticNewsChunker(
+        model_name=EMBEDDING_MODEL,
+        embedding_backend=embedding_backend,
+        embedding_batch_size=embedding_batch_size,
+        token_counter=token_counter,
+        context_limit=context_limit,
+        **chunk_params
+    )
+    chunks = list(chunker.chunk_stream(path))
+
+    previous_text = ""
+    for chunk in chunks:
+        chunk['previous_text'] = previous_text
+        previous_text = chunk['text']
+
+    if dedup_threshold:
+        mark_duplicates(
+            chunks, chunker.chunk_centroids(chunks),
+            threshold=dedup_threshold, min_text_overlap=dedup_min_text_overlap
+        )
+
+    pending = [
+        chunk for chunk in chunks
+        if chunk['chunk_id'] not in skip_chunk_ids and 'duplicate_of' not in chunk
+    ]
+    ner_start = time.perf_counter()
+    entities_per_chunk = get_entity_names_batch([chunk['text'] for chunk in pending], labels, batch_size=ner_batch_size)
+    for chunk, list_entity_name in zip(pending, entities_per_chunk):
+        chunk["list_entity"] = list_entity_name
+    ner_seconds = (time.perf_counter() - ner_start) / max(1, len(pending))
+    return chunks, time.perf_counter() - start, ner_seconds
+
+
+class _Document:
+    """
+    Trạng thái xử lý của một văn bản trong process chính. File kết quả chỉ được mở (open)
+    khi chunking + NER của văn bản xong và được đóng khi văn bản xong (finish)
+    """
+
+    def __init__(self, path, output_dir, doc_id, fsync_every):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.json_path = os.path.join(output_dir, self.name + ".json")
+        self.jsonl_path = os.path.join(output_dir, self.name + ".jsonl")
+        self.doc_id = doc_id
+        self.fsync_every = fsync_every
+        # chunk_id đã có kết quả từ lần chạy trước, worker không chạy lại NER cho các chunk này
+        self.skip_chunk_ids = completed_chunk_ids(self.jsonl_path, doc_id)
+        self.writer = None
+        self.remaining = 0
+        self.total_chunks = 0
+        self.duplicates_of = {}     # chunk_id gốc -> các chunk trùng với nó
+        self.ner_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def write_with_duplicates(self, chunk):
+        """Ghi chunk (nếu chưa có) và các chunk trùng với nó, gọi khi đang giữ lock"""
+        if chunk['chunk_id'] not in self.writer.completed_ids:
+            self.writer.write(chunk)
+        for duplicate in self.duplicates_of.get(chunk['chunk_id'], []):
+            if duplicate['chunk_id'] not in self.writer.completed_ids:
+                self.writer.write(copy_from_original(duplicate, chunk, self.ner_seconds))
+
+    def open(self):
+        self.writer = JsonlResultWriter(self.jsonl_path, self.doc_id, self.fsync_every)
+
+    def finish(self):
+        self.writer.export_json(self.json_path)
+        self.writer.close()
+
+
+def run_batch(args):
+    paths = sorted(glob.glob(os.path.join(args.input_dir, "*.txt")))
+    if not paths:
+        print(f"Không tìm thấy file .txt trong {args.input_dir}")
+        return
+
+    labels = args.labels.split(",")
+    chunk_params = {
+        "similarity_threshold": args.similarity_threshold,
+        "min_chunk_size": args.min_chunk_size,
+        "max_chunk_size": args.max_chunk_size
+    }
+    system_prompt = load_prompt()
+    if not args.legacy_prompt_layout:
+        system_prompt = prefix_system_prompt(system_prompt)
+    options = dict(DEFAULT_OPTIONS)
+    context_limit = None
+    if args.tokenizer and args.context_tokens:
+        options["num_ctx"] = args.context_tokens
+        context_limit = chunk_token_budget(
+            args.context_tokens,
+            args.summarize_size / 100,
+            load_token_counter(args.tokenizer).count(system_prompt) + args.prompt_overhead_tokens
+        )
+    summary_cache = SummaryCache(args.summary_cache) if args.summary_cache else None
+    limiter = TokenBucket(rate=args.rps)
+    backpressure = Backpressure(max_in_flight=args.concurrency)
+    def document_agent_factory(chunks):
+        """Hàm tạo Agent cho một văn bản: prompt gọn dùng chỉ mục entity của chính văn bản đó"""
+        prompt_options = {}
+        if not args.legacy_prompt_layout:
+            prompt_options["prompt_builder"] = generate_prefix_prompt
+        if not args.full_entity_prompt:
+            entity_index = EntityIndex(
+                max_entities=args.max_prompt_entities, context_entities=args.context_entities,
+                prefix_layout=not args.legacy_prompt_layout
+            )
+            entity_index.add_chunks(chunk for chunk in chunks if 'duplicate_of' not in chunk)
+            prompt_options["prompt_builder"] = entity_index.build_prompt
+        return lambda: Agent(
+            system=system_prompt,
+            max_length=args.summarize_size,
+            options=options,
+            cache=summary_cache,
+            echo=False,
+            keep_alive=args.keep_alive,
+            **prompt_options
+        )
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    progress = {"docs": 0, "chunks": 0}
+    progress_lock = threading.Lock()
+    failed = []
+    ttfts = []
+    threads_per_worker = max(1, (os.cpu_count() or 1) // args.workers)
+
+    # Số văn bản đang xử lý (đã gửi đi chunk, chưa xong), giới hạn số file kết quả mở cùng lúc
+    # và số chunk giữ trong bộ nhớ khi LLM chậm hơn chunking
+    document_slots = threading.Semaphore(args.max_open_documents)
+
+    def finish_document(document):
+        document.finish()
+        document_slots.release()
+        with progress_lock:
+            progress["docs"] += 1
+            progress["chunks"] += document.total_chunks
+            elapsed = time.perf_counter() - start
+            print(f"[{progress['docs']}/{len(paths)}] {document.name}: {document.total_chunks} chunk -> {document.json_path}"
+                  f" ({elapsed:.0f}s, {progress['chunks'] / elapsed:.2f} chunk/s)")
+
+    def on_summary_done(document, future):
+        """Ghi kết quả ngay khi chunk tóm tắt xong (chạy trong thread của llm_pool)"""
+        try:
+            chunk = future.result()
+        except Exception as e:
+            failed.append((document.name, str(e)))
+            print(f"Lỗi khi tóm tắt {document.name}: {e}")
+            chunk = None
+        with document.lock:
+            if chunk is not None:
+                document.write_with_duplicates(chunk)
+                if 'ttft_seconds' in chunk:
+                    ttfts.append(chunk['ttft_seconds'])
+            document.remaining -= 1
+            if document.remaining:
+                return
+        finish_document(document)
+
+    # Một thread pool dùng chung cho mọi văn bản = giới hạn số request LLM đồng thời toàn cục
+    with ProcessPoolExecutor(
+        max_workers=args.workers, initializer=_init_worker,
+        initargs=(threads_per_worker, args.embedding_backend, args.embedding_batch_size)
+    ) as process_pool, ThreadPoolExecutor(max_workers=args.concurrency) as llm_pool:
+        def submit_document(path):
+            doc_params = [chunk_params, labels, args.summarize_size]
+            if args.tokenizer:
+                doc_params += [args.tokenizer, context_limit]
+            if args.embedding_backend != "sentence-transformers":
+                doc_params.append(args.embedding_backend)
+            if not args.full_entity_prompt:
+                doc_params += ["compact_prompt", args.max_prompt_entities, args.context_entities]
+            if not args.legacy_prompt_layout:
+                doc_params.append("prefix_prompt")
+            doc_id = make_doc_id(path, *doc_params)
+            document = _Document(path, args.output_dir, doc_id, args.fsync_every)
+            future = process_pool.submit(
+                chunk_and_extract, path, labels, chunk_params,
+                document.skip_chunk_ids, args.ner_batch_size, args.tokenizer, context_limit,
+                args.embedding_backend, args.embedding_batch_size, args.dedup_threshold,
+                args.dedup_min_text_overlap
+            )
+            chunk_futures[future] = document
+
+        def on_chunked(document, future):
+            try:
+                chunks, seconds, document.ner_seconds = future.result()
+            except Exception as e:
+                failed.append((document.name, str(e)))
+                document_slots.release()
+                print(f"Lỗi khi chunk {document.name}: {e}")
+                return
+
+            document.open()
+            for chunk in chunks:
+                if 'duplicate_of' in chunk:
+                    document.duplicates_of.setdefault(chunk['duplicate_of'], []).append(chunk)
+            # Chunk gốc đã xong từ lần chạy trước: ghi luôn các chunk trùng với nó
+            with document.lock:
+                for chunk_id, record in document.writer.resumed.items():
+                    if 'duplicate_of' not in record:
+                        document.write_with_duplicates(record)
+            pending = [
+                chunk for chunk in chunks
+                if chunk['chunk_id'] not in document.writer.resumed and 'duplicate_of' not in chunk
+            ]
+            document.total_chunks = len(chunks)
+            document.remaining = len(pending)
+            n_duplicates = sum(len(group) for group in document.duplicates_of.values())
+            print(f"Đã chunk + NER {document.name}: {len(chunks)} chunk ({len(pending)} cần tóm tắt,"
+                  f" {n_duplicates} trùng lặp) trong {seconds:.1f}s")
+            if not pending:
+                finish_document(document)
+                return
+            make_agent = document_agent_factory([
+                document.writer.resumed.get(chunk['chunk_id'], chunk) for chunk in chunks
+            ])
+            for chunk in pending:
+                summary_future = llm_pool.submit(
+                    summarize_chunk, chunk, make_agent, limiter=limiter, backpressure=backpressure
+                )
+                summary_future.add_done_callback(lambda f, document=document: on_summary_done(document, f))
+
+        chunk_futures = {}
+        remaining_paths = deque(paths)
+        while remaining_paths or chunk_futures:
+            # Gửi thêm văn bản khi còn slot. Không còn văn bản nào đang chunk thì chờ tới khi có văn bản xong
+            while remaining_paths and document_slots.acquire(blocking=not chunk_futures):
+                submit_document(remaining_paths.popleft())
+            done, _ = wait(chunk_futures, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                on_chunked(chunk_futures.pop(future), future)
+
+    elapsed = time.perf_counter() - start
+    print("\n=== Tổng kết ===")
+    print(f"Văn bản: {progress['docs']}/{len(paths)} trong {elapsed:.1f}s ({progress['docs'] / elapsed * 60:.1f} văn bản/phút)")
+    print(f"Chunk: {progress['chunks']} ({progress['chunks'] / elapsed:.2f} chunk/s)")
+    if summary_cache is not None:
+        stats = summary_cache.stats()
+        print(f"Summary cache: {stats['hits']} hit, tiết kiệm {stats['tokens_saved']} token, {stats['seconds_saved']:.1f}s")
+    if ttfts:
+        layout = "bố cục cũ" if args.legacy_prompt_layout else "bố cục prefix"
+        print(f"Time-to-first-token ({layout}): trung bình {sum(ttfts) / len(ttfts):.2f}s qua {len(ttfts)} request")
+    for name, error in failed:
+        print(f"Lỗi: {name}: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tóm tắt hàng loạt các file .txt")
+    parser.add_argument("--input-dir", default="./raw_text")
+    parser.add_argument("--output-dir", default="./output")
+    parser.add_argument("--workers", type=int, default=2, help="Số process chạy chunking + NER")
+    parser.add_argument("--concurrency", type=int, default=4, help="Số request LLM đồng thời (toàn cục)")
+    parser.add_argument("--rps", type=float, default=2.0, help="Số request/giây tối đa gửi tới Ollama")
+    parser.add_argument("--labels", default=DEFAULT_LABELS, help="Các entity cần trích xuất, ngăn cách bằng dấu phẩy")
+    parser.add_argument("--summarize-size", type=int, default=30, help="Độ dài tóm tắt (%% so với ban đầu)")
+    parser.add_argument("--similarity-threshold", type=float, default=0.5)
+    parser.add_argument("--min-chunk-size", type=int, default=200)
+    parser.add_argument("--max-chunk-size", type=int, default=500)
+    parser.add_argument("--ner-batch-size", type=int, default=16)
+    parser.add_argument("--embedding-backend", default="sentence-transformers", choices=BACKENDS,
+                        help="onnx: model int8 chạy bằng onnxruntime, hashing: không cần model (nhanh, kém chính xác hơn)")
+    parser.add_argument("--embedding-batch-size", type=int, default=32)
+    parser.add_argument("--fsync-every", type=int, default=10)
+    parser.add_argument("--max-open-documents", type=int, default=16,
+                        help="Số văn bản xử lý cùng lúc (mỗi văn bản giữ một file kết quả mở và các chunk trong bộ nhớ)")
+    parser.add_argument("--full-entity-prompt", action="store_true",
+                        help="Đưa toàn bộ entity của chunk vào prompt như cũ (không dùng chỉ mục entity của văn bản)")
+    parser.add_argument("--max-prompt-entities", type=int, default=MAX_PROMPT_ENTITIES)
+    parser.add_argument("--context-entities", type=int, default=CONTEXT_ENTITIES,
+                        help="Số entity ngữ cảnh lấy từ các chunk trước (0: không dùng)")
+    parser.add_argument("--legacy-prompt-layout", action="store_true",
+                        help="Hướng dẫn tóm tắt nằm trong prompt của từng chunk như cũ (không dùng lại được prefix cache)")
+    parser.add_argument("--keep-alive", default=None,
+                        help="Thời gian Ollama giữ model và KV cache sau request cuối, vd. 30m (mặc định của server)")
+    parser.add_argument("--dedup-threshold", type=float, default=0.95,
+                        help="Cosine tối thiểu giữa centroid hai chunk để dùng lại kết quả (0: tắt)")
+    parser.add_argument("--dedup-min-text-overlap", type=float, default=0.6,
+                        help="Jaccard tối thiểu giữa cặp từ liền nhau của hai chunk để dùng lại kết quả")
+    parser.add_argument("--tokenizer", default="",
+                        help="tokenizer.json hoặc tên tokenizer trên HuggingFace Hub để đo chunk theo token")
+    parser.add_argument("--context-tokens", type=int, default=0,
+                        help="num_ctx của LLM, gộp các chunk liền nhau cho vừa context (cần --tokenizer)")
+    parser.add_argument("--prompt-overhead-tokens", type=int, default=400)
+    parser.add_argument("--summary-cache", default="./cache/summaries.sqlite",
+                        help="File cache tóm tắt (để trống để tắt)")
+    run_batch(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
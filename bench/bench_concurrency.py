@@ -0,0 +1,81 @@
+"""
+Benchmark thời gian xử lý theo số chunk chạy đồng thời
+Dùng stub thay cho client Ollama (agent.shared_client): server giả lập có num_parallel slot,
+mỗi request tốn prefill + n_tokens * token_latency giây
+
+Chạy: python bench/bench_concurrency.py --chunks 200 --concurrency 1 2 4 8
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agent
+from agent import Agent
+from executor import TokenBucket, summarize_chunks
+
+
+def make_stub_chat(num_parallel, prefill, n_tokens, token_latency):
+    slots = threading.Semaphore(num_parallel)
+
+    def stub_chat(model, messages, options=None, stream=False, **kwargs):
+        with slots:
+            time.sleep(prefill)
+            for _ in range(n_tokens):
+                time.sleep(token_latency)
+                yield {"message": {"content": "x "}}
+
+    return stub_chat
+
+
+def make_chunks(n):
+    return [
+        {"chunk_id": i + 1, "text": "Câu mẫu cho benchmark. " * 20, "list_entity": []}
+        for i in range(n)
+    ]
+
+
+def serial_baseline(n_chunks, per_request):
+    """Thời gian của vòng lặp cũ: mỗi chunk chạy tuần tự + sleep 1s (10s mỗi 10 chunk)"""
+    sleeps = sum(10 if i % 10 == 0 else 1 for i in range(n_chunks))
+    return n_chunks * per_request + sleeps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--num-parallel", type=int, default=4, help="Số slot song song của server giả lập")
+    parser.add_argument("--prefill", type=float, default=0.05)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--rps", type=float, default=50.0)
+    args = parser.parse_args()
+
+    stub_chat = make_stub_chat(args.num_parallel, args.prefill, args.tokens, args.token_latency)
+    agent.shared_client = lambda host=None: SimpleNamespace(chat=stub_chat)
+    per_request = args.prefill + args.tokens * args.token_latency
+    print(f"Vòng lặp tuần tự cũ (ước tính): {serial_baseline(args.chunks, per_request):.1f}s")
+
+    print(f"{'concurrency':>12} {'wall (s)':>10} {'chunk/s':>10}")
+    for concurrency in args.concurrency:
+        chunks = make_chunks(args.chunks)
+        limiter = TokenBucket(rate=args.rps)
+        start = time.perf_counter()
+        summarize_chunks(
+            chunks,
+            lambda: Agent(system="system", max_length=30, echo=False),
+            max_workers=concurrency,
+            limiter=limiter
+        )
+        elapsed = time.perf_counter() - start
+        print(f"{concurrency:>12} {elapsed:>10.2f} {args.chunks / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+So sánh các backend embedding: tốc độ encode (câu/giây) và mức độ trùng ranh giới chủ đề
+so với backend tham chiếu (mặc định sentence-transformers)
+
+- boundary F1: ranh giới từ detect_topic_boundaries, lệch tối đa --tolerance câu vẫn tính là trùng
+- sim corr: hệ số tương quan Pearson giữa similarity đã làm mượt của hai backend
+  (không phụ thuộc ngưỡng, vì mỗi backend có thang similarity khác nhau)
+
+Chạy: python bench/bench_embeddings.py --backends sentence-transformers onnx hashing --threads 4
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embeddings import BACKENDS, load_embedding_backend
+from run_bench import synthetic_document
+from semantic_chungking import SemanticNewsChunker
+
+
+def boundary_f1(reference, predicted, tolerance):
+    """F1 giữa hai tập ranh giới, mỗi ranh giới tham chiếu chỉ được ghép một lần"""
+    reference = sorted(set(reference) - {0})
+    predicted = sorted(set(predicted) - {0})
+    if not reference and not predicted:
+        return 1.0
+    used = set()
+    matched = 0
+    for b in predicted:
+        for r in range(b - tolerance, b + tolerance + 1):
+            if r in reference and r not in used:
+                used.add(r)
+                matched += 1
+                break
+    precision = matched / len(predicted) if predicted else 0.0
+    recall = matched / len(reference) if reference else 0.0
+    return 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="keepitreal/vietnamese-sbert")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--reference", default="sentence-transformers", choices=BACKENDS)
+    parser.add_argument("--raw-dir", default=os.path.join(ROOT, "raw_text"))
+    parser.add_argument("--synthetic", type=int, default=2000, help="Số câu văn bản tổng hợp thêm vào")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0, help="Số thread cho PyTorch/onnxruntime (0: mặc định)")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--tolerance", type=int, default=1)
+    args = parser.parse_args()
+
+    chunker = SemanticNewsChunker(similarity_threshold=args.threshold)
+    docs = []
+    for path in sorted(glob.glob(os.path.join(args.raw_dir, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            docs.append(chunker.split_sentences(f.read()))
+    if args.synthetic:
+        docs.append(chunker.split_sentences(synthetic_document(args.synthetic, seed=args.synthetic)))
+    n_sentences = sum(len(doc) for doc in docs)
+    print(f"{len(docs)} văn bản, {n_sentences} câu")
+
+    backends = [args.reference] + [b for b in args.backends if b != args.reference]
+    results = {}
+    for name in backends:
+        try:
+            start = time.perf_counter()
+            backend = load_embedding_backend(name, args.model, batch_size=args.batch_size, threads=args.threads or None)
+            load_seconds = time.perf_counter() - start
+        except Exception as e:
+            print(f"Bỏ qua {name}: {e}")
+            continue
+        backend.encode(docs[0][:args.batch_size], batch_size=args.batch_size)  # warm-up
+
+        start = time.perf_counter()
+        embeddings = [backend.encode(doc, batch_size=args.batch_size) for doc in docs]
+        seconds = time.perf_counter() - start
+
+        sims = [chunker.smooth_similarities(chunker.calculate_similarities(e)) for e in embeddings]
+        boundaries = [chunker.detect_topic_boundaries(doc, s) for doc, s in zip(docs, sims)]
+        results[name] = {
+            "load_seconds": load_seconds,
+            "sentences_per_second": n_sentences / seconds,
+            "sims": np.concatenate(sims) if sims else np.array([]),
+            "boundaries": boundaries
+        }
+
+    if args.reference not in results:
+        print(f"Không load được backend tham chiếu {args.reference}, so sánh với backend đầu tiên chạy được")
+    if not results:
+        return
+    reference = results.get(args.reference) or next(iter(results.values()))
+
+    print(f"\n{'backend':<22} {'load (s)':>9} {'câu/s':>10} {'ranh giới':>10} {'F1':>6} {'sim corr':>9}")
+    for name, result in results.items():
+        f1 = np.mean([
+            boundary_f1(ref, pred, args.tolerance)
+            for ref, pred in zip(reference["boundaries"], result["boundaries"])
+        ])
+        a, b = reference["sims"], result["sims"]
+        corr = float(np.corrcoef(a, b)[0, 1]) if len(a) > 1 and a.std() > 0 and b.std() > 0 else float("nan")
+        n_boundaries = sum(len(b) - 1 for b in result["boundaries"])
+        print(f"{name:<22} {result['load_seconds']:>9.1f} {result['sentences_per_second']:>10.0f}"
+              f" {n_boundaries:>10} {f1:>6.3f} {corr:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
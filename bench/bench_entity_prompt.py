@@ -0,0 +1,123 @@
+"""
+So sánh ba cách dựng prompt:
+- full: generate_prompt, mọi entity của chunk (kể cả các cách viết khác nhau của cùng entity)
+- full+previous: như full, thêm toàn bộ văn bản chunk trước làm ngữ cảnh
+- compact+tail: entity gộp như compact, ngữ cảnh là --tail-words từ cuối chunk trước (cách làm trước đây)
+- compact: EntityIndex, entity gộp trên cả văn bản, giới hạn số lượng + một dòng ngữ cảnh gồm các entity
+  chính của các chunk trước (EntityIndex.context)
+- compact-entities: như compact nhưng không có ngữ cảnh (chỉ đo phần entity)
+Các chỉ số:
+- số token prompt (system + user) mỗi chunk và riêng phần prompt của chunk (user),
+  đếm bằng --tokenizer hoặc theo khoảng trắng
+- thời gian mỗi chunk với ollama.chat giả lập có prefill tỉ lệ với độ dài prompt (--prompt-latency)
+
+NER mặc định là StubNER (bench/stubs.py). Thêm --gliner để chạy GLiNER thật.
+
+Chạy: python bench/bench_entity_prompt.py --max-entities 15 --context-entities 5
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embeddings import HashingBackend
+from run_bench import LABELS, synthetic_document
+from stubs import install_stubs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--raw-dir", default=os.path.join(ROOT, "raw_text"))
+    parser.add_argument("--synthetic", type=int, default=1000, help="Số câu văn bản tổng hợp thêm vào")
+    parser.add_argument("--max-entities", type=int, default=15)
+    parser.add_argument("--context-entities", type=int, default=5)
+    parser.add_argument("--tail-words", type=int, default=40)
+    parser.add_argument("--tokenizer", default="", help="tokenizer.json hoặc tên trên HuggingFace Hub")
+    parser.add_argument("--gliner", action="store_true", help="Dùng GLiNER thật thay cho StubNER")
+    parser.add_argument("--prompt-latency", type=float, default=0.0005, help="Prefill giả lập mỗi từ prompt (giây)")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="Thời gian giả lập mỗi token sinh ra (giây)")
+    args = parser.parse_args()
+
+    install_stubs(token_latency=args.token_latency, prompt_latency=args.prompt_latency)
+    if args.gliner:
+        import model_registry
+        from ner import GLINER_MODEL, _load_gliner
+        model_registry.override(GLINER_MODEL, _load_gliner())
+    from agent import Agent
+    from entity_index import EntityIndex
+    from ner import get_entity_names_batch
+    from prompt import generate_compact_prompt, generate_prompt
+    from semantic_chungking import SemanticNewsChunker
+    from tokenizer import load_token_counter, whitespace_counter
+    from utils import load_prompt
+
+    os.chdir(ROOT)
+    system_prompt = load_prompt()
+    counter = load_token_counter(args.tokenizer) if args.tokenizer else whitespace_counter()
+    chunker = SemanticNewsChunker(similarity_threshold=0.5, min_chunk_size=200, max_chunk_size=500)
+    chunker.model = HashingBackend()
+
+    docs = []
+    for path in sorted(glob.glob(os.path.join(args.raw_dir, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            docs.append((os.path.basename(path), f.read()))
+    if args.synthetic:
+        docs.append((f"synthetic_{args.synthetic}", synthetic_document(args.synthetic, seed=args.synthetic)))
+
+    def full_with_previous(chunk, max_length):
+        previous = chunk["previous_text"] or "Đây là đoạn văn đầu tiên."
+        return f"[ĐOẠN VĂN TRƯỚC]\n{previous}\n" + generate_prompt(chunk, max_length)
+
+    def tail_context(chunk):
+        words = (chunk["previous_text"] or "").split()
+        return ("... " if len(words) > args.tail_words else "") + " ".join(words[-args.tail_words:])
+
+    print(f"{'văn bản':<28} {'chunk':>6} {'entity/chunk':>13} {'prompt':<17} {'token/prompt':>13} {'so với full':>12}"
+          f" {'token/chunk':>12} {'so với full':>12} {'s/chunk':>8}")
+    for name, text in docs:
+        chunks = chunker.chunk(text)
+        previous_text = ""
+        for chunk in chunks:
+            chunk["previous_text"] = previous_text
+            previous_text = chunk["text"]
+        for chunk, entities in zip(chunks, get_entity_names_batch([c["text"] for c in chunks], LABELS)):
+            chunk["list_entity"] = entities
+        index = EntityIndex(max_entities=args.max_entities, context_entities=args.context_entities)
+        index.add_chunks(chunks)
+        entities_only = EntityIndex(max_entities=args.max_entities, context_entities=0)
+        entities_only.add_chunks(chunks)
+
+        def compact_with_tail(chunk, max_length):
+            return generate_compact_prompt(chunk, max_length, index.prompt_entities(chunk), tail_context(chunk))
+
+        n_entities = np.mean([len(chunk["list_entity"]) for chunk in chunks])
+        full_tokens = full_chunk_tokens = None
+        for mode, builder in (
+            ("full", generate_prompt), ("full+previous", full_with_previous), ("compact+tail", compact_with_tail),
+            ("compact", index.build_prompt), ("compact-entities", entities_only.build_prompt)
+        ):
+            prompts = [builder(chunk, 30) for chunk in chunks]
+            tokens = np.mean(counter.count_batch([system_prompt + "\n" + p for p in prompts]))
+            chunk_tokens = np.mean(counter.count_batch(prompts))
+            full_tokens = full_tokens or tokens
+            full_chunk_tokens = full_chunk_tokens or chunk_tokens
+            start = time.perf_counter()
+            for chunk in chunks:
+                Agent(system=system_prompt, max_length=30, echo=False, prompt_builder=builder)(dict(chunk))
+            seconds = (time.perf_counter() - start) / len(chunks)
+            print(f"{name[:28]:<28} {len(chunks):>6} {n_entities:>13.1f} {mode:<17} {tokens:>13.0f}"
+                  f" {tokens / full_tokens - 1:>+12.0%} {chunk_tokens:>12.0f} {chunk_tokens / full_chunk_tokens - 1:>+12.0%}"
+                  f" {seconds:>8.3f}")
+    print(f"\nToken đếm bằng {counter.name}. token/prompt: gồm cả system prompt, token/chunk: chỉ prompt của chunk")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Đo peak allocation (tracemalloc) của chunk() trên văn bản lớn:
+- legacy: list chuỗi cho mọi câu, văn bản chunk tạo bằng " ".join(sentences[start:end])
+- store: SentenceStore (vị trí ký tự trong chuỗi nguồn), văn bản chunk cắt từ chuỗi nguồn khi cần
+
+Hai chế độ đo:
+- text: chỉ phần biểu diễn văn bản (tách câu, đếm từ, ranh giới từ khóa, tạo văn bản chunk)
+- chunk: cả pipeline chunk() với hashing embedding (ma trận embedding thường chiếm phần lớn)
+
+Thời gian in ra được đo khi đang bật tracemalloc nên chậm hơn thực tế.
+
+Chạy: python bench/bench_memory.py --sentences 200000 --dim 384
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embeddings import HashingBackend
+from run_bench import synthetic_document
+from semantic_chungking import SemanticNewsChunker
+from sentence_store import SentenceStore
+
+
+def legacy_chunk(chunker: SemanticNewsChunker, text: str):
+    """chunk() trước khi có SentenceStore (chỉ giữ các bước ảnh hưởng tới bộ nhớ)"""
+    sentences = chunker.split_sentences(text)
+    embeddings = chunker.get_embeddings(sentences)
+    smoothed = chunker.smooth_similarities(chunker.calculate_similarities(embeddings))
+    boundaries = chunker.detect_topic_boundaries(sentences, smoothed) + [len(sentences)]
+    word_counts = np.array([chunker.count_words(s) for s in sentences], dtype=np.int64)
+    prefix = np.concatenate(([0], np.cumsum(word_counts)))
+    ranges = chunker.merge_small_ranges(list(zip(boundaries[:-1], boundaries[1:])), prefix)
+    ranges = chunker.split_large_ranges(ranges, word_counts, prefix)
+    return [" ".join(sentences[start:end]) for start, end in ranges]
+
+
+def legacy_text(chunker: SemanticNewsChunker, text: str, ranges):
+    sentences = chunker.split_sentences(text)
+    word_counts = np.array([chunker.count_words(s) for s in sentences], dtype=np.int64)
+    mask = chunker.transition_mask(sentences)
+    return word_counts, mask, [" ".join(sentences[start:end]) for start, end in ranges]
+
+
+def store_text(chunker: SemanticNewsChunker, text: str, ranges):
+    store = SentenceStore(text)
+    word_counts = store.word_counts()
+    mask = chunker.transition_mask(store)
+    return word_counts, mask, [store.text_of(start, end) for start, end in ranges]
+
+
+def measure(fn, *args):
+    """(peak bytes, giây, kết quả) của fn(*args), không tính các object đã có từ trước"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, seconds, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sentences", type=int, default=200000, help="Số câu của văn bản tổng hợp")
+    parser.add_argument("--dim", type=int, default=384, help="Số chiều hashing embedding")
+    parser.add_argument("--max-chunk-size", type=int, default=400)
+    args = parser.parse_args()
+
+    text = synthetic_document(args.sentences, seed=args.sentences)
+    chunker = SemanticNewsChunker(similarity_threshold=0.3, max_chunk_size=args.max_chunk_size)
+    chunker.model = HashingBackend(dim=args.dim)
+    print(f"Văn bản: {args.sentences} câu, {len(text) / 1e6:.1f}M ký tự")
+
+    chunks = chunker.chunk(text)
+    ranges = [(c['start_sentence'], c['end_sentence']) for c in chunks]
+
+    rows = []
+    legacy = measure(legacy_text, chunker, text, ranges)
+    store = measure(store_text, chunker, text, ranges)
+    assert legacy[2][2] == store[2][2]
+    rows.append(("text", legacy, store))
+
+    legacy = measure(legacy_chunk, chunker, text)
+    store = measure(chunker.chunk, text)
+    assert legacy[2] == [c['text'] for c in store[2]]
+    rows.append(("chunk", legacy, store))
+
+    print(f"\n{'chế độ':<8} {'legacy peak (MB)':>17} {'store peak (MB)':>16} {'giảm':>7} {'legacy (s)':>11} {'store (s)':>10}")
+    for name, (legacy_peak, legacy_seconds, _), (store_peak, store_seconds, _) in rows:
+        print(f"{name:<8} {legacy_peak / 2**20:>17.1f} {store_peak / 2**20:>16.1f}"
+              f" {1 - store_peak / legacy_peak:>7.0%} {legacy_seconds:>11.2f} {store_seconds:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
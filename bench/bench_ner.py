@@ -0,0 +1,60 @@
+"""
+Benchmark throughput (câu/giây) của trích xuất entity:
+get_entity_name từng câu vs get_entity_names_batch trên file mẫu trong raw_text
+
+Chạy: python bench/bench_ner.py --file raw_text/25112025_recorrect.txt --batch-sizes 8 16 32
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ner import get_entity_name, get_entity_names_batch
+
+LABELS = ["tên sự kiện", "tên người", "tên tổ chức", "mốc thời gian", "vị trí", "tiền tệ", "phần trăm"]
+
+
+def make_paragraphs(text, sentences_per_paragraph):
+    """Chia văn bản thành các đoạn có số câu cố định (không cần model embedding)"""
+    sentences = [s for s in text.split(".") if s.strip()]
+    return [
+        ".".join(sentences[i:i + sentences_per_paragraph]) + "."
+        for i in range(0, len(sentences), sentences_per_paragraph)
+    ]
+
+
+def count_sentences(paragraphs):
+    return sum(1 for p in paragraphs for s in p.split(".") if s)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", default="raw_text/25112025_recorrect.txt")
+    parser.add_argument("--sentences-per-chunk", type=int, default=15)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 16, 32])
+    args = parser.parse_args()
+
+    with open(args.file, "r", encoding="utf-8") as f:
+        paragraphs = make_paragraphs(f.read(), args.sentences_per_chunk)
+    n_sentences = count_sentences(paragraphs)
+    n_unique = len({s for p in paragraphs for s in p.split(".") if s})
+    print(f"{len(paragraphs)} chunk, {n_sentences} câu ({n_unique} câu khác nhau)")
+
+    start = time.perf_counter()
+    for paragraph in paragraphs:
+        get_entity_name(paragraph, LABELS)
+    elapsed = time.perf_counter() - start
+    print(f"{'từng câu':>12}: {elapsed:8.2f}s  {n_sentences / elapsed:8.1f} câu/s")
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        get_entity_names_batch(paragraphs, LABELS, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"{'batch=' + str(batch_size):>12}: {elapsed:8.2f}s  {n_sentences / elapsed:8.1f} câu/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Chạy đường tóm tắt thật (Agent đồng bộ trong thread pool, executor.iter_summaries + TokenBucket,
+client dùng chung agent.shared_client) với fake Ollama server (bench/fake_ollama.py):
+đo thời gian theo số worker và số request bị từ chối (503) khi hàng đợi server đầy
+
+- none: không giới hạn số request đang chạy ngoài số worker
+- backpressure: executor.Backpressure, giảm số request đang chạy khi server trả về 503
+
+Chạy: python bench/bench_ollama_client.py --chunks 100 --workers 1 4 16
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agent import Agent
+from executor import Backpressure, TokenBucket, summarize_chunks
+from fake_ollama import start_fake_ollama
+
+
+def make_chunks(n):
+    return [
+        {"chunk_id": i + 1, "text": "Câu mẫu cho benchmark. " * 20, "list_entity": []}
+        for i in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--rps", type=float, default=50, help="Số request/giây tối đa của TokenBucket")
+    parser.add_argument("--num-parallel", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=8)
+    args = parser.parse_args()
+
+    server, url, state = start_fake_ollama(num_parallel=args.num_parallel, max_queue=args.max_queue)
+    print(f"{'gate':<13} {'workers':>8} {'wall (s)':>10} {'chunk/s':>10} {'503':>6}")
+    try:
+        for gated in (False, True):
+            for workers in args.workers:
+                chunks = make_chunks(args.chunks)
+                rejected_before = state["rejected"]
+                start = time.perf_counter()
+                results = summarize_chunks(
+                    chunks,
+                    lambda: Agent(system="system", max_length=30, echo=False, host=url),
+                    max_workers=workers,
+                    limiter=TokenBucket(rate=args.rps),
+                    backoff=0.05,
+                    backpressure=Backpressure(max_in_flight=workers) if gated else None
+                )
+                elapsed = time.perf_counter() - start
+                assert all(chunk["summarize"] for chunk in results)
+                print(f"{'backpressure' if gated else 'none':<13} {workers:>8} {elapsed:>10.2f}"
+                      f" {args.chunks / elapsed:>10.1f} {state['rejected'] - rejected_before:>6}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+So sánh hai cách chạy NER + tóm tắt trên cùng danh sách chunk (backend giả lập trong bench/stubs.py):
+- sequential: NER cho mọi chunk rồi mới bắt đầu gọi LLM (cách cũ trong main.process_text)
+- pipeline: scheduler.summary_pipeline, NER của các chunk sau chạy song song với LLM của các chunk trước
+
+In thời gian chạy và bảng thống kê từng giai đoạn (mức độ bận, độ sâu hàng đợi) của pipeline.
+
+Chạy: python bench/bench_pipeline.py --sentences 2000 --ner-latency 0.01 --ttft 0.2 --token-latency 0.01
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embeddings import HashingBackend
+from run_bench import LABELS, synthetic_document
+from stubs import install_stubs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4, help="Số request LLM đồng thời")
+    parser.add_argument("--ner-workers", type=int, default=1)
+    parser.add_argument("--ner-batch-size", type=int, default=4, help="Số chunk mỗi lần gọi NER trong pipeline")
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--ner-latency", type=float, default=0.01, help="Thời gian NER giả lập mỗi câu (giây)")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Độ trễ giả lập trước token đầu tiên (giây)")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Độ trễ giả lập mỗi token (giây)")
+    args = parser.parse_args()
+
+    install_stubs(ttft=args.ttft, token_latency=args.token_latency, ner_latency=args.ner_latency)
+    from agent import Agent
+    from executor import iter_summaries
+    from ner import get_entity_names_batch
+    from scheduler import summary_pipeline
+    from semantic_chungking import SemanticNewsChunker
+
+    chunker = SemanticNewsChunker(similarity_threshold=0.5, min_chunk_size=200, max_chunk_size=500)
+    chunker.model = HashingBackend()
+    text = synthetic_document(args.sentences, seed=args.sentences)
+    make_agent = lambda: Agent(system="system", max_length=30, echo=False)
+    print(f"{len(chunker.chunk(text))} chunk")
+
+    chunks = chunker.chunk(text)
+    start = time.perf_counter()
+    entities = get_entity_names_batch([chunk["text"] for chunk in chunks], LABELS)
+    for chunk, list_entity in zip(chunks, entities):
+        chunk["list_entity"] = list_entity
+    first = None
+    for _ in iter_summaries(chunks, make_agent, max_workers=args.workers):
+        first = first or time.perf_counter() - start
+    sequential = time.perf_counter() - start
+    print(f"sequential: {sequential:.2f}s, chunk đầu tiên xong sau {first:.2f}s")
+
+    chunks = chunker.chunk(text)
+    pipeline = summary_pipeline(
+        make_agent,
+        LABELS,
+        get_entity_names_batch,
+        ner_workers=args.ner_workers,
+        ner_batch_size=args.ner_batch_size,
+        llm_workers=args.workers,
+        queue_size=args.queue_size
+    )
+    start = time.perf_counter()
+    first = None
+    for _ in pipeline.run(chunks):
+        first = first or time.perf_counter() - start
+    overlapped = time.perf_counter() - start
+    print(f"pipeline:   {overlapped:.2f}s, chunk đầu tiên xong sau {first:.2f}s"
+          f" (nhanh hơn {sequential / overlapped:.2f}x)\n")
+    print(pipeline.format_table())
+    print(f"Nút thắt: {pipeline.bottleneck()}")
+
+
+if __name__ == "__main__":
+    main()
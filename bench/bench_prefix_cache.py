@@ -0,0 +1,122 @@
+"""
+So sánh time-to-first-token của hai bố cục prompt khi server dùng lại KV cache của phần đầu prompt:
+- legacy: system prompt gốc, hướng dẫn tóm tắt nằm ở cuối prompt của từng chunk (generate_prompt,
+  generate_compact_prompt)
+- prefix: hướng dẫn cố định nằm cuối system prompt (prompt.prefix_system_prompt), prompt của chunk
+  chỉ gồm phần thay đổi (prompt.generate_prefix_prompt)
+Mỗi bố cục chạy với prompt đầy đủ (full) và prompt gọn từ chỉ mục entity (compact).
+
+Mặc định ollama.chat được giả lập (bench/stubs.py) với KV cache theo slot như Ollama: thời gian prefill
+tỉ lệ với số từ prompt không có trong cache. --ollama để gửi request tới Ollama server thật.
+Các chỉ số mỗi request: số từ prompt, số token phải prefill (prompt_eval_count) và TTFT.
+
+Chạy: python bench/bench_prefix_cache.py --workers 1 --slots 1
+"""
+
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embeddings import HashingBackend
+from run_bench import LABELS, synthetic_document
+from stubs import PrefixCache, StubNER, install_stubs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--raw-dir", default=os.path.join(ROOT, "raw_text"))
+    parser.add_argument("--synthetic", type=int, default=1000, help="Số câu văn bản tổng hợp thêm vào")
+    parser.add_argument("--workers", type=int, default=1, help="Số request LLM đồng thời")
+    parser.add_argument("--slots", type=int, default=1, help="Số slot KV cache của server giả lập (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--ttft", type=float, default=0.02, help="Độ trễ cố định trước token đầu tiên (giây)")
+    parser.add_argument("--prompt-latency", type=float, default=0.0005, help="Prefill giả lập mỗi từ prompt (giây)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Thời gian giả lập mỗi token sinh ra (giây)")
+    parser.add_argument("--ollama", action="store_true", help="Gửi request tới Ollama server thật")
+    parser.add_argument("--keep-alive", default=None, help="keep_alive của các request ở bố cục prefix")
+    args = parser.parse_args()
+
+    import agent as agent_module
+    import model_registry
+    from agent import Agent
+    from entity_index import EntityIndex
+    from ner import GLINER_MODEL, get_entity_names_batch
+    from prompt import generate_prefix_prompt, generate_prompt, prefix_system_prompt
+    from semantic_chungking import SemanticNewsChunker
+    from utils import load_prompt
+
+    os.chdir(ROOT)
+    system_prompt = load_prompt()
+    chunker = SemanticNewsChunker(similarity_threshold=0.5, min_chunk_size=200, max_chunk_size=500)
+    chunker.model = HashingBackend()
+    model_registry.override(GLINER_MODEL, StubNER())
+
+    texts = []
+    for path in sorted(glob.glob(os.path.join(args.raw_dir, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            texts.append(f.read())
+    if args.synthetic:
+        texts.append(synthetic_document(args.synthetic, seed=args.synthetic))
+    chunks = []
+    for text in texts:
+        document_chunks = chunker.chunk(text)
+        previous_text = ""
+        for chunk in document_chunks:
+            chunk["previous_text"] = previous_text
+            previous_text = chunk["text"]
+        for chunk, entities in zip(document_chunks, get_entity_names_batch([c["text"] for c in document_chunks], LABELS)):
+            chunk["list_entity"] = entities
+        chunks.append(document_chunks)
+    n_chunks = sum(len(document_chunks) for document_chunks in chunks)
+
+    def index_builder(document_chunks, prefix_layout):
+        index = EntityIndex(prefix_layout=prefix_layout)
+        index.add_chunks(document_chunks)
+        return index.build_prompt
+
+    modes = [
+        ("legacy full", system_prompt, lambda document_chunks: generate_prompt, False),
+        ("prefix full", prefix_system_prompt(system_prompt), lambda document_chunks: generate_prefix_prompt, True),
+        ("legacy compact", system_prompt, lambda document_chunks: index_builder(document_chunks, False), False),
+        ("prefix compact", prefix_system_prompt(system_prompt), lambda document_chunks: index_builder(document_chunks, True), True),
+    ]
+
+    print(f"{n_chunks} chunk, {args.workers} request đồng thời, "
+          f"{'Ollama ' + agent_module.MODEL_NAME if args.ollama else f'server giả lập {args.slots} slot'}\n")
+    print(f"{'bố cục':<16} {'từ/prompt':>10} {'prefill':>8} {'prefill (%)':>12} {'TTFT tb (s)':>12} {'TTFT p90 (s)':>13}")
+    for name, system, make_builder, prefix in modes:
+        if not args.ollama:
+            install_stubs(
+                ttft=args.ttft, token_latency=args.token_latency, prompt_latency=args.prompt_latency,
+                prefix_cache=PrefixCache(args.slots)
+            )
+
+        def run(chunk, builder):
+            agent = Agent(
+                system=system, max_length=30, echo=False, prompt_builder=builder,
+                keep_alive=args.keep_alive if prefix else None
+            )
+            agent(dict(chunk))
+            n_words = len(system.split()) + len(agent.messages[-1]["content"].split())
+            return n_words, agent.last_prompt_eval_count, agent.last_ttft
+
+        results = []
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            for document_chunks in chunks:
+                builder = make_builder(document_chunks)
+                results += pool.map(lambda chunk: run(chunk, builder), document_chunks)
+        words, prefill, ttft = map(np.array, zip(*results))
+        print(f"{name:<16} {words.mean():>10.0f} {prefill.mean():>8.0f} {prefill.sum() / words.sum():>12.0%}"
+              f" {ttft.mean():>12.3f} {np.percentile(ttft, 90):>13.3f}")
+    print("\nprefill: số token server phải xử lý trước token đầu tiên (prompt_eval_count, phần có trong KV cache không tính)")
+
+
+if __name__ == "__main__":
+    main()
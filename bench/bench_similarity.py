@@ -0,0 +1,59 @@
+"""
+Micro-benchmark calculate_similarities + smooth_similarities: vòng lặp Python vs NumPy
+Kiểm tra kết quả hai cách tính bằng nhau (np.allclose)
+
+Chạy: python bench/bench_similarity.py --sizes 1000 10000 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_chungking import SemanticNewsChunker
+
+
+def make_chunker(vectorized):
+    # Không cần model embedding cho benchmark này
+    chunker = SemanticNewsChunker.__new__(SemanticNewsChunker)
+    chunker.window_size = 3
+    chunker.vectorized = vectorized
+    return chunker
+
+
+def run(chunker, embeddings):
+    start = time.perf_counter()
+    sims = chunker.calculate_similarities(embeddings)
+    t_sim = time.perf_counter() - start
+    start = time.perf_counter()
+    smoothed = chunker.smooth_similarities(sims)
+    t_smooth = time.perf_counter() - start
+    return smoothed, t_sim, t_smooth
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    loop, fast = make_chunker(False), make_chunker(True)
+
+    print(f"{'n':>8} {'loop sim':>10} {'loop smooth':>12} {'np sim':>10} {'np smooth':>10} {'speedup':>8} {'equal':>6}")
+    for n in args.sizes:
+        embeddings = rng.standard_normal((n, args.dim)).astype(np.float32)
+        ref, l_sim, l_smooth = run(loop, embeddings)
+        out, f_sim, f_smooth = run(fast, embeddings)
+        speedup = (l_sim + l_smooth) / max(f_sim + f_smooth, 1e-9)
+        equal = np.allclose(ref, out, atol=1e-5)
+        print(f"{n:>8} {l_sim:>10.4f} {l_smooth:>12.4f} {f_sim:>10.4f} {f_smooth:>10.4f} {speedup:>7.1f}x {str(equal):>6}")
+
+
+if __name__ == "__main__":
+    main()
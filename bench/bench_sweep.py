@@ -0,0 +1,87 @@
+"""
+So sánh hai cách dò tham số chunking trên một văn bản dài:
+- rerun: SemanticNewsChunker(...).chunk(text) cho từng cấu hình (embedding lại mỗi lần)
+- sweep: chunk_sweep.sweep, embedding + similarity một lần, các ngưỡng chia cho nhiều process
+
+Embedding dùng embeddings.HashingBackend, --embed-latency thêm thời gian giả lập mỗi câu
+để gần với model thật. rerun chỉ chạy --rerun-configs cấu hình đầu rồi ngoại suy cho cả lưới,
+và kiểm tra các cấu hình đó cho cùng chunk với sweep.
+
+Chạy: python bench/bench_sweep.py --sentences 10000 --workers 4
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embeddings import HashingBackend
+from run_bench import synthetic_document
+
+
+class SlowEmbeddingModel(HashingBackend):
+    """HashingBackend cộng thêm thời gian giả lập mỗi câu"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+
+    def encode(self, sentences, convert_to_numpy=True, **kwargs):
+        if self.latency:
+            time.sleep(self.latency * len(sentences))
+        return super().encode(sentences, convert_to_numpy=convert_to_numpy, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sentences", type=int, default=10000)
+    parser.add_argument("--thresholds", default="0.2,0.3,0.4,0.5,0.6,0.7,0.8,0.9")
+    parser.add_argument("--min-sizes", default="50,100,150,200,300,400,500")
+    parser.add_argument("--max-sizes", default="200,300,400,500,700,1000")
+    parser.add_argument("--workers", type=int, default=0, help="Số process của sweep (0: theo số CPU)")
+    parser.add_argument("--embed-latency", type=float, default=0.0005, help="Thời gian embedding giả lập mỗi câu (giây)")
+    parser.add_argument("--rerun-configs", type=int, default=3, help="Số cấu hình chạy lại bằng chunk() để so sánh")
+    args = parser.parse_args()
+
+    from chunk_sweep import format_table, sweep
+    from semantic_chungking import SemanticNewsChunker
+
+    thresholds = [float(v) for v in args.thresholds.split(",")]
+    min_sizes = [int(v) for v in args.min_sizes.split(",")]
+    max_sizes = [int(v) for v in args.max_sizes.split(",")]
+    grid = list(itertools.product(thresholds, min_sizes, max_sizes))
+    text = synthetic_document(args.sentences, seed=args.sentences)
+    model = SlowEmbeddingModel(args.embed_latency)
+
+    chunker = SemanticNewsChunker()
+    chunker.model = model
+    start = time.perf_counter()
+    results = sweep(chunker, text, thresholds, min_sizes, max_sizes, workers=args.workers or None, return_ranges=True)
+    swept = time.perf_counter() - start
+
+    rerun_grid = grid[:args.rerun_configs]
+    start = time.perf_counter()
+    mismatches = 0
+    for (threshold, min_size, max_size), result in zip(rerun_grid, results):
+        chunker = SemanticNewsChunker(similarity_threshold=threshold, min_chunk_size=min_size, max_chunk_size=max_size)
+        chunker.model = model
+        ranges = [(chunk['start_sentence'], chunk['end_sentence']) for chunk in chunker.chunk(text)]
+        mismatches += ranges != result['ranges']
+    per_config = (time.perf_counter() - start) / max(1, len(rerun_grid))
+
+    for result in results:
+        del result['ranges']
+    print(format_table(sorted(results, key=lambda r: r['tokens'])[:10]))
+    print(f"\n{args.sentences} câu, {len(grid)} cấu hình")
+    print(f"rerun: {per_config:.2f}s mỗi cấu hình, ước tính {per_config * len(grid):.1f}s cho cả lưới")
+    print(f"sweep: {swept:.2f}s cho cả lưới (nhanh hơn {per_config * len(grid) / swept:.0f}x)")
+    print(f"Khác biệt so với chunk() trên {len(rerun_grid)} cấu hình: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
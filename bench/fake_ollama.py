@@ -0,0 +1,118 @@
+"""
+Ollama server giả lập cho benchmark/kiểm thử offline
+POST /api/chat trả về NDJSON streaming giống Ollama. Server có num_parallel slot xử lý,
+request vượt quá num_parallel + max_queue nhận 503 "server busy" như OLLAMA_MAX_QUEUE
+
+Chạy riêng: python bench/fake_ollama.py --port 11435
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(num_parallel, max_queue, prefill, n_tokens, token_latency):
+    slots = threading.Semaphore(num_parallel)
+    state = {"waiting": 0, "requests": 0, "rejected": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path != "/api/chat":
+                self._send_json(404, {"error": "not found"})
+                return
+
+            with lock:
+                state["requests"] += 1
+                if state["waiting"] >= num_parallel + max_queue:
+                    state["rejected"] += 1
+                    busy = True
+                else:
+                    state["waiting"] += 1
+                    busy = False
+            if busy:
+                self._send_json(503, {"error": "server busy, please try again.  maximum pending requests exceeded"})
+                return
+
+            try:
+                with slots:
+                    self._stream(request)
+            finally:
+                with lock:
+                    state["waiting"] -= 1
+
+        def _stream(self, request):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def write(payload):
+                line = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+
+            start = time.perf_counter()
+            time.sleep(prefill)
+            prompt_chars = sum(len(m.get("content", "")) for m in request.get("messages", []))
+            for i in range(n_tokens):
+                time.sleep(token_latency)
+                write({
+                    "model": request.get("model"),
+                    "message": {"role": "assistant", "content": f"tok{i} "},
+                    "done": False
+                })
+            write({
+                "model": request.get("model"),
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "done_reason": "stop",
+                "total_duration": int((time.perf_counter() - start) * 1e9),
+                "prompt_eval_count": prompt_chars // 4,
+                "prompt_eval_duration": int(prefill * 1e9),
+                "eval_count": n_tokens,
+                "eval_duration": int(n_tokens * token_latency * 1e9)
+            })
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler, state
+
+
+def start_fake_ollama(port=0, num_parallel=4, max_queue=8, prefill=0.05, n_tokens=20, token_latency=0.005):
+    """Chạy server trong thread nền. Trả về (server, url, state)"""
+    handler, state = make_handler(num_parallel, max_queue, prefill, n_tokens, token_latency)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--num-parallel", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=8)
+    args = parser.parse_args()
+    server, url, _ = start_fake_ollama(args.port, args.num_parallel, args.max_queue)
+    print(f"Fake Ollama đang chạy tại {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,212 @@
+"""
+Benchmark pipeline chunk -> NER -> tóm tắt chạy offline với backend giả lập (bench/stubs.py)
+trên các file trong raw_text/ và văn bản tổng hợp có kích thước tăng dần.
+Chạy cùng đường xử lý với main.process_text: chunk(), chỉ mục entity + prompt bố cục prefix,
+scheduler.summary_pipeline (NER -> dựng prompt -> LLM) với Backpressure. Embedding là
+embeddings.HashingBackend (backend hashing thật), không có token bucket giới hạn tốc độ.
+Ghi throughput, peak RSS, thời gian từng giai đoạn và thống kê pipeline ra JSON.
+
+Chạy:
+    python bench/run_bench.py --output bench_results.json
+    python bench/run_bench.py --output new.json --baseline bench_results.json --threshold 0.2
+(chế độ baseline trả về exit code 1 nếu có giai đoạn chậm hơn baseline quá threshold)
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+LABELS = ["tên sự kiện", "tên người", "tên tổ chức", "mốc thời gian", "vị trí", "tiền tệ", "phần trăm"]
+
+_TOPICS = [
+    "kinh tế tăng trưởng xuất khẩu doanh nghiệp thị trường vốn đầu tư ngân hàng lãi suất",
+    "thời tiết mưa lớn bão lũ miền Trung nhiệt độ không khí lạnh cảnh báo sạt lở",
+    "giáo dục học sinh kỳ thi tuyển sinh đại học giáo viên chương trình sách giáo khoa",
+    "y tế bệnh viện bác sĩ bệnh nhân tiêm chủng dịch bệnh Bộ Y tế khám chữa bệnh",
+    "thể thao bóng đá đội tuyển Việt Nam trận đấu huấn luyện viên giải vô địch",
+    "giao thông đường cao tốc dự án Hà Nội Thành phố Hồ Chí Minh tai nạn ùn tắc",
+]
+
+
+def synthetic_document(n_sentences: int, seed: int = 0) -> str:
+    """Văn bản tin tức tổng hợp: các đoạn chủ đề dài ngẫu nhiên, có câu chuyển đoạn"""
+    rng = random.Random(seed)
+    sentences = []
+    while len(sentences) < n_sentences:
+        words = _TOPICS[rng.randrange(len(_TOPICS))].split()
+        for i in range(rng.randint(4, 20)):
+            body = " ".join(rng.choice(words) for _ in range(rng.randint(8, 25)))
+            prefix = "Tiếp theo, " if i == 0 and rng.random() < 0.3 else ""
+            sentences.append(prefix + body[0].upper() + body[1:] + ".")
+    return " ".join(sentences[:n_sentences])
+
+
+def run_case(name: str, text: str, workers: int, ttft: float, token_latency: float,
+             ner_workers: int = 1, ner_chunks_per_batch: int = 4, queue_size: int = 8) -> dict:
+    """Chạy một văn bản trong process riêng để đo peak RSS chính xác"""
+    from stubs import install_stubs
+    install_stubs(ttft=ttft, token_latency=token_latency)
+
+    from agent import Agent
+    from embeddings import HashingBackend
+    from entity_index import EntityIndex
+    from executor import Backpressure
+    from ner import get_entity_names_batch
+    from prompt import prefix_system_prompt
+    from scheduler import summary_pipeline
+    from semantic_chungking import SemanticNewsChunker
+    from tracing import tracer
+    from utils import load_prompt
+
+    os.chdir(ROOT)
+    system_prompt = prefix_system_prompt(load_prompt())
+    tracer.enable()
+    tracer.reset()
+    start = time.perf_counter()
+
+    chunker = SemanticNewsChunker(similarity_threshold=0.5, min_chunk_size=200, max_chunk_size=500)
+    chunker.model = HashingBackend()
+    chunks = chunker.chunk(text)
+    previous_text = ""
+    for chunk in chunks:
+        chunk["previous_text"] = previous_text
+        previous_text = chunk["text"]
+
+    entity_index = EntityIndex(prefix_layout=True)
+    pipeline = summary_pipeline(
+        lambda: Agent(system=system_prompt, max_length=30, echo=False, prompt_builder=entity_index.build_prompt),
+        LABELS,
+        get_entity_names_batch,
+        ner_workers=ner_workers,
+        ner_batch_size=ner_chunks_per_batch,
+        llm_workers=workers,
+        queue_size=queue_size,
+        entity_index=entity_index,
+        backpressure=Backpressure(max_in_flight=workers)
+    )
+    for _ in pipeline.run(chunks):
+        pass
+    elapsed = time.perf_counter() - start
+
+    n_sentences = len(chunker.split_sentences(text))
+    # ru_maxrss: KB trên Linux, byte trên macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024
+    return {
+        "name": name,
+        "chars": len(text),
+        "sentences": n_sentences,
+        "chunks": len(chunks),
+        "seconds": elapsed,
+        "sentences_per_second": n_sentences / elapsed,
+        "chunks_per_second": len(chunks) / elapsed,
+        "peak_rss_mb": peak_rss / (1 << 20),
+        "stages": {stage: stats["seconds"] for stage, stats in tracer.summary().items()},
+        "pipeline": pipeline.summary(),
+        "bottleneck": pipeline.bottleneck()
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_seconds: float) -> list:
+    """Các chỉ số chậm hơn baseline quá threshold (bỏ qua giai đoạn quá ngắn để tránh nhiễu)"""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        pairs = [("total", old["seconds"], result["seconds"])]
+        pairs += [
+            (stage, old["stages"][stage], seconds)
+            for stage, seconds in result["stages"].items() if stage in old["stages"]
+        ]
+        for metric, old_value, new_value in pairs:
+            if old_value >= min_seconds and new_value > old_value * (1 + threshold):
+                regressions.append((name, metric, old_value, new_value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--raw-dir", default=os.path.join(ROOT, "raw_text"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000],
+                        help="Số câu của các văn bản tổng hợp")
+    parser.add_argument("--workers", type=int, default=4, help="Số request LLM đồng thời (SUMMARY_CONCURRENCY)")
+    parser.add_argument("--ner-workers", type=int, default=1)
+    parser.add_argument("--ner-chunks-per-batch", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--ttft", type=float, default=0.0, help="Độ trễ giả lập trước token đầu tiên (giây)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Độ trễ giả lập mỗi token (giây)")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="File kết quả cũ để so sánh")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Tỉ lệ chậm hơn cho phép (0.2 = 20%%)")
+    parser.add_argument("--min-seconds", type=float, default=0.1,
+                        help="Bỏ qua các chỉ số ngắn hơn mức này khi so sánh")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    cases = []
+    for path in sorted(glob.glob(os.path.join(args.raw_dir, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            cases.append((os.path.basename(path), f.read()))
+    for size in args.sizes:
+        cases.append((f"synthetic_{size}", synthetic_document(size, seed=size)))
+
+    results = {}
+    print(f"{'case':<32} {'sent':>7} {'chunks':>7} {'time (s)':>9} {'sent/s':>9} {'RSS (MB)':>9} {'nút thắt':>9}")
+    for name, text in cases:
+        # Lấy lần chạy nhanh nhất trong --repeat lần để giảm nhiễu
+        runs = []
+        for _ in range(args.repeat):
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                runs.append(pool.submit(
+                    run_case, name, text, args.workers, args.ttft, args.token_latency,
+                    args.ner_workers, args.ner_chunks_per_batch, args.queue_size
+                ).result())
+        result = min(runs, key=lambda run: run["seconds"])
+        results[name] = result
+        print(f"{name:<32} {result['sentences']:>7} {result['chunks']:>7} {result['seconds']:>9.3f}"
+              f" {result['sentences_per_second']:>9.0f} {result['peak_rss_mb']:>9.1f} {result['bottleneck']:>9}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "workers": args.workers,
+                "ner_workers": args.ner_workers,
+                "ner_chunks_per_batch": args.ner_chunks_per_batch,
+                "queue_size": args.queue_size,
+                "ttft": args.ttft,
+                "token_latency": args.token_latency,
+                "repeat": args.repeat,
+                "created": time.time()
+            },
+            "results": results
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Kết quả đã được lưu vào {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        for name, metric, old_value, new_value in regressions:
+            print(f"CHẬM HƠN: {name} / {metric}: {old_value:.3f}s -> {new_value:.3f}s (+{new_value / old_value - 1:.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"Không có giai đoạn nào chậm hơn baseline quá {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Backend giả lập có kết quả xác định (deterministic) để benchmark chạy offline: NER (GLiNER)
+và client Ollama. Embedding dùng backend hashing thật (embeddings.HashingBackend)
+"""
+
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+
+import agent
+import model_registry
+from ner import GLINER_MODEL
+
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class StubNER:
+    """Coi mỗi cụm từ viết hoa liên tiếp là một entity, nhãn chọn theo hash"""
+
+    def __init__(self, latency: float = 0.0):
+        # Thời gian giả lập cho mỗi câu (giây)
+        self.latency = latency
+
+    def predict_entities(self, text, labels, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        entities = []
+        span = []
+        for word in text.split() + [""]:
+            if word[:1].isupper():
+                span.append(word.strip(",;:!?\"'()"))
+                continue
+            if span:
+                name = " ".join(span)
+                entities.append({"text": name, "label": labels[_hash(name) % len(labels)], "score": 1.0})
+                span = []
+        return entities
+
+    def inference(self, texts, labels, batch_size=8, **kwargs):
+        return [self.predict_entities(text, labels) for text in texts]
+
+
+class PrefixCache:
+    """
+    KV cache giả lập của server (như các slot của Ollama): mỗi slot giữ prompt của request gần nhất,
+    request mới dùng slot có phần đầu chung dài nhất (hòa thì slot lâu chưa dùng nhất)
+    và chỉ phải prefill phần còn lại
+    """
+
+    def __init__(self, slots: int = 1):
+        self.slots = [[] for _ in range(slots)]
+        self.last_used = [0] * slots
+        self.clock = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, words) -> int:
+        """Số từ đầu của prompt đã có trong cache, rồi ghi prompt vào slot được chọn"""
+        with self.lock:
+            best, best_key = 0, None
+            for i, cached in enumerate(self.slots):
+                n = 0
+                for a, b in zip(cached, words):
+                    if a != b:
+                        break
+                    n += 1
+                key = (n, -self.last_used[i])
+                if best_key is None or key > best_key:
+                    best, best_key = i, key
+            self.clock += 1
+            self.slots[best] = list(words)
+            self.last_used[best] = self.clock
+            return best_key[0]
+
+
+def make_stub_chat(ttft: float = 0.0, token_latency: float = 0.0, max_tokens: int = 64, prompt_latency: float = 0.0,
+                   prefix_cache: PrefixCache = None):
+    """
+    ollama.chat giả lập: trả lại các từ đầu của đoạn văn trong prompt
+    prompt_latency: thời gian prefill giả lập cho mỗi từ của prompt (giây)
+    prefix_cache: Bỏ qua thời gian prefill của phần đầu prompt đã có trong cache
+    """
+
+    def stub_chat(model, messages, options=None, stream=False, **kwargs):
+        words = messages[-1]["content"].split()[:max_tokens]
+        # Prompt sau khi áp chat template: mỗi message bắt đầu bằng tag của role
+        prompt = [word for m in messages for word in [f"<{m['role']}>"] + m["content"].split()]
+        cached = prefix_cache.lookup(prompt) if prefix_cache is not None else 0
+        prompt_eval_count = len(prompt) - cached
+        prefill = ttft + prompt_latency * prompt_eval_count
+        if prefill:
+            time.sleep(prefill)
+        for word in words:
+            if token_latency:
+                time.sleep(token_latency)
+            yield {"message": {"content": word + " "}, "done": False}
+        yield {
+            "message": {"content": ""},
+            "done": True,
+            "prompt_eval_count": prompt_eval_count,
+            "eval_count": len(words)
+        }
+
+    return stub_chat
+
+
+def install_stubs(ttft: float = 0.0, token_latency: float = 0.0, ner_latency: float = 0.0, prompt_latency: float = 0.0,
+                  prefix_cache: PrefixCache = None):
+    """Thay GLiNER trong model_registry và client Ollama của agent (shared_client) bằng bản giả lập"""
+    model_registry.override(GLINER_MODEL, StubNER(ner_latency))
+    stub_chat = make_stub_chat(ttft, token_latency, prompt_latency=prompt_latency, prefix_cache=prefix_cache)
+    agent.shared_client = lambda host=None: SimpleNamespace(chat=stub_chat)
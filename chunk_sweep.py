@@ -0,0 +1,291 @@
+"""
+Dò tham số chunking (similarity_threshold, min_chunk_size, max_chunk_size) trên một văn bản.
+Embedding, similarity đã làm mượt, từ khóa chuyển đoạn và kích thước từng câu chỉ tính một lần,
+sau đó mỗi cấu hình chỉ còn tìm ranh giới (semantic_chungking.topic_boundaries) và gộp/tách
+các khoảng câu. Các ngưỡng similarity được chia cho nhiều process.
+
+Mỗi cấu hình cho số chunk, phân bố kích thước chunk và ước lượng số token LLM cần để tóm tắt.
+
+Chạy: python chunk_sweep.py --input raw_text/news.txt --thresholds 0.3,0.4,0.5,0.6 \
+    --min-sizes 100,200,300 --max-sizes 400,500,700 --embedding-backend hashing
+"""
+
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from semantic_chungking import EMBED_BLOCK_SENTENCES, SemanticNewsChunker, topic_boundaries
+from sentence_store import SentenceStore
+from tokenizer import TokenCounter, load_token_counter
+
+# Token cố định của mỗi request tóm tắt (system prompt, entity, hướng dẫn), giống PROMPT_OVERHEAD_TOKENS trong main.py
+PROMPT_OVERHEAD_TOKENS = 400
+
+
+def prepare_sweep(
+    chunker: SemanticNewsChunker,
+    text: str,
+    token_counter: Optional[TokenCounter] = None
+) -> dict:
+    """
+    Phần dùng chung cho mọi cấu hình: embedding + similarity đã làm mượt, câu có từ khóa chuyển đoạn,
+    tổng tích luỹ kích thước (theo đơn vị của chunker) và số token của các câu
+
+    token_counter: Đếm token để ước lượng chi phí LLM khi chunker đếm theo từ.
+        None: dùng token_counter của chunker, không có thì ước lượng bằng số từ
+    """
+    store = SentenceStore(text)
+    embeddings = chunker.embed_store(store)
+    smoothed = chunker.smooth_similarities(chunker.calculate_similarities(embeddings))
+    word_counts = store.word_counts()
+    sizes = chunker.store_sizes(store, word_counts)
+
+    if chunker.token_counter is not None or token_counter is None:
+        tokens = sizes
+    else:
+        tokens = np.empty(len(store), dtype=np.int64)
+        for start in range(0, len(store), EMBED_BLOCK_SENTENCES):
+            block = store.sentences(start, start + EMBED_BLOCK_SENTENCES)
+            tokens[start:start + len(block)] = token_counter.count_batch(block)
+
+    prefix = lambda values: np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+    return {
+        "sentences": len(store),
+        "smoothed": np.asarray(smoothed, dtype=np.float64),
+        "has_keyword": chunker.transition_mask(store),
+        "size_prefix": prefix(sizes),
+        "token_prefix": prefix(tokens),
+        "context_limit": chunker.context_limit,
+        "size_unit": "token" if chunker.token_counter is not None else "từ",
+        "token_unit": "token" if chunker.token_counter is not None or token_counter is not None else "từ"
+    }
+
+
+def merge_small(starts: List[int], ends: List[int], size_prefix: np.ndarray, min_size: int) -> Tuple[list, list]:
+    """Như SemanticNewsChunker.merge_small_ranges, trên hai danh sách start/end"""
+    sizes = (size_prefix[ends] - size_prefix[starts]).tolist()
+    merged_starts, merged_ends = [], []
+    i = 0
+    while i < len(starts):
+        merged_starts.append(starts[i])
+        if sizes[i] < min_size and i < len(starts) - 1:
+            merged_ends.append(ends[i + 1])
+            i += 2
+        else:
+            merged_ends.append(ends[i])
+            i += 1
+    return merged_starts, merged_ends
+
+
+def split_large(starts: List[int], ends: List[int], size_prefix: np.ndarray, max_size: int) -> Tuple[list, list]:
+    """
+    Như SemanticNewsChunker.split_large_ranges: điểm tách của mỗi sub-chunk là câu đầu tiên làm
+    kích thước vượt max_size, tìm bằng searchsorted trên size_prefix thay cho cộng dồn từng câu
+    """
+    sizes = (size_prefix[ends] - size_prefix[starts]).tolist()
+    split_starts, split_ends = [], []
+    for start, end, size in zip(starts, ends, sizes):
+        if size <= max_size:
+            split_starts.append(start)
+            split_ends.append(end)
+            continue
+        sub_start = start
+        while True:
+            # Mỗi sub-chunk có ít nhất một câu
+            i = max(int(np.searchsorted(size_prefix, size_prefix[sub_start] + max_size, side='right')) - 1, sub_start + 1)
+            if i >= end:
+                break
+            split_starts.append(sub_start)
+            split_ends.append(i)
+            sub_start = i
+        split_starts.append(sub_start)
+        split_ends.append(end)
+    return split_starts, split_ends
+
+
+def pack(starts: List[int], ends: List[int], size_prefix: np.ndarray, context_limit: int) -> Tuple[list, list]:
+    """Như SemanticNewsChunker.pack_chunks: gộp tham lam các chunk liền nhau cho tới context_limit"""
+    sizes = (size_prefix[ends] - size_prefix[starts]).tolist()
+    packed_starts, packed_ends = [], []
+    group_size = 0
+    for start, end, size in zip(starts, ends, sizes):
+        if not packed_starts or group_size + size > context_limit:
+            packed_starts.append(start)
+            packed_ends.append(end)
+            group_size = size
+        else:
+            packed_ends[-1] = end
+            group_size += size
+    return packed_starts, packed_ends
+
+
+def evaluate(
+    data: dict,
+    threshold: float,
+    size_grid: Sequence[Tuple[int, int]],
+    summary_ratio: float,
+    overhead_tokens: int,
+    return_ranges: bool = False
+) -> List[dict]:
+    """Các cấu hình có cùng similarity_threshold: ranh giới chủ đề chỉ tìm một lần"""
+    boundaries = topic_boundaries(data["smoothed"] < threshold, data["has_keyword"])
+    initial_starts, initial_ends = boundaries, boundaries[1:] + [data["sentences"]]
+    results = []
+    for min_size, max_size in size_grid:
+        if data["context_limit"] is not None:
+            max_size = min(max_size, data["context_limit"])
+        starts, ends = merge_small(initial_starts, initial_ends, data["size_prefix"], min_size)
+        starts, ends = split_large(starts, ends, data["size_prefix"], max_size)
+        if data["context_limit"] is not None:
+            starts, ends = pack(starts, ends, data["size_prefix"], data["context_limit"])
+        sizes = data["size_prefix"][ends] - data["size_prefix"][starts]
+        tokens = data["token_prefix"][ends] - data["token_prefix"][starts]
+        input_tokens = int(tokens.sum()) + overhead_tokens * len(tokens)
+        output_tokens = int(np.ceil(tokens * summary_ratio).sum())
+        result = {
+            "similarity_threshold": threshold,
+            "min_chunk_size": min_size,
+            "max_chunk_size": max_size,
+            "chunks": len(sizes),
+            "size_min": int(sizes.min()),
+            "size_mean": float(sizes.mean()),
+            "size_median": float(np.median(sizes)),
+            "size_p90": float(np.percentile(sizes, 90)),
+            "size_max": int(sizes.max()),
+            "size_std": float(sizes.std()),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "tokens": input_tokens + output_tokens
+        }
+        if return_ranges:
+            result["ranges"] = list(zip(starts, ends))
+        results.append(result)
+    return results
+
+
+_worker_data = None
+
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+
+def _evaluate_in_worker(threshold, size_grid, summary_ratio, overhead_tokens, return_ranges):
+    return evaluate(_worker_data, threshold, size_grid, summary_ratio, overhead_tokens, return_ranges)
+
+
+def sweep(
+    chunker: SemanticNewsChunker,
+    text: str,
+    thresholds: Sequence[float],
+    min_chunk_sizes: Sequence[int],
+    max_chunk_sizes: Sequence[int],
+    summary_ratio: float = 0.3,
+    overhead_tokens: int = PROMPT_OVERHEAD_TOKENS,
+    token_counter: Optional[TokenCounter] = None,
+    workers: Optional[int] = None,
+    return_ranges: bool = False
+) -> List[dict]:
+    """
+    Đánh giá mọi cấu hình trong lưới thresholds x min_chunk_sizes x max_chunk_sizes,
+    kết quả theo đúng thứ tự của lưới. Mỗi cấu hình cho cùng các chunk như
+    SemanticNewsChunker(similarity_threshold, min_chunk_size, max_chunk_size).chunk(text)
+
+    Args:
+        chunker: Chunker đã cấu hình model embedding, window_size, token_counter, context_limit
+        summary_ratio: Độ dài tóm tắt so với chunk, để ước lượng số token sinh ra
+        overhead_tokens: Token cố định của mỗi request
+        token_counter: Đếm token cho ước lượng chi phí (xem prepare_sweep)
+        workers: Số process, mỗi process nhận một phần các ngưỡng (mặc định theo số CPU)
+        return_ranges: Thêm 'ranges' (danh sách [start_sentence, end_sentence)) vào kết quả
+    """
+    data = prepare_sweep(chunker, text, token_counter)
+    size_grid = list(itertools.product(min_chunk_sizes, max_chunk_sizes))
+    thresholds = list(thresholds)
+    workers = min(len(thresholds), workers or os.cpu_count() or 1)
+    args = (size_grid, summary_ratio, overhead_tokens, return_ranges)
+    if workers <= 1:
+        groups = [evaluate(data, threshold, *args) for threshold in thresholds]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as pool:
+            futures = [pool.submit(_evaluate_in_worker, threshold, *args) for threshold in thresholds]
+            groups = [future.result() for future in futures]
+    results = [result for group in groups for result in group]
+    for result in results:
+        result["size_unit"] = data["size_unit"]
+        result["token_unit"] = data["token_unit"]
+    return results
+
+
+def format_table(results: List[dict]) -> str:
+    """Bảng kết quả sweep, mỗi cấu hình một dòng"""
+    if not results:
+        return ""
+    lines = [
+        f"{'threshold':>9} {'min':>5} {'max':>5} {'chunks':>7} {'min':>6} {'mean':>7} {'median':>7}"
+        f" {'p90':>7} {'max':>6} {'token vào':>10} {'token ra':>9} {'tổng token':>11}"
+    ]
+    for r in results:
+        lines.append(
+            f"{r['similarity_threshold']:>9.2f} {r['min_chunk_size']:>5} {r['max_chunk_size']:>5} {r['chunks']:>7}"
+            f" {r['size_min']:>6} {r['size_mean']:>7.1f} {r['size_median']:>7.1f} {r['size_p90']:>7.1f}"
+            f" {r['size_max']:>6} {r['input_tokens']:>10} {r['output_tokens']:>9} {r['tokens']:>11}"
+        )
+    lines.append(f"Kích thước chunk tính theo {results[0]['size_unit']}, chi phí LLM tính theo {results[0]['token_unit']}")
+    return "\n".join(lines)
+
+
+def _floats(value: str) -> List[float]:
+    return [float(v) for v in value.split(",") if v.strip()]
+
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    from embeddings import BACKENDS
+
+    parser = argparse.ArgumentParser(description="Dò tham số chunking với một lần embedding")
+    parser.add_argument("--input", required=True, help="File .txt cần chunk")
+    parser.add_argument("--thresholds", type=_floats, default=_floats("0.3,0.4,0.5,0.6,0.7"))
+    parser.add_argument("--min-sizes", type=_ints, default=_ints("100,200,300"))
+    parser.add_argument("--max-sizes", type=_ints, default=_ints("400,500,700,1000"))
+    parser.add_argument("--summarize-size", type=float, default=30, help="Độ dài tóm tắt (%% so với chunk)")
+    parser.add_argument("--overhead-tokens", type=int, default=PROMPT_OVERHEAD_TOKENS)
+    parser.add_argument("--model", default="keepitreal/vietnamese-sbert")
+    parser.add_argument("--embedding-backend", default="sentence-transformers", choices=BACKENDS)
+    parser.add_argument("--tokenizer", default="",
+                        help="tokenizer.json hoặc tên tokenizer trên HuggingFace Hub để ước lượng chi phí theo token")
+    parser.add_argument("--workers", type=int, default=0, help="Số process (0: theo số CPU)")
+    parser.add_argument("--sort", default="", choices=["", "chunks", "tokens", "size_std"],
+                        help="Sắp xếp kết quả theo cột này (mặc định theo thứ tự lưới)")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        text = f.read()
+    chunker = SemanticNewsChunker(model_name=args.model, embedding_backend=args.embedding_backend)
+    token_counter = load_token_counter(args.tokenizer) if args.tokenizer else None
+
+    start = time.perf_counter()
+    results = sweep(
+        chunker, text, args.thresholds, args.min_sizes, args.max_sizes,
+        summary_ratio=args.summarize_size / 100,
+        overhead_tokens=args.overhead_tokens,
+        token_counter=token_counter,
+        workers=args.workers or None
+    )
+    if args.sort:
+        results.sort(key=lambda r: r[args.sort])
+    print(format_table(results))
+    print(f"{len(results)} cấu hình trong {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Phát hiện chunk gần trùng lặp (bản tin nhắc lại, tiêu đề đọc lại, ...) bằng centroid embedding
+của chunk (SemanticNewsChunker.chunk_centroids), xác nhận lại bằng độ trùng văn bản (Jaccard trên
+cặp từ liền nhau) để hai đoạn khác nhau cùng chủ đề không bị coi là trùng. Chunk trùng dùng lại
+entity và tóm tắt của lần xuất hiện đầu tiên thay vì chạy lại NER và LLM.
+"""
+
+import re
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+# Cosine similarity tối thiểu giữa hai centroid để coi là trùng
+DEFAULT_THRESHOLD = 0.95
+# Tỉ lệ số từ tối thiểu giữa chunk ngắn và chunk dài (tránh coi một đoạn ngắn là bản sao của đoạn dài chứa nó)
+DEFAULT_MIN_SIZE_RATIO = 0.8
+# Jaccard tối thiểu giữa tập cặp từ liền nhau của hai chunk (centroid gần nhau nhưng văn bản khác thì không dùng lại)
+DEFAULT_MIN_TEXT_OVERLAP = 0.6
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text: str) -> FrozenSet[Tuple[str, ...]]:
+    """Tập cặp từ liền nhau (chữ thường) của văn bản, văn bản một từ thì là tập từ"""
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < 2:
+        return frozenset((word,) for word in words)
+    return frozenset(zip(words, words[1:]))
+
+
+def jaccard(a: FrozenSet, b: FrozenSet) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class CentroidIndex:
+    """
+    Chỉ mục centroid của các chunk gốc (không trùng), tìm bằng một phép nhân ma trận.
+    Nếu có văn bản chunk, ứng viên còn phải có Jaccard cặp từ >= min_text_overlap
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        min_size_ratio: float = DEFAULT_MIN_SIZE_RATIO,
+        min_text_overlap: float = DEFAULT_MIN_TEXT_OVERLAP
+    ):
+        self.threshold = threshold
+        self.min_size_ratio = min_size_ratio
+        self.min_text_overlap = min_text_overlap
+        self._vectors: Optional[np.ndarray] = None
+        self._sizes = np.zeros(0, dtype=np.float64)
+        self._ids: List[int] = []
+        self._shingles: List[Optional[FrozenSet]] = []
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _append(self, vector: np.ndarray, size: int, chunk_id: int, text_shingles: Optional[FrozenSet]):
+        if self._vectors is None:
+            self._vectors = np.zeros((16, len(vector)), dtype=np.float32)
+            self._sizes = np.zeros(16, dtype=np.float64)
+        elif self._count == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+            self._sizes = np.concatenate([self._sizes, np.zeros_like(self._sizes)])
+        self._vectors[self._count] = vector
+        self._sizes[self._count] = size
+        self._ids.append(chunk_id)
+        self._shingles.append(text_shingles)
+        self._count += 1
+
+    def find(self, vector: np.ndarray, size: int, text: Optional[str] = None) -> Optional[Tuple[int, float, float]]:
+        """(chunk_id gốc, cosine, Jaccard văn bản) của chunk gốc sớm nhất khớp, None nếu không có"""
+        if not self._count:
+            return None
+        sims = self._vectors[:self._count] @ vector
+        sizes = self._sizes[:self._count]
+        ratio = np.minimum(sizes, size) / np.maximum(np.maximum(sizes, size), 1)
+        text_shingles = shingles(text) if text is not None else None
+        for i in np.flatnonzero((sims >= self.threshold) & (ratio >= self.min_size_ratio)):
+            overlap = 1.0
+            if text_shingles is not None and self._shingles[i] is not None:
+                overlap = jaccard(text_shingles, self._shingles[i])
+            if overlap >= self.min_text_overlap:
+                return self._ids[i], float(sims[i]), overlap
+        return None
+
+    def add(self, vector: np.ndarray, size: int, chunk_id: int,
+            text: Optional[str] = None) -> Optional[Tuple[int, float, float]]:
+        """
+        Trả về (chunk_id gốc, cosine, Jaccard) nếu chunk này trùng (chunk gốc xuất hiện sớm nhất),
+        nếu không thì thêm chunk vào chỉ mục và trả về None
+        """
+        match = self.find(vector, size, text)
+        if match is not None:
+            return match
+        self._append(vector, size, chunk_id, shingles(text) if text is not None else None)
+        return None
+
+
+def mark_duplicates(
+    chunks: List[dict],
+    centroids: np.ndarray,
+    threshold: float = DEFAULT_THRESHOLD,
+    min_size_ratio: float = DEFAULT_MIN_SIZE_RATIO,
+    min_text_overlap: float = DEFAULT_MIN_TEXT_OVERLAP
+) -> Dict[int, int]:
+    """
+    Gán chunk['duplicate_of'] = chunk_id gốc cho các chunk gần trùng (centroid + văn bản),
+    mỗi lần dùng lại đều được in ra kèm cosine và Jaccard.
+    Trả về {chunk_id trùng: chunk_id gốc}
+    """
+    index = CentroidIndex(threshold, min_size_ratio, min_text_overlap)
+    duplicates = {}
+    for chunk, centroid in zip(chunks, centroids):
+        match = index.add(centroid, chunk['word_count'], chunk['chunk_id'], chunk['text'])
+        if match is None:
+            continue
+        original, similarity, overlap = match
+        chunk['duplicate_of'] = original
+        duplicates[chunk['chunk_id']] = original
+        print(f"Chunk {chunk['chunk_id']} trùng chunk {original} (cosine {similarity:.3f}, Jaccard {overlap:.2f}),"
+              f" dùng lại entity + tóm tắt")
+    return duplicates
+
+
+def copy_from_original(duplicate: dict, original: dict, ner_seconds: float = 0.0):
+    """
+    Chép entity + tóm tắt của chunk gốc sang chunk trùng.
+    seconds_saved: thời gian NER (ước lượng theo trung bình) + LLM của chunk gốc
+    """
+    duplicate['list_entity'] = original['list_entity']
+    duplicate['summarize'] = original['summarize']
+    duplicate['seconds_saved'] = round(ner_seconds + original.get('llm_seconds', 0.0), 3)
+    return duplicate
+
+
+def dedup_stats(chunks: List[dict]) -> dict:
+    duplicates = [chunk for chunk in chunks if 'duplicate_of' in chunk]
+    return {
+        'duplicates': len(duplicates),
+        'chunk_ids': [chunk['chunk_id'] for chunk in duplicates],
+        'seconds_saved': sum(chunk.get('seconds_saved', 0.0) for chunk in duplicates)
+    }
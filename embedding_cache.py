@@ -0,0 +1,181 @@
+"""
+Cache embedding câu lưu trên đĩa, key theo (model_name, hash câu đã chuẩn hoá)
+Vector được lưu trong một file memmap (float16/float32), index lưu trong index.json
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, List
+
+import numpy as np
+
+
+def normalize_sentence(sentence: str) -> str:
+    """Chuẩn hoá unicode và khoảng trắng để câu giống nhau có cùng key"""
+    sentence = unicodedata.normalize('NFC', sentence)
+    return re.sub(r'\s+', ' ', sentence).strip()
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        cache_dir: str,
+        model_name: str,
+        max_entries: int = 200000,
+        dtype: str = "float16",
+        initial_capacity: int = 1024
+    ):
+        """
+        Args:
+            cache_dir: Thư mục lưu cache
+            model_name: Tên model, là một phần của key
+            max_entries: Số vector tối đa, vượt quá sẽ xoá theo LRU
+            dtype: Kiểu dữ liệu lưu trên đĩa (float16 hoặc float32)
+            initial_capacity: Số slot cấp phát ban đầu, file được nới rộng dần
+        """
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self.initial_capacity = initial_capacity
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._data_path = os.path.join(cache_dir, "vectors.bin")
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._index = OrderedDict()  # key -> slot, thứ tự theo lần dùng gần nhất
+        self._free_slots = []
+        self._dim = None
+        self._capacity = 0
+        self._vectors = None
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _key(self, sentence: str) -> str:
+        text = self.model_name + "\0" + normalize_sentence(sentence)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self._index_path) or not os.path.exists(self._data_path):
+            return
+        with open(self._index_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("dtype") != self.dtype.name:
+            # Cache được tạo với dtype khác, bỏ qua và tạo lại
+            return
+        self._dim = meta["dim"]
+        self._capacity = meta["capacity"]
+        self._index = OrderedDict(meta["entries"])
+        used = set(self._index.values())
+        self._free_slots = [i for i in range(self._capacity - 1, -1, -1) if i not in used]
+        self._vectors = np.memmap(
+            self._data_path, dtype=self.dtype, mode="r+", shape=(self._capacity, self._dim)
+        )
+
+    def _grow(self, needed: int):
+        """Nới rộng file memmap (tối đa max_entries slot)"""
+        new_capacity = max(self._capacity, self.initial_capacity)
+        while new_capacity < needed:
+            new_capacity *= 2
+        new_capacity = min(new_capacity, self.max_entries)
+        if new_capacity <= self._capacity:
+            return
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        with open(self._data_path, "ab") as f:
+            f.truncate(new_capacity * self._dim * self.dtype.itemsize)
+        self._free_slots = list(range(new_capacity - 1, self._capacity - 1, -1)) + self._free_slots
+        self._capacity = new_capacity
+        self._vectors = np.memmap(
+            self._data_path, dtype=self.dtype, mode="r+", shape=(self._capacity, self._dim)
+        )
+
+    def _allocate_slot(self) -> int:
+        if not self._free_slots:
+            self._grow(self._capacity + 1)
+        if not self._free_slots:
+            # Đã đạt max_entries: xoá entry ít được dùng nhất
+            _, slot = self._index.popitem(last=False)
+            self.evictions += 1
+            return slot
+        return self._free_slots.pop()
+
+    def encode(self, sentences: List[str], encode_fn: Callable) -> np.ndarray:
+        """
+        Lấy embedding cho danh sách câu, chỉ gọi encode_fn với các câu chưa có trong cache
+
+        Args:
+            sentences: Danh sách câu
+            encode_fn: Hàm nhận list câu, trả về np.ndarray (vd. model.encode)
+        """
+        keys = [self._key(s) for s in sentences]
+        result = [None] * len(sentences)
+        missing = OrderedDict()  # key -> vị trí các câu cần encode
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                slot = self._index.get(key)
+                if slot is not None:
+                    self._index.move_to_end(key)
+                    result[i] = np.array(self._vectors[slot], dtype=np.float32)
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+                    self.misses += 1
+
+        if missing:
+            miss_sentences = [sentences[positions[0]] for positions in missing.values()]
+            encoded = np.asarray(encode_fn(miss_sentences), dtype=np.float32)
+            with self._lock:
+                if self._dim is None:
+                    self._dim = encoded.shape[1]
+                for (key, positions), vector in zip(missing.items(), encoded):
+                    for i in positions:
+                        result[i] = vector
+                    if key in self._index:
+                        continue
+                    slot = self._allocate_slot()
+                    self._vectors[slot] = vector
+                    self._index[key] = slot
+
+        if not result:
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+        return np.stack(result)
+
+    def flush(self):
+        """Ghi vector và index xuống đĩa"""
+        with self._lock:
+            if self._vectors is None:
+                return
+            self._vectors.flush()
+            meta = {
+                "model_name": self.model_name,
+                "dtype": self.dtype.name,
+                "dim": self._dim,
+                "capacity": self._capacity,
+                "entries": list(self._index.items())
+            }
+            tmp_path = self._index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self._index_path)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0
+        }
@@ -0,0 +1,237 @@
+"""
+Các backend embedding câu cho SemanticNewsChunker. Mọi backend có cùng giao diện
+encode(sentences, convert_to_numpy=True, batch_size=...) -> np.ndarray như SentenceTransformer
+
+- sentence-transformers: model gốc (PyTorch)
+- onnx: cùng model, export sang ONNX và lượng tử hoá int8, chạy bằng onnxruntime trên CPU
+- hashing: bag-of-words + bigram bằng hashing trick, không cần model, cho các job rất lớn
+"""
+
+import hashlib
+import os
+import re
+import zlib
+from typing import Callable, List, Optional
+
+import numpy as np
+
+import model_registry
+
+DEFAULT_BACKEND = "sentence-transformers"
+BACKENDS = ("sentence-transformers", "onnx", "hashing")
+# Thư mục chứa model ONNX được export tự động
+ONNX_CACHE_DIR = os.environ.get("ONNX_CACHE_DIR", "./cache/onnx")
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+class HashingBackend:
+    """
+    Embedding xác định (deterministic) bằng hashing trick có dấu trên unigram + bigram,
+    trọng số tf dạng log (sublinear), chuẩn hoá L2. Nếu đã fit thì nhân thêm idf.
+    Câu không có từ nào (vd. "...", "***") được hash nguyên chuỗi nên vector luôn khác 0.
+    """
+
+    def __init__(self, dim: int = 384, bigrams: bool = True):
+        self.dim = dim
+        self.bigrams = bigrams
+        self.idf = None
+
+    def _features(self, sentence: str) -> List[str]:
+        words = _WORD_PATTERN.findall(sentence.lower())
+        if self.bigrams:
+            return words + [a + " " + b for a, b in zip(words, words[1:])]
+        return words
+
+    def _hash_rows(self, sentences: List[str]):
+        rows, cols = [], []
+        for i, sentence in enumerate(sentences):
+            for feature in self._features(sentence) or [sentence]:
+                rows.append(i)
+                cols.append(zlib.crc32(feature.encode("utf-8")))
+        rows = np.asarray(rows, dtype=np.int64)
+        hashes = np.asarray(cols, dtype=np.int64)
+        return rows, hashes % self.dim, np.where(hashes & (1 << 31), -1.0, 1.0).astype(np.float32)
+
+    def fit(self, sentences: List[str]) -> "HashingBackend":
+        """Tính idf theo bucket trên một tập câu (vd. toàn bộ văn bản hoặc mẫu của corpus)"""
+        rows, cols, _ = self._hash_rows(sentences)
+        df = np.zeros(self.dim, dtype=np.float64)
+        pairs = np.unique(rows * self.dim + cols)
+        np.add.at(df, pairs % self.dim, 1.0)
+        self.idf = (np.log((1 + len(sentences)) / (1 + df)) + 1).astype(np.float32)
+        return self
+
+    def encode(self, sentences, convert_to_numpy=True, batch_size=None, **kwargs) -> np.ndarray:
+        vectors = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        rows, cols, signs = self._hash_rows(sentences)
+        np.add.at(vectors, (rows, cols), signs)
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        if self.idf is not None:
+            vectors *= self.idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class SentenceTransformerBackend:
+    """SentenceTransformer với batch size và số thread PyTorch cố định"""
+
+    def __init__(self, model_name: str, batch_size: int = 32, threads: Optional[int] = None):
+        from sentence_transformers import SentenceTransformer
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name)
+        self.batch_size = batch_size
+
+    def encode(self, sentences, convert_to_numpy=True, batch_size=None, **kwargs) -> np.ndarray:
+        return self.model.encode(
+            sentences, convert_to_numpy=True, batch_size=batch_size or self.batch_size, **kwargs
+        )
+
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True, max_length: int = 256) -> str:
+    """
+    Export transformer của model sentence-transformers sang ONNX (+ lượng tử hoá động int8).
+    Trả về đường dẫn file .onnx dùng để chạy.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(output_dir)
+
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    sample = tokenizer(["xin chào"], return_tensors="pt", truncation=True, max_length=max_length)
+    dynamic = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "last_hidden_state": dynamic},
+            opset_version=14
+        )
+    if not quantize:
+        return fp32_path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    int8_path = os.path.join(output_dir, "model_int8.onnx")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+class OnnxBackend:
+    """
+    Model sentence-transformers chạy bằng onnxruntime (mặc định int8) trên CPU, mean pooling.
+    model_name là thư mục đã export (chứa tokenizer + model_int8.onnx/model.onnx) hoặc tên model
+    trên HuggingFace Hub (được export vào ONNX_CACHE_DIR ở lần dùng đầu tiên).
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = 32,
+        threads: Optional[int] = None,
+        quantize: bool = True,
+        max_length: int = 256
+    ):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_dir = model_name if os.path.isdir(model_name) else os.path.join(
+            ONNX_CACHE_DIR, hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:16]
+        )
+        model_path = self._find_model(model_dir, quantize)
+        if model_path is None:
+            model_path = export_onnx(model_name, model_dir, quantize=quantize, max_length=max_length)
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    @staticmethod
+    def _find_model(model_dir: str, quantize: bool) -> Optional[str]:
+        names = ["model_int8.onnx", "model.onnx"] if quantize else ["model.onnx"]
+        for name in names:
+            path = os.path.join(model_dir, name)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def encode(self, sentences, convert_to_numpy=True, batch_size=None, **kwargs) -> np.ndarray:
+        batch_size = batch_size or self.batch_size
+        # Sắp xếp theo độ dài để các câu trong một batch có độ dài gần nhau, ít padding
+        order = np.argsort([len(s) for s in sentences], kind="stable")
+        output = None
+        for start in range(0, len(sentences), batch_size):
+            index = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [sentences[i] for i in index], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="np"
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+            hidden = self.session.run(None, feeds)[0]
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if output is None:
+                output = np.empty((len(sentences), pooled.shape[1]), dtype=np.float32)
+            output[index] = pooled
+        if output is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return output
+
+
+def _backend_loader(backend: str, model_name: str, batch_size: int, threads: Optional[int]):
+    def _load():
+        if backend == "sentence-transformers":
+            return SentenceTransformerBackend(model_name, batch_size=batch_size, threads=threads)
+        if backend == "onnx":
+            return OnnxBackend(model_name, batch_size=batch_size, threads=threads)
+        if backend == "hashing":
+            return HashingBackend()
+        raise ValueError(f"Backend embedding không hỗ trợ: {backend} (chọn một trong {BACKENDS})")
+    return _load
+
+
+def registry_key(backend: str, model_name: str) -> str:
+    if backend == "hashing":
+        return "hashing"
+    return f"{backend}:{model_name}"
+
+
+def register_embedding_backend(
+    backend: str,
+    model_name: str,
+    batch_size: int = 32,
+    threads: Optional[int] = None
+) -> str:
+    """Đăng ký backend để warm-up trước, trả về tên trong model_registry"""
+    key = registry_key(backend, model_name)
+    model_registry.register(key, _backend_loader(backend, model_name, batch_size, threads))
+    return key
+
+
+def load_embedding_backend(backend: str, model_name: str, batch_size: int = 32, threads: Optional[int] = None,
+                           fallback: Optional[Callable] = None):
+    """
+    Backend dùng chung trong process, chỉ load một lần cho mỗi (backend, model_name).
+    fallback: tạo backend thay thế khi load lỗi (xem model_registry.get)
+    """
+    return model_registry.get(
+        registry_key(backend, model_name),
+        loader=_backend_loader(backend, model_name, batch_size, threads),
+        fallback=fallback
+    )
@@ -0,0 +1,136 @@
+"""
+Chỉ mục entity của cả văn bản: gộp các entity giống nhau giữa các chunk (không phân biệt hoa thường
+và dấu, qua utils.normalize_text), ghi lại chunk xuất hiện đầu tiên và số chunk nhắc tới.
+Prompt của mỗi chunk chỉ nhận một danh sách entity đã gộp và giới hạn số lượng, cùng một dòng
+ngữ cảnh tóm tắt các chunk trước bằng entity thay cho văn bản chunk trước.
+"""
+
+import bisect
+import heapq
+import threading
+from typing import Dict, Iterable, List
+
+from prompt import generate_compact_prompt, generate_prefix_prompt
+from utils import normalize_text
+
+# Số entity tối đa trong prompt của một chunk
+MAX_PROMPT_ENTITIES = 15
+# Số entity tối đa của ngữ cảnh từ các chunk trước
+CONTEXT_ENTITIES = 5
+
+_EDGE_PUNCTUATION = " \t\n,.;:!?\"'()[]"
+
+
+def entity_key(text: str) -> str:
+    """Key so khớp entity: chữ thường, bỏ dấu, gộp khoảng trắng, bỏ dấu câu hai đầu"""
+    return " ".join(normalize_text(text).split()).strip(_EDGE_PUNCTUATION)
+
+
+class EntityIndex:
+    def __init__(self, max_entities: int = MAX_PROMPT_ENTITIES, context_entities: int = CONTEXT_ENTITIES,
+                 prefix_layout: bool = False):
+        """
+        Args:
+            max_entities: Số entity tối đa đưa vào prompt của một chunk
+            context_entities: Số entity tối đa của ngữ cảnh từ các chunk trước (0: không dùng)
+            prefix_layout: Dựng prompt bằng generate_prefix_prompt (hướng dẫn cố định nằm trong
+                system prompt, dùng cùng prompt.prefix_system_prompt)
+        """
+        self.max_entities = max_entities
+        self.context_entities = context_entities
+        self.prefix_layout = prefix_layout
+        # key -> {'text', 'label' (theo lần xuất hiện đầu tiên), 'first_chunk', 'chunks' (chunk_id tăng dần)}
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, chunk_id: int, entities: Iterable[dict]):
+        """Thêm entity của một chunk (mỗi entity chỉ được tính một lần cho mỗi chunk)"""
+        with self._lock:
+            for entity in entities:
+                key = entity_key(entity["text"])
+                if not key:
+                    continue
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._entries[key] = {
+                        "text": entity["text"].strip(),
+                        "label": entity["label"],
+                        "first_chunk": chunk_id,
+                        "chunks": [chunk_id]
+                    }
+                    continue
+                i = bisect.bisect_left(entry["chunks"], chunk_id)
+                if i < len(entry["chunks"]) and entry["chunks"][i] == chunk_id:
+                    continue
+                entry["chunks"].insert(i, chunk_id)
+                if chunk_id < entry["first_chunk"]:
+                    entry["first_chunk"] = chunk_id
+                    entry["text"], entry["label"] = entity["text"].strip(), entity["label"]
+
+    def add_chunks(self, chunks: Iterable[dict]):
+        for chunk in chunks:
+            if chunk.get("list_entity"):
+                self.add(chunk["chunk_id"], chunk["list_entity"])
+
+    def entry(self, text: str) -> dict:
+        return self._entries.get(entity_key(text))
+
+    def prompt_entities(self, chunk: dict) -> List[dict]:
+        """
+        Entity của chunk đã gộp các cách viết khác nhau, ưu tiên entity được nhắc ở nhiều chunk.
+        Chỉ tính các chunk có chunk_id <= chunk hiện tại, nên prompt không phụ thuộc vào
+        việc các chunk sau đã chạy NER hay chưa.
+        """
+        chunk_id = chunk["chunk_id"]
+        ranked = {}
+        with self._lock:
+            for position, entity in enumerate(chunk.get("list_entity") or []):
+                key = entity_key(entity["text"])
+                if not key or key in ranked:
+                    continue
+                entry = self._entries.get(key)
+                if entry is None or entry["first_chunk"] > chunk_id:
+                    ranked[key] = ((-1, chunk_id, position), entity["text"].strip(), entity["label"])
+                    continue
+                frequency = bisect.bisect_right(entry["chunks"], chunk_id)
+                ranked[key] = ((-frequency, entry["first_chunk"], position), entry["text"], entry["label"])
+        best = sorted(ranked.values())[:self.max_entities]
+        return [{"text": text, "label": label} for _, text, label in best]
+
+    def context(self, chunk: dict) -> str:
+        """
+        Ngữ cảnh ngắn thay cho văn bản chunk trước: các entity được nhắc ở nhiều chunk trước nhất
+        (hoà thì chunk nhắc gần nhất) mà chunk hiện tại không nhắc lại, tối đa context_entities.
+        Như prompt_entities, chỉ tính các chunk có chunk_id < chunk hiện tại.
+        """
+        if not self.context_entities:
+            return ""
+        chunk_id = chunk["chunk_id"]
+        current = {entity_key(entity["text"]) for entity in chunk.get("list_entity") or []}
+        candidates = []
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry["first_chunk"] >= chunk_id or key in current:
+                    continue
+                frequency = bisect.bisect_left(entry["chunks"], chunk_id)
+                candidates.append(((-frequency, -entry["chunks"][frequency - 1], entry["first_chunk"]), entry["text"]))
+        best = heapq.nsmallest(self.context_entities, candidates)
+        if not best:
+            return ""
+        return "Các đoạn trước nhắc tới: " + "; ".join(text for _, text in best)
+
+    def build_prompt(self, chunk: dict, max_length) -> str:
+        """prompt_builder cho Agent"""
+        if self.prefix_layout:
+            return generate_prefix_prompt(chunk, max_length, self.prompt_entities(chunk), self.context(chunk))
+        return generate_compact_prompt(chunk, max_length, self.prompt_entities(chunk), self.context(chunk))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entities": len(self._entries),
+                "mentions": sum(len(entry["chunks"]) for entry in self._entries.values())
+            }
@@ -0,0 +1,248 @@
+"""
+Chạy trích xuất entity + tóm tắt song song cho nhiều chunk
+Giới hạn tốc độ gửi request tới Ollama bằng token bucket và số request đang chạy bằng Backpressure
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, List, Optional
+
+from tracing import tracer
+
+
+class TokenBucket:
+    """
+    Token bucket có tốc độ thích nghi (AIMD):
+    - Mỗi request thành công: tăng dần tốc độ cho tới max_rate
+    - Mỗi lần server báo quá tải: giảm một nửa tốc độ (không thấp hơn min_rate)
+    """
+
+    def __init__(
+        self,
+        rate: float = 2.0,
+        capacity: Optional[float] = None,
+        min_rate: float = 0.1,
+        max_rate: Optional[float] = None,
+        increase_step: float = 0.1
+    ):
+        """
+        Args:
+            rate: Số request/giây ban đầu
+            capacity: Số request tối đa được phép gửi dồn (burst)
+            min_rate: Tốc độ thấp nhất khi bị giảm
+            max_rate: Tốc độ cao nhất khi được tăng (mặc định bằng rate)
+            increase_step: Lượng tăng tốc độ sau mỗi request thành công
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.increase_step = increase_step
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Chờ tới khi đủ token. Trả về số giây đã phải chờ"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+
+
+class Backpressure:
+    """
+    Giới hạn số request LLM đang chạy trên server. Khi server trả về 429/503 (hàng đợi đầy)
+    giới hạn giảm một nửa, sau mỗi lượt thành công bằng giới hạn hiện tại thì tăng lại 1 cho tới max_in_flight.
+    Các request đã gửi trước lần giảm gần nhất bị từ chối thì không giảm thêm, nên một loạt
+    lỗi cùng lúc chỉ giảm giới hạn một lần.
+    """
+
+    def __init__(self, max_in_flight: int = 4, min_in_flight: int = 1):
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min_in_flight
+        self.limit = max_in_flight
+        self.in_flight = 0
+        self._epoch = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, cancel_event: Optional[threading.Event] = None) -> int:
+        """Chờ tới khi số request đang chạy nhỏ hơn giới hạn. Trả về epoch truyền cho on_saturated"""
+        with self._cond:
+            while self.in_flight >= self.limit:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise Cancelled()
+                self._cond.wait(timeout=0.5)
+            self.in_flight += 1
+            return self._epoch
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        with self._cond:
+            if self.limit < self.max_in_flight:
+                self.limit = min(self.max_in_flight, self.limit + 1 / int(self.limit))
+                self._cond.notify()
+
+    def on_saturated(self, epoch: int):
+        with self._cond:
+            if epoch == self._epoch:
+                self.limit = max(self.min_in_flight, int(self.limit) // 2)
+                self._epoch += 1
+
+
+class Cancelled(Exception):
+    """Người dùng đã dừng lượt xử lý, các request chưa chạy/đang chạy bị bỏ"""
+
+
+def is_throttle_error(error: Exception) -> bool:
+    """Ollama trả về 429/503 khi hàng đợi request của server đã đầy"""
+    return getattr(error, "status_code", None) in (429, 503)
+
+
+def summarize_chunk(
+    chunk: dict,
+    make_agent: Callable,
+    labels: Optional[List[str]] = None,
+    extract_entities: Optional[Callable] = None,
+    limiter: Optional[TokenBucket] = None,
+    max_retries: int = 3,
+    backoff: float = 1.0,
+    cancel_event: Optional[threading.Event] = None,
+    agent=None,
+    backpressure: Optional[Backpressure] = None
+) -> dict:
+    """
+    Trích xuất entity (nếu cần) và tóm tắt một chunk, thử lại khi server quá tải.
+    agent: Agent đã dựng sẵn prompt (Agent.prepare) cho lần thử đầu tiên, mặc định make_agent()
+    backpressure: Giới hạn số request đang chạy, dùng chung giữa các worker. Khi có, lỗi 429/503
+        (hàng đợi server đầy) chỉ giảm số request đang chạy, không giảm tốc độ của limiter
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        raise Cancelled()
+    if extract_entities is not None:
+        chunk["list_entity"] = extract_entities(chunk["text"], labels)
+
+    # Kết quả đã có trong cache thì không cần chờ rate limiter
+    agent = agent if agent is not None else make_agent()
+    cached_summary = getattr(agent, "cached_summary", None)
+    cached = cached_summary(chunk) if cached_summary is not None else None
+    if cached is not None:
+        chunk["summarize"] = cached
+        return chunk
+
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            wait_start = time.perf_counter()
+            limiter.acquire()
+            tracer.record("rate_limit_wait", wait_start, time.perf_counter())
+        if cancel_event is not None and cancel_event.is_set():
+            raise Cancelled()
+        # Agent lưu lịch sử messages nên mỗi lần thử lại cần một agent mới
+        if attempt:
+            agent = make_agent()
+        if backpressure is not None:
+            wait_start = time.perf_counter()
+            epoch = backpressure.acquire(cancel_event)
+            tracer.record("backpressure_wait", wait_start, time.perf_counter())
+        try:
+            call_start = time.perf_counter()
+            chunk["summarize"] = agent(chunk)
+            chunk["llm_seconds"] = round(time.perf_counter() - call_start, 3)
+            if getattr(agent, "last_ttft", None) is not None:
+                chunk["ttft_seconds"] = round(agent.last_ttft, 3)
+        except Exception as e:
+            if not is_throttle_error(e) or attempt == max_retries:
+                raise
+            if backpressure is not None:
+                backpressure.on_saturated(epoch)
+            elif limiter is not None:
+                limiter.on_throttle()
+            time.sleep(backoff * (2 ** attempt))
+            continue
+        finally:
+            if backpressure is not None:
+                backpressure.release()
+        if limiter is not None:
+            limiter.on_success()
+        if backpressure is not None:
+            backpressure.on_success()
+        return chunk
+
+
+def iter_summaries(
+    chunks: List[dict],
+    make_agent: Callable,
+    labels: Optional[List[str]] = None,
+    extract_entities: Optional[Callable] = None,
+    max_workers: int = 4,
+    limiter: Optional[TokenBucket] = None,
+    max_retries: int = 3,
+    backoff: float = 1.0,
+    cancel_event: Optional[threading.Event] = None,
+    executor: Optional[ThreadPoolExecutor] = None,
+    backpressure: Optional[Backpressure] = None
+) -> Iterator[dict]:
+    """
+    Xử lý các chunk song song, trả về từng chunk ngay khi hoàn thành (không theo thứ tự)
+
+    Args:
+        chunks: Danh sách chunk từ SemanticNewsChunker
+        make_agent: Hàm tạo Agent mới cho mỗi request
+        labels: Các loại entity cần trích xuất
+        extract_entities: Hàm trích xuất entity (vd. ner.get_entity_name).
+            Bỏ qua nếu chunk đã có sẵn 'list_entity'
+        max_workers: Số chunk được xử lý đồng thời
+        limiter: Token bucket giới hạn tốc độ gửi request
+        max_retries: Số lần thử lại khi server báo quá tải
+        backoff: Thời gian chờ cơ sở (giây) giữa các lần thử lại
+        cancel_event: Khi được set, các chunk chưa chạy bị bỏ và raise Cancelled
+        executor: Thread pool dùng chung (vd. giữa nhiều người dùng), khi đó max_workers bị bỏ qua
+        backpressure: Giới hạn số request đang chạy trên server, giảm khi server báo hàng đợi đầy
+    """
+    pool = executor if executor is not None else ThreadPoolExecutor(max_workers=max_workers)
+    futures = [
+        pool.submit(
+            summarize_chunk, chunk, make_agent, labels, extract_entities,
+            limiter, max_retries, backoff, cancel_event, backpressure=backpressure
+        )
+        for chunk in chunks
+    ]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        if executor is None:
+            pool.shutdown(wait=True)
+
+
+def summarize_chunks(chunks: List[dict], make_agent: Callable, **kwargs) -> List[dict]:
+    """Giống iter_summaries nhưng trả về toàn bộ kết quả theo thứ tự chunk_id"""
+    results = list(iter_summaries(chunks, make_agent, **kwargs))
+    return sorted(results, key=lambda chunk: chunk["chunk_id"])
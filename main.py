@@ -2,105 +2,493 @@ from ner import *
 from semantic_chungking import *
 from agent import Agent
 from utils import *
-import time
+from executor import Backpressure, Cancelled, TokenBucket
+from scheduler import summary_pipeline
+from map_reduce import summarize_document
+from dedup import copy_from_original, dedup_stats, mark_duplicates
+from prompt import generate_prefix_prompt, generate_prompt, generate_reduce_prompt, prefix_system_prompt
+from entity_index import EntityIndex
+from tokenizer import chunk_token_budget, load_token_counter
+from agent import DEFAULT_OPTIONS
+from embedding_cache import EmbeddingCache
+from result_writer import JsonlResultWriter, make_doc_id
+from summary_cache import SummaryCache
+import model_registry
+from tracing import tracer
 import gradio as gr
+import itertools
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Số chunk được xử lý đồng thời và số request/giây tối đa gửi tới Ollama
+MAX_CONCURRENCY = int(os.environ.get("SUMMARY_CONCURRENCY", 4))
+REQUESTS_PER_SECOND = float(os.environ.get("SUMMARY_RPS", 2))
+NER_BATCH_SIZE = int(os.environ.get("NER_BATCH_SIZE", 16))
+# Pipeline chunk -> NER -> prompt -> LLM: số thread NER, số chunk mỗi lần gọi NER, kích thước hàng đợi mỗi giai đoạn
+NER_WORKERS = int(os.environ.get("NER_WORKERS", 1))
+NER_CHUNKS_PER_BATCH = int(os.environ.get("NER_CHUNKS_PER_BATCH", 4))
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 8))
+# Cache kết quả tóm tắt theo prompt + model + sampling options
+summary_cache = SummaryCache(
+    os.environ.get("SUMMARY_CACHE_PATH", "./cache/summaries.sqlite"),
+    max_entries=int(os.environ.get("SUMMARY_CACHE_MAX_ENTRIES", 20000))
+)
+
+# Kết quả mỗi văn bản nằm trong thư mục riêng OUTPUT_DIR/<doc_id> (xem output_paths) để các lượt chạy
+# đồng thời không ghi vào file của nhau. result.jsonl được ghi dần, fsync sau mỗi RESULT_FSYNC_EVERY chunk
+OUTPUT_DIR = "./output"
+RESULT_FSYNC_EVERY = int(os.environ.get("RESULT_FSYNC_EVERY", 10))
+# Tokenizer của LLM (đường dẫn tokenizer.json hoặc tên trên HuggingFace Hub) để đo chunk theo token.
+# Để trống: đo theo số từ như cũ
+TOKENIZER_NAME = os.environ.get("TOKENIZER_NAME", "")
+# Context (num_ctx) của LLM. Khi có tokenizer, các chunk liền nhau được gộp cho vừa context này
+LLM_CONTEXT_TOKENS = int(os.environ.get("LLM_CONTEXT_TOKENS", 0))
+# Ước lượng số token của phần prompt cố định ngoài system prompt (khung prompt + danh sách entity)
+PROMPT_OVERHEAD_TOKENS = int(os.environ.get("PROMPT_OVERHEAD_TOKENS", 400))
+# Tóm tắt toàn văn bản (map-reduce): độ dài tối đa và số tóm tắt gộp trong một request
+DOCUMENT_SUMMARY_WORDS = int(os.environ.get("DOCUMENT_SUMMARY_WORDS", 300))
+REDUCE_GROUP_SIZE = int(os.environ.get("REDUCE_GROUP_SIZE", 4))
+# Prompt gọn: entity gộp trên cả văn bản (tối đa MAX_PROMPT_ENTITIES) + ngữ cảnh ngắn từ các chunk trước (CONTEXT_ENTITIES entity)
+COMPACT_PROMPT = os.environ.get("COMPACT_PROMPT", "1") == "1"
+MAX_PROMPT_ENTITIES = int(os.environ.get("MAX_PROMPT_ENTITIES", 15))
+CONTEXT_ENTITIES = int(os.environ.get("CONTEXT_ENTITIES", 5))
+# Bố cục prompt dùng lại được prefix cache: hướng dẫn cố định nằm cuối system prompt, prompt của chunk
+# chỉ gồm phần thay đổi (PREFIX_PROMPT=0: bố cục cũ)
+PREFIX_PROMPT = os.environ.get("PREFIX_PROMPT", "1") == "1"
+# Thời gian Ollama giữ model và KV cache sau request cuối, vd. "30m" ("-1m": giữ mãi). Để trống: mặc định của server
+LLM_KEEP_ALIVE = os.environ.get("LLM_KEEP_ALIVE", "") or None
+# Ngưỡng cosine giữa centroid hai chunk để coi là trùng lặp (0: tắt) và Jaccard tối thiểu giữa văn bản hai chunk
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", 0.95))
+DEDUP_MIN_TEXT_OVERLAP = float(os.environ.get("DEDUP_MIN_TEXT_OVERLAP", 0.6))
+# Số ký tự tối đa hiển thị trong ô văn bản khi upload file
+MAX_PREVIEW_CHARS = 100000
+
+# Backend embedding: sentence-transformers (mặc định), onnx (int8, CPU) hoặc hashing (không cần model)
+EMBEDDING_MODEL = "keepitreal/vietnamese-sbert"
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "sentence-transformers")
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 32))
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", 0)) or None
+register_sentence_model(EMBEDDING_MODEL, EMBEDDING_BACKEND, batch_size=EMBEDDING_BATCH_SIZE, threads=EMBEDDING_THREADS)
+# Cache embedding dùng chung giữa các lần nhấn "Xử lý", mỗi backend một thư mục riêng
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", "./cache/embeddings")
+if EMBEDDING_BACKEND != "sentence-transformers":
+    EMBEDDING_CACHE_DIR = os.path.join(EMBEDDING_CACHE_DIR, EMBEDDING_BACKEND)
+if EMBEDDING_BACKEND == "hashing":
+    # Vector của câu không có từ nào đã đổi (khác 0), không dùng lại cache cũ
+    EMBEDDING_CACHE_DIR += "-v2"
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR, model_name=EMBEDDING_MODEL)
+
+# Dùng chung giữa các người dùng: giới hạn tốc độ và số request LLM đồng thời của cả server.
+# llm_backpressure giảm số request đang chạy xuống dưới MAX_CONCURRENCY khi Ollama báo hàng đợi đầy (429/503)
+llm_limiter = TokenBucket(rate=REQUESTS_PER_SECOND)
+llm_backpressure = Backpressure(max_in_flight=MAX_CONCURRENCY)
+llm_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="llm")
+# Số lượt "Xử lý" chạy cùng lúc (các lượt sau chờ trong hàng đợi của Gradio) và kích thước hàng đợi
+UI_CONCURRENCY = int(os.environ.get("UI_CONCURRENCY", 2))
+UI_QUEUE_SIZE = int(os.environ.get("UI_QUEUE_SIZE", 32))
+# Khoảng thời gian tối thiểu (giây) giữa hai lần cập nhật giao diện khi đang tóm tắt
+UI_UPDATE_INTERVAL = float(os.environ.get("UI_UPDATE_INTERVAL", 0.5))
+
+# Event dừng của từng lượt chạy: run_id -> (session của trình duyệt, event). Một session có thể có
+# nhiều lượt (đang chạy + đang xếp hàng), nút Dừng dừng tất cả các lượt của session
+_cancel_events = {}
+_cancel_events_lock = threading.Lock()
+_run_ids = itertools.count(1)
+# Lock theo doc_id: hai lượt chạy cùng văn bản + tham số lần lượt dùng thư mục kết quả.
+# doc_id -> [lock, số lượt đang giữ hoặc chờ lock], bị xóa khi không còn lượt nào
+_doc_locks = {}
+_doc_locks_guard = threading.Lock()
+# Tracer dùng chung cả process: khi bật TRACE các lượt chạy lần lượt từng lượt
+_trace_lock = threading.Lock()
+
+
+def output_paths(doc_id):
+    """Các file kết quả của một văn bản (jsonl ghi dần, json, tóm tắt toàn văn bản, trace)"""
+    directory = os.path.join(OUTPUT_DIR, doc_id[:16])
+    return {
+        "jsonl": os.path.join(directory, "result.jsonl"),
+        "json": os.path.join(directory, "result.json"),
+        "document": os.path.join(directory, "document_summary.json"),
+        "trace": os.path.join(directory, "trace.json")
+    }
+
+
+def acquire_doc_lock(doc_id, cancel_event):
+    """Giữ lock của doc_id, trả về hàm nhả lock"""
+    with _doc_locks_guard:
+        entry = _doc_locks.setdefault(doc_id, [threading.Lock(), 0])
+        entry[1] += 1
+
+    def release(acquired=True):
+        with _doc_locks_guard:
+            if acquired:
+                entry[0].release()
+            entry[1] -= 1
+            if not entry[1]:
+                del _doc_locks[doc_id]
+
+    try:
+        acquire_or_cancel(entry[0], cancel_event)
+    except BaseException:
+        release(acquired=False)
+        raise
+    return release
+
+
+def acquire_or_cancel(lock, cancel_event):
+    """Chờ lock, thôi chờ khi người dùng nhấn Dừng"""
+    while not lock.acquire(timeout=0.5):
+        if cancel_event.is_set():
+            raise Cancelled()
+
+RESULTS_HTML_HEADER = "<div style='max-height: 600px; overflow-y: auto;'>"
+RESULTS_HTML_FOOTER = "</div>"
+
+
+def render_chunk_html(chunk):
+    """HTML của một chunk. Chunk chưa tóm tắt xong được hiển thị mờ"""
+    list_entity_name = chunk.get("list_entity") or []
+    result = chunk.get("summarize")
+    summary = f"{result[:300]}..." if result is not None else "<em>Đang tóm tắt...</em>"
+    opacity = "1" if result is not None else "0.5"
+    return f"""
+            <div style='border: 1px solid #ddd; padding: 15px; margin: 10px 0; border-radius: 5px; opacity: {opacity};'>
+                <h3 style='color: #2563eb;'>Chunk {chunk['chunk_id']}</h3>
+                <p><strong>Số từ:</strong> {chunk['word_count']} | <strong>Số câu:</strong> {chunk['sentence_count']}</p>
+                <p><strong>Văn bản:</strong> {chunk['text'][:200]}...</p>
+                <p><strong>Entities:</strong> {', '.join([f"{e['text']} ({e['label']})" for e in list_entity_name[:5]])}</p>
+                <p><strong>Tóm tắt:</strong> {summary}</p>
+            </div>
+            """
+
+
+def render_document_html(document):
+    return f"""
+            <div style='border: 2px solid #2563eb; padding: 15px; margin: 10px 0; border-radius: 5px;'>
+                <h3 style='color: #2563eb;'>Tóm tắt toàn văn bản</h3>
+                <p><strong>Entities:</strong> {', '.join([f"{e['text']} ({e['label']})" for e in document['list_entity'][:10]])}</p>
+                <p>{document['summarize']}</p>
+            </div>
+            """
+
+
+def render_results_html(chunk_parts, document_part=""):
+    """Ghép HTML từ các phần đã render sẵn (mỗi chunk chỉ render lại khi nó thay đổi)"""
+    return "".join([RESULTS_HTML_HEADER, document_part, *chunk_parts, RESULTS_HTML_FOOTER])
+
 
 def process_text(
     text_input,
+    file_input,
     summarize_size_input,
     list_entity_input,
     similarity_threshold,
     min_chunk_size,
     max_chunk_size,
+    bypass_summary_cache=False,
+    document_summary=False,
+    cancel_event=None,
+    run_info=None,
     progress=gr.Progress()
 ):
     """
     Xử lý văn bản: chunking, entity extraction, và summarization
+
+    Generator: yield (tóm tắt trạng thái, danh sách chunk đã xong, HTML) mỗi khi có chunk tóm tắt xong.
+    cancel_event: threading.Event, khi được set thì dừng các request LLM chưa xong
+    run_info: dict nhận doc_id và các đường dẫn kết quả (output_paths) của lượt chạy
     """
-    if not text_input or not text_input.strip():
-        return "Vui lòng nhập hoặc upload văn bản!", None, ""
+    file_path = getattr(file_input, "name", file_input)
+    if not file_path and (not text_input or not text_input.strip()):
+        yield "Vui lòng nhập hoặc upload văn bản!", None, ""
+        return
     
     list_ner = list_entity_input.split(",")
     summarize_size_input = int(summarize_size_input)
+    cancel_event = cancel_event or threading.Event()
+    run_start = time.perf_counter()
+    chunks = None
+    chunk_parts = []
+    paths = None
+    # Hàm nhả các lock đang giữ, gọi theo thứ tự ngược lại trong finally
+    lock_releases = []
+    finished = False
     try:
+        if tracer.enabled:
+            acquire_or_cancel(_trace_lock, cancel_event)
+            lock_releases.append(_trace_lock.release)
+        tracer.reset()
+        system_prompt = load_prompt()
+        # System prompt của các request tóm tắt chunk (prompt gộp map-reduce vẫn dùng system_prompt)
+        chunk_system_prompt = prefix_system_prompt(system_prompt) if PREFIX_PROMPT else system_prompt
+        options = dict(DEFAULT_OPTIONS)
+        token_counter = load_token_counter(TOKENIZER_NAME) if TOKENIZER_NAME else None
+        context_limit = None
+        if token_counter is not None and LLM_CONTEXT_TOKENS:
+            options["num_ctx"] = LLM_CONTEXT_TOKENS
+            context_limit = chunk_token_budget(
+                LLM_CONTEXT_TOKENS,
+                summarize_size_input / 100,
+                token_counter.count(chunk_system_prompt) + PROMPT_OVERHEAD_TOKENS
+            )
+        
         # Khởi tạo chunker
         progress(0.1, desc="Đang khởi tạo chunker...")
         chunker = SemanticNewsChunker(
+            model_name=EMBEDDING_MODEL,
+            embedding_backend=EMBEDDING_BACKEND,
+            embedding_batch_size=EMBEDDING_BATCH_SIZE,
             similarity_threshold=similarity_threshold,
             min_chunk_size=min_chunk_size,
-            max_chunk_size=max_chunk_size
+            max_chunk_size=max_chunk_size,
+            embedding_cache=embedding_cache,
+            token_counter=token_counter,
+            context_limit=context_limit
         )
         
         # Thực hiện chunking
         progress(0.2, desc="Đang thực hiện chunking...")
-        chunks = chunker.chunk(text_input, verbose=False)
+        if file_path:
+            # File upload được đọc và chunk theo luồng, không load toàn bộ vào bộ nhớ
+            chunks = list(chunker.chunk_stream(file_path))
+        else:
+            chunks = chunker.chunk(text_input, verbose=False)
         
         if not chunks:
-            return "Không thể tạo chunks từ văn bản. Vui lòng thử lại với văn bản dài hơn.", None, ""
+            yield "Không thể tạo chunks từ văn bản. Vui lòng thử lại với văn bản dài hơn.", None, ""
+            return
         
-        system_prompt = load_prompt()
         previous_text = ""
         
-        # Xử lý từng chunk
-        total_chunks = len(chunks)
-        results_html = "<div style='max-height: 600px; overflow-y: auto;'>"
+        # Xử lý previous_text
+        for chunk in chunks:
+            chunk['previous_text'] = previous_text
+            previous_text = chunk['text']
+        
+        # Chunk gần trùng (bản tin nhắc lại, ...) dùng lại entity + tóm tắt của lần xuất hiện đầu tiên
+        duplicates_of = {}
+        if DEDUP_THRESHOLD:
+            duplicates = mark_duplicates(
+                chunks, chunker.chunk_centroids(chunks),
+                threshold=DEDUP_THRESHOLD, min_text_overlap=DEDUP_MIN_TEXT_OVERLAP
+            )
+            for duplicate_id, original_id in duplicates.items():
+                duplicates_of.setdefault(original_id, []).append(chunks[duplicate_id - 1])
         
-        for i_chunk, chunk in enumerate(chunks):
-            progress_value = 0.2 + (i_chunk / total_chunks) * 0.7
-            progress(progress_value, desc=f"Đang xử lý chunk {i_chunk + 1}/{total_chunks}...")
+        # Ghi kết quả từng chunk ngay khi hoàn thành. Nếu văn bản này đã được xử lý dở
+        # (cùng nội dung và tham số) thì bỏ qua các chunk đã có trong file
+        doc_params = [similarity_threshold, min_chunk_size, max_chunk_size, list_ner, summarize_size_input]
+        if token_counter is not None:
+            doc_params += [TOKENIZER_NAME, context_limit]
+        if EMBEDDING_BACKEND != "sentence-transformers":
+            doc_params.append(EMBEDDING_BACKEND)
+        if COMPACT_PROMPT:
+            doc_params += ["compact_prompt", MAX_PROMPT_ENTITIES, CONTEXT_ENTITIES]
+        if PREFIX_PROMPT:
+            doc_params.append("prefix_prompt")
+        doc_id = make_doc_id(file_path or text_input, *doc_params)
+        paths = output_paths(doc_id)
+        if run_info is not None:
+            run_info.update(paths, doc_id=doc_id)
+        lock_releases.append(acquire_doc_lock(doc_id, cancel_event))
+        with JsonlResultWriter(paths["jsonl"], doc_id, fsync_every=RESULT_FSYNC_EVERY) as writer:
+            pending_chunks = []
+            for chunk in chunks:
+                done = writer.resumed.get(chunk['chunk_id'])
+                if done is not None:
+                    chunk.update(done)
+                elif 'duplicate_of' not in chunk:
+                    pending_chunks.append(chunk)
             
-            agent = Agent(system=system_prompt,
-                          max_length=summarize_size_input,                    
-                          )
+            # Entity của các chunk đã xong ở lần chạy trước cũng được đưa vào chỉ mục
+            entity_index = None
+            if COMPACT_PROMPT:
+                entity_index = EntityIndex(
+                    max_entities=MAX_PROMPT_ENTITIES, context_entities=CONTEXT_ENTITIES, prefix_layout=PREFIX_PROMPT
+                )
+                entity_index.add_chunks(chunk for chunk in chunks if 'duplicate_of' not in chunk)
             
-            # Xử lý previous_text
-            chunk['previous_text'] = previous_text
-            previous_text = chunk['text']
+            # NER, dựng prompt và tóm tắt chạy thành pipeline: NER của các chunk sau
+            # chạy trong khi LLM đang tóm tắt các chunk trước
+            if entity_index is not None:
+                prompt_builder = entity_index.build_prompt
+            else:
+                prompt_builder = generate_prefix_prompt if PREFIX_PROMPT else generate_prompt
+            make_agent = lambda: Agent(
+                system=chunk_system_prompt,
+                max_length=summarize_size_input,
+                options=options,
+                cache=summary_cache,
+                bypass_cache=bypass_summary_cache,
+                echo=False,
+                prompt_builder=prompt_builder,
+                cancel_event=cancel_event,
+                keep_alive=LLM_KEEP_ALIVE
+            )
+            pipeline = summary_pipeline(
+                make_agent,
+                list_ner,
+                lambda texts, labels: get_entity_names_batch(texts, labels, batch_size=NER_BATCH_SIZE),
+                ner_workers=NER_WORKERS,
+                ner_batch_size=NER_CHUNKS_PER_BATCH,
+                llm_workers=MAX_CONCURRENCY,
+                limiter=llm_limiter,
+                queue_size=PIPELINE_QUEUE_SIZE,
+                cancel_event=cancel_event,
+                executor=llm_pool,
+                entity_index=entity_index,
+                backpressure=llm_backpressure
+            )
             
-            # Thực hiện trích xuất entity
-            list_entity_name = get_entity_name(chunk['text'], list_ner)
-            chunk["list_entity"] = list_entity_name
+            def ner_seconds():
+                """Thời gian NER trung bình mỗi chunk cho tới lúc này"""
+                ner_stats = pipeline.stats["ner"]
+                return ner_stats.busy_seconds / max(1, ner_stats.items)
             
-            # Thực hiện tóm tắt
-            result = agent(chunk)
-            chunk["summarize"] = result
+            def resolve_duplicates(original):
+                """Ghi các chunk trùng của chunk gốc vừa xong, trả về danh sách chunk đã ghi"""
+                resolved = []
+                for duplicate in duplicates_of.get(original['chunk_id'], []):
+                    if "summarize" not in duplicate:
+                        writer.write(copy_from_original(duplicate, original, ner_seconds()))
+                        resolved.append(duplicate)
+                return resolved
             
-            # Tạo HTML cho kết quả
-            results_html += f"""
-            <div style='border: 1px solid #ddd; padding: 15px; margin: 10px 0; border-radius: 5px;'>
-                <h3 style='color: #2563eb;'>Chunk {chunk['chunk_id']}</h3>
-                <p><strong>Số từ:</strong> {chunk['word_count']} | <strong>Số câu:</strong> {chunk['sentence_count']}</p>
-                <p><strong>Văn bản:</strong> {chunk['text'][:200]}...</p>
-                <p><strong>Entities:</strong> {', '.join([f"{e['text']} ({e['label']})" for e in list_entity_name[:5]])}</p>
-                <p><strong>Tóm tắt:</strong> {result[:300]}...</p>
-            </div>
-            """
+            # Chunk gốc đã có kết quả từ lần chạy trước
+            for chunk in chunks:
+                if "summarize" in chunk and 'duplicate_of' not in chunk:
+                    resolve_duplicates(chunk)
             
-            # Delay để tránh rate limiting
-            if i_chunk % 10 == 0:
-                time.sleep(10)
-            else:
-                time.sleep(1)
+            # Hiển thị ngay danh sách chunk, các chunk chưa tóm tắt được cập nhật dần
+            total_chunks = len(chunks)
+            n_resumed = sum(1 for chunk in chunks if chunk['chunk_id'] in writer.resumed)
+            chunk_parts = [render_chunk_html(chunk) for chunk in chunks]
+            yield (
+                f"Đã chia {total_chunks} chunks ({n_resumed} chunk lấy lại từ lần chạy trước), đang tóm tắt...",
+                [chunk for chunk in chunks if "summarize" in chunk],
+                render_results_html(chunk_parts)
+            )
+            
+            progress(0.3, desc="Đang trích xuất entity và tóm tắt...")
+            summary_stats_before = summary_cache.stats()
+            n_done = sum(1 for chunk in chunks if "summarize" in chunk)
+            last_update = time.perf_counter()
+            for chunk in pipeline.run(pending_chunks):
+                writer.write(chunk)
+                for done_chunk in [chunk] + resolve_duplicates(chunk):
+                    n_done += 1
+                    chunk_parts[done_chunk['chunk_id'] - 1] = render_chunk_html(done_chunk)
+                progress(0.3 + (n_done / total_chunks) * 0.6, desc=f"Đã xử lý {n_done}/{total_chunks} chunk...")
+                now = time.perf_counter()
+                if now - last_update >= UI_UPDATE_INTERVAL or n_done == total_chunks:
+                    last_update = now
+                    yield (
+                        f"Đã tóm tắt {n_done}/{total_chunks} chunks...",
+                        [c for c in chunks if "summarize" in c],
+                        render_results_html(chunk_parts)
+                    )
+            
+            # Lưu kết quả vào file
+            output_path = paths["json"]
+            writer.export_json(output_path)
         
-        results_html += "</div>"
+        # Gộp tóm tắt các chunk thành tóm tắt toàn văn bản, các nhóm cùng tầng chạy song song
+        document = None
+        document_part = ""
+        if document_summary:
+            progress(0.95, desc="Đang tóm tắt toàn văn bản...")
+            make_reduce_agent = lambda: Agent(
+                system=system_prompt,
+                max_length=DOCUMENT_SUMMARY_WORDS,
+                options=options,
+                cache=summary_cache,
+                bypass_cache=bypass_summary_cache,
+                echo=False,
+                prompt_builder=generate_reduce_prompt,
+                cancel_event=cancel_event,
+                keep_alive=LLM_KEEP_ALIVE
+            )
+            document = summarize_document(
+                chunks,
+                make_reduce_agent,
+                target_words=DOCUMENT_SUMMARY_WORDS,
+                group_size=REDUCE_GROUP_SIZE,
+                limiter=llm_limiter,
+                cancel_event=cancel_event,
+                executor=llm_pool,
+                backpressure=llm_backpressure
+            )
+            with open(paths["document"], "w", encoding="utf-8") as f:
+                json.dump(dict(document, doc_id=doc_id), f, ensure_ascii=False, indent=2)
+            document_part = render_document_html(document)
         
-        # Lưu kết quả vào file
-        output_path = "./output/result.json"
-        os.makedirs("./output", exist_ok=True)
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(chunks, f, ensure_ascii=False, indent=2)
+        results_html = render_results_html(chunk_parts, document_part)
         
         progress(1.0, desc="Hoàn thành!")
         
-        summary_text = f"Đã xử lý thành công {total_chunks} chunks.\nKết quả đã được lưu vào {output_path}"
+        cache_stats = embedding_cache.stats()
+        summary_stats = summary_cache.stats()
+        summary_hits = summary_stats['hits'] - summary_stats_before['hits']
+        tokens_saved = summary_stats['tokens_saved'] - summary_stats_before['tokens_saved']
+        seconds_saved = summary_stats['seconds_saved'] - summary_stats_before['seconds_saved']
+        tracer.record("process_text", run_start, time.perf_counter(), count=total_chunks)
+        if tracer.enabled:
+            tracer.write_trace(
+                paths["trace"], metadata={"chunks": total_chunks, "doc_id": doc_id, "models": model_registry.metrics()}
+            )
+            print(tracer.format_table())
+        
+        summary_text = (
+            f"Đã xử lý thành công {total_chunks} chunks ({n_resumed} chunk lấy lại từ lần chạy trước).\nKết quả đã được lưu vào {output_path}"
+            f"\nEmbedding cache hit rate: {cache_stats['hit_rate']:.1%} ({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']})"
+            f"\nSummary cache: {summary_hits} chunk không cần gọi LLM, tiết kiệm {tokens_saved} token, {seconds_saved:.1f}s"
+        )
+        dedup = dedup_stats(chunks)
+        if dedup['duplicates']:
+            summary_text += (
+                f"\nChunk trùng lặp: {dedup['duplicates']} chunk {dedup['chunk_ids'][:20]} dùng lại kết quả,"
+                f" tiết kiệm khoảng {dedup['seconds_saved']:.1f}s"
+            )
+        ttfts = [chunk['ttft_seconds'] for chunk in pending_chunks if 'ttft_seconds' in chunk]
+        if ttfts:
+            summary_text += (
+                f"\nTime-to-first-token ({'bố cục prefix' if PREFIX_PROMPT else 'bố cục cũ'}):"
+                f" trung bình {sum(ttfts) / len(ttfts):.2f}s, lớn nhất {max(ttfts):.2f}s qua {len(ttfts)} request"
+            )
+        if pending_chunks:
+            summary_text += f"\nPipeline (nút thắt: {pipeline.bottleneck()}):\n{pipeline.format_table()}"
+        if document is not None:
+            summary_text += (
+                f"\nTóm tắt toàn văn bản: {' -> '.join(map(str, document['levels']))} nút qua các tầng,"
+                f" {document['llm_calls']} request gộp trong {document['seconds']:.1f}s, lưu tại {paths['document']}"
+            )
+        models = model_registry.format_metrics()
+        if models:
+            summary_text += f"\nModel:\n{models}"
+        if tracer.enabled:
+            summary_text += f"\nTrace đã được lưu vào {paths['trace']}\n{tracer.format_table()}"
         
-        return summary_text, chunks, results_html
+        finished = True
+        yield summary_text, chunks, results_html
         
+    except Cancelled:
+        # Các chunk đã xong vẫn nằm trong result.jsonl, chạy lại sẽ tiếp tục từ đó
+        done = [chunk for chunk in chunks or [] if "summarize" in chunk]
+        kept = f", {len(done)} chunk đã tóm tắt được giữ lại trong {paths['jsonl']}" if paths is not None else ""
+        yield f"Đã dừng{kept}.", done, render_results_html(chunk_parts)
     except Exception as e:
         error_msg = f"Lỗi: {str(e)}"
-        return error_msg, None, ""
+        yield error_msg, None, ""
+    finally:
+        # Generator bị đóng giữa chừng (người dùng dừng, ngắt kết nối) hoặc gặp lỗi: bỏ các request còn lại.
+        # Lượt chạy xong bình thường không set, để process_and_display phân biệt với lượt bị dừng
+        if not finished:
+            cancel_event.set()
+        for release in reversed(lock_releases):
+            release()
 
 # list_ner = list_entity_input.split(",")
 # Tạo Gradio Interface
@@ -128,7 +516,7 @@ with gr.Blocks(title="Text Summarization & Entity Extraction", theme=gr.themes.S
             )
             
             file_input = gr.File(
-                label="Hoặc upload file text",
+                label="Hoặc upload file text (nếu có file, file sẽ được xử lý thay cho ô văn bản)",
                 file_types=[".txt"]
             )
 
@@ -173,7 +561,19 @@ tên sự kiện, tên người, tên tổ chức, mốc thời gian, vị trí,
                 step=50
             )
             
-            process_btn = gr.Button("🚀 Xử lý", variant="primary", size="lg")
+            bypass_summary_cache = gr.Checkbox(
+                label="Bỏ qua cache tóm tắt (luôn gọi LLM)",
+                value=False
+            )
+            
+            document_summary = gr.Checkbox(
+                label="Tóm tắt toàn văn bản (gộp tóm tắt các chunk theo tầng)",
+                value=False
+            )
+            
+            with gr.Row():
+                process_btn = gr.Button("🚀 Xử lý", variant="primary", size="lg")
+                cancel_btn = gr.Button("⏹ Dừng", variant="stop", size="lg")
         
         with gr.Column(scale=1):
             gr.Markdown("### 📊 Kết quả")
@@ -201,38 +601,54 @@ tên sự kiện, tên người, tên tổ chức, mốc thời gian, vị trí,
         if file is None:
             return ""
         try:
-            with open(file.name, "r", encoding="utf-8") as f:
-                return f.read()
+            # Chỉ hiển thị phần đầu của file lớn, khi xử lý file được đọc theo luồng
+            with open(getattr(file, "name", file), "r", encoding="utf-8") as f:
+                return f.read(MAX_PREVIEW_CHARS)
         except (IOError, OSError, UnicodeDecodeError) as e:
             return f"Lỗi khi đọc file: {str(e)}"
     
     file_input.change(fn=load_file, inputs=file_input, outputs=text_input)
     
-    # Xử lý khi nhấn nút
-    def process_and_display(text, summarize_size_input, list_entity_input, sim_thresh, min_size, max_size, progress=gr.Progress()):
-        summary, json_data, html = process_text(text, summarize_size_input, list_entity_input, sim_thresh, min_size, max_size, progress)
-        
-        outputs = [summary, html]
-        
-        if json_data:
-            outputs.append(json_data)
-            # Return the file path for download
-            output_path = os.path.abspath("./output/result.json")
-            if os.path.exists(output_path):
-                outputs.append(gr.update(visible=True, value=output_path))
-            else:
-                outputs.append(gr.update(visible=False))
-        else:
-            outputs.append(None)
-            outputs.append(gr.update(visible=False))
+    # Xử lý khi nhấn nút: giao diện được cập nhật mỗi khi có chunk tóm tắt xong
+    def process_and_display(text, file, summarize_size_input, list_entity_input, sim_thresh, min_size, max_size, bypass_cache, doc_summary, request: gr.Request, progress=gr.Progress()):
+        cancel_event = threading.Event()
+        session = request.session_hash if request is not None else None
+        run_id = next(_run_ids)
+        with _cancel_events_lock:
+            _cancel_events[run_id] = (session, cancel_event)
+        json_data = None
+        run_info = {}
+        try:
+            for summary, json_data, html in process_text(
+                text, file, summarize_size_input, list_entity_input, sim_thresh, min_size, max_size, bypass_cache, doc_summary,
+                cancel_event=cancel_event, run_info=run_info, progress=progress
+            ):
+                yield summary, html, json_data, gr.update()
+        finally:
+            with _cancel_events_lock:
+                del _cancel_events[run_id]
         
-        return outputs
+        # Return the file path for download
+        output_path = os.path.abspath(run_info["json"]) if "json" in run_info else None
+        if json_data and not cancel_event.is_set() and output_path and os.path.exists(output_path):
+            yield gr.update(), gr.update(), gr.update(), gr.update(visible=True, value=output_path)
+        else:
+            yield gr.update(), gr.update(), gr.update(), gr.update(visible=False)
+    
+    # Dừng mọi lượt đang chạy hoặc đang chờ của session này: các request LLM chưa xong bị bỏ
+    def cancel_processing(request: gr.Request):
+        session = request.session_hash if request is not None else None
+        with _cancel_events_lock:
+            cancel_events = [event for run_session, event in _cancel_events.values() if run_session == session]
+        for cancel_event in cancel_events:
+            cancel_event.set()
     
-    process_btn.click(
+    process_event = process_btn.click(
         fn=process_and_display,
-        inputs=[text_input, summarize_size_input, list_entity_input, similarity_threshold, min_chunk_size, max_chunk_size],
+        inputs=[text_input, file_input, summarize_size_input, list_entity_input, similarity_threshold, min_chunk_size, max_chunk_size, bypass_summary_cache, document_summary],
         outputs=[summary_output, results_html, json_output, download_btn]
     )
+    cancel_btn.click(fn=cancel_processing, inputs=None, outputs=None, cancels=[process_event], queue=False)
     
     gr.Markdown(
         """
@@ -240,10 +656,15 @@ tên sự kiện, tên người, tên tổ chức, mốc thời gian, vị trí,
         ### 💡 Hướng dẫn sử dụng
         1. Nhập văn bản vào ô text hoặc upload file .txt
         2. Điều chỉnh các tham số chunking nếu cần
-        3. Nhấn nút "Xử lý" và chờ kết quả
+        3. Nhấn nút "Xử lý": kết quả từng chunk hiện ra ngay khi tóm tắt xong, nhấn "Dừng" để hủy các chunk còn lại
         4. Xem chi tiết kết quả và tải xuống file JSON nếu cần
         """
     )
 
 if __name__ == "__main__":
+    # Load model trong thread nền để server khởi động ngay, request đầu tiên không phải chờ load
+    if os.environ.get("WARMUP_MODELS", "1") == "1":
+        model_registry.warmup(background=True)
+    # Các lượt xử lý xếp hàng, tối đa UI_CONCURRENCY lượt chạy cùng lúc trên backend dùng chung
+    demo.queue(default_concurrency_limit=UI_CONCURRENCY, max_size=UI_QUEUE_SIZE)
     demo.launch(share=False, server_name="0.0.0.0", server_port=7860)
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""
+Tóm tắt toàn văn bản theo kiểu map-reduce dạng cây:
+- Map: mỗi chunk được tóm tắt song song (executor.iter_summaries)
+- Reduce: gộp từng nhóm group_size tóm tắt liền nhau thành một, các nhóm cùng tầng chạy song song,
+  lặp lại cho tới khi chỉ còn một bản tóm tắt không dài quá target_words từ
+Entity của các nút con được hợp lại và truyền lên nút cha ở mỗi tầng.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from executor import Backpressure, TokenBucket, summarize_chunks
+from tracing import tracer
+
+
+def merge_entities(groups: List[List[dict]]) -> List[dict]:
+    """
+    Hợp các danh sách entity (bỏ trùng theo text + label).
+    'count' là số chunk gốc có entity, entity có count lớn hơn được xếp trước,
+    cùng count thì giữ thứ tự xuất hiện.
+    """
+    merged = {}
+    for list_entity in groups:
+        seen = set()
+        for entity in list_entity:
+            key = (entity["text"], entity["label"])
+            if key in seen:
+                continue
+            seen.add(key)
+            if key not in merged:
+                merged[key] = {"text": entity["text"], "label": entity["label"], "count": 0}
+            merged[key]["count"] += entity.get("count", 1)
+    ranked = sorted(enumerate(merged.values()), key=lambda item: (-item[1]["count"], item[0]))
+    return [entity for _, entity in ranked]
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def summarize_document(
+    chunks: List[dict],
+    make_reduce_agent: Callable,
+    target_words: int = 300,
+    group_size: int = 4,
+    max_workers: int = 4,
+    limiter: Optional[TokenBucket] = None,
+    max_levels: int = 8,
+    cancel_event: Optional[threading.Event] = None,
+    executor: Optional[ThreadPoolExecutor] = None,
+    backpressure: Optional[Backpressure] = None
+) -> dict:
+    """
+    Gộp tóm tắt của các chunk (đã có 'summarize' và 'list_entity') thành tóm tắt toàn văn bản
+
+    Args:
+        chunks: Các chunk đã được tóm tắt, theo thứ tự chunk_id
+        make_reduce_agent: Hàm tạo Agent với prompt_builder=generate_reduce_prompt, max_length=target_words
+        target_words: Độ dài tối đa (số từ) của tóm tắt cuối cùng
+        group_size: Số tóm tắt được gộp trong một request
+        max_workers: Số request gộp chạy đồng thời trong một tầng
+        limiter: Token bucket dùng chung với bước map
+        max_levels: Số tầng reduce tối đa
+        cancel_event, executor, backpressure: Như executor.iter_summaries
+
+    Returns:
+        {'summarize': tóm tắt cuối, 'list_entity': entity hợp của toàn văn bản,
+         'levels': số nút ở mỗi tầng (tầng 0 là các chunk), 'llm_calls', 'seconds'}
+    """
+    group_size = max(2, group_size)
+    start = time.perf_counter()
+    level = [{"summarize": chunk["summarize"], "list_entity": chunk["list_entity"]} for chunk in chunks]
+    levels = [len(level)]
+    llm_calls = 0
+
+    for _ in range(max_levels):
+        if len(level) <= 1 and (not level or count_words(level[0]["summarize"]) <= target_words):
+            break
+        if len(levels) > 1 and len(level) == 1:
+            # Tóm tắt gốc vẫn dài hơn target_words sau khi gộp: không gọi lại LLM với cùng đầu vào
+            break
+
+        nodes = []
+        pending = []
+        for i in range(0, len(level), group_size):
+            group = level[i:i + group_size]
+            if len(group) == 1 and len(level) > 1:
+                # Nhóm lẻ cuối cùng được đưa thẳng lên tầng trên, không cần gọi LLM
+                nodes.append(group[0])
+                continue
+            node = {
+                "chunk_id": i,
+                "summaries": [child["summarize"] for child in group],
+                "list_entity": merge_entities([child["list_entity"] for child in group])
+            }
+            nodes.append(node)
+            pending.append(node)
+
+        with tracer.span("reduce_level", count=len(pending)):
+            summarize_chunks(
+                pending, make_reduce_agent, max_workers=max_workers, limiter=limiter,
+                cancel_event=cancel_event, executor=executor, backpressure=backpressure
+            )
+        llm_calls += len(pending)
+        level = nodes
+        levels.append(len(level))
+
+    return {
+        "summarize": level[0]["summarize"] if level else "",
+        "list_entity": merge_entities([node["list_entity"] for node in level]),
+        "levels": levels,
+        "llm_calls": llm_calls,
+        "seconds": time.perf_counter() - start
+    }
@@ -0,0 +1,124 @@
+"""
+Registry model dùng chung trong toàn process
+Model chỉ được load ở lần dùng đầu tiên và giữ lại cho các request sau
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+_loaders: Dict[str, Callable] = {}
+_models: Dict[str, object] = {}
+_metrics: Dict[str, dict] = {}
+_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+# Bảo vệ _metrics: bộ đếm requests được tăng từ nhiều thread (pipeline NER, LLM, UI)
+_metrics_lock = threading.Lock()
+
+
+def register(name: str, loader: Callable):
+    """Đăng ký hàm load model, chưa load ngay"""
+    with _registry_lock:
+        _loaders.setdefault(name, loader)
+        _locks.setdefault(name, threading.Lock())
+
+
+def is_loaded(name: str) -> bool:
+    return name in _models
+
+
+def get(name: str, loader: Optional[Callable] = None, fallback: Optional[Callable] = None):
+    """
+    Lấy model theo tên, load nếu chưa có.
+    Nhiều thread gọi cùng lúc thì chỉ một thread load, các thread khác chờ.
+    Load lỗi mà có fallback: model do fallback() tạo được giữ lại dưới tên này (lỗi ghi trong metrics),
+    các lần gọi sau dùng luôn model thay thế, không load lại.
+    """
+    model = _models.get(name)
+    if model is not None:
+        with _metrics_lock:
+            _metrics[name]["requests"] += 1
+        return model
+
+    if loader is not None:
+        register(name, loader)
+    if name not in _loaders:
+        raise KeyError(f"Model chưa được đăng ký: {name}")
+
+    with _locks[name]:
+        if name not in _models:
+            start = time.perf_counter()
+            error = None
+            try:
+                model = _loaders[name]()
+            except Exception as e:
+                if fallback is None:
+                    raise
+                error = str(e)
+                model = fallback()
+                print(f"Cảnh báo: Không thể load model {name} ({e}). Dùng {type(model).__name__} thay thế")
+            load_seconds = time.perf_counter() - start
+            with _metrics_lock:
+                _metrics[name] = {"load_seconds": load_seconds, "loaded_at": time.time(), "requests": 0}
+                if error is not None:
+                    _metrics[name]["fallback_error"] = error
+            _models[name] = model
+            if error is None:
+                print(f"Đã load model {name} trong {load_seconds:.1f}s")
+        with _metrics_lock:
+            _metrics[name]["requests"] += 1
+        return _models[name]
+
+
+def fallback_error(name: str) -> Optional[str]:
+    """Lỗi load của model nếu đang dùng model thay thế (get với fallback), None nếu không"""
+    with _metrics_lock:
+        return _metrics.get(name, {}).get("fallback_error")
+
+
+def override(name: str, model):
+    """Thay model đã đăng ký bằng một object có sẵn (vd. backend giả lập khi benchmark)"""
+    with _registry_lock:
+        _locks.setdefault(name, threading.Lock())
+    with _metrics_lock:
+        _metrics[name] = {"load_seconds": 0.0, "loaded_at": time.time(), "requests": 0}
+    _models[name] = model
+
+
+def warmup(names: Optional[Iterable[str]] = None, background: bool = False):
+    """
+    Load trước các model đã đăng ký (mặc định: tất cả)
+
+    Args:
+        names: Danh sách tên model cần load
+        background: Load trong thread nền để không chặn khởi động server
+    """
+    names = list(names) if names is not None else list(_loaders)
+
+    def _load_all():
+        for name in names:
+            try:
+                get(name)
+            except Exception as e:
+                print(f"Cảnh báo: Không thể load model {name}: {e}")
+
+    if background:
+        thread = threading.Thread(target=_load_all, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+    _load_all()
+
+
+def metrics() -> Dict[str, dict]:
+    """Thời gian load và số lần dùng của từng model đã load"""
+    with _metrics_lock:
+        return {name: dict(values) for name, values in _metrics.items()}
+
+
+def format_metrics() -> str:
+    """Mỗi model đã load một dòng: thời gian load và số lần dùng"""
+    return "\n".join(
+        f"{name}: load {values['load_seconds']:.1f}s, {values['requests']} lần dùng"
+        + (f" (model thay thế, lỗi load: {values['fallback_error']})" if "fallback_error" in values else "")
+        for name, values in sorted(metrics().items())
+    )
@@ -1,18 +1,69 @@
-from gliner import GLiNER
+import model_registry
+from tracing import tracer
 
-model = GLiNER.from_pretrained("urchade/gliner_multi-v2.1")
+GLINER_MODEL = "urchade/gliner_multi-v2.1"
+
+
+def _load_gliner():
+    from gliner import GLiNER
+    return GLiNER.from_pretrained(GLINER_MODEL)
+
+
+model_registry.register(GLINER_MODEL, _load_gliner)
+
+
+def get_model():
+    """GLiNER được load ở lần gọi đầu tiên và dùng chung cho các request sau"""
+    return model_registry.get(GLINER_MODEL)
 
 # labels = ["tên sự kiện", "tên người", "tên tổ chức", "mốc thời gian", "vị trí", "tiền tệ", "phần trăm"]
 
 def get_entity_name(paragraph, labels):
+    model = get_model()
     list_entity_name = []
     list_sentence = paragraph.split(".")
-    for sentence in list_sentence:
-        if sentence:
-            entities = model.predict_entities(sentence, labels)
-            for entity in entities:
-                text = entity["text"]
-                label = entity["label"]
-                list_entity_name.append({"text": text, 
-                                        "label": label})
+    with tracer.span("ner") as span:
+        for sentence in list_sentence:
+            if sentence:
+                span.count += 1
+                entities = model.predict_entities(sentence, labels)
+                for entity in entities:
+                    text = entity["text"]
+                    label = entity["label"]
+                    list_entity_name.append({"text": text, 
+                                            "label": label})
     return list_entity_name
+
+def get_entity_names_batch(paragraphs, labels, batch_size=16):
+    """
+    Trích xuất entity cho nhiều đoạn văn cùng lúc.
+    Câu của tất cả đoạn văn được gom lại, mỗi câu trùng nhau chỉ chạy model một lần,
+    sau đó entity được trả về theo từng đoạn văn (đã loại bỏ entity trùng trong đoạn).
+    """
+    unique_sentences = {}
+    paragraph_sentence_ids = []
+    for paragraph in paragraphs:
+        sentence_ids = []
+        for sentence in paragraph.split("."):
+            if sentence:
+                sentence_ids.append(unique_sentences.setdefault(sentence, len(unique_sentences)))
+        paragraph_sentence_ids.append(sentence_ids)
+
+    sentences = list(unique_sentences)
+    with tracer.span("ner", count=len(sentences)):
+        predictions = get_model().inference(sentences, labels, batch_size=batch_size) if sentences else []
+
+    results = []
+    for sentence_ids in paragraph_sentence_ids:
+        list_entity_name = []
+        seen = set()
+        for sentence_id in sentence_ids:
+            for entity in predictions[sentence_id]:
+                key = (entity["text"], entity["label"])
+                if key in seen:
+                    continue
+                seen.add(key)
+                list_entity_name.append({"text": entity["text"],
+                                        "label": entity["label"]})
+        results.append(list_entity_name)
+    return results
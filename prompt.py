@@ -1,3 +1,12 @@
+# Số entity tối đa đưa vào prompt gộp tóm tắt (ưu tiên entity xuất hiện ở nhiều đoạn)
+MAX_REDUCE_ENTITIES = 40
+
+def summary_word_limit(chunk, max_length):
+    if "token_count" in chunk:
+        # Chunk được đo bằng tokenizer: giới hạn theo số từ, số token sinh ra do num_predict giới hạn
+        return int(chunk["word_count"]*max_length/100)
+    return int(len(chunk['text'])*max_length/100)
+
 def generate_prompt(chunk, max_length):
     list_entity = chunk["list_entity"]
     chunk_current = chunk['text']
@@ -6,7 +15,7 @@ def generate_prompt(chunk, max_length):
     # else:
     #     chunk_previous_1 = "Đoạn văn hiện tại là đoạn văn đầu tiên. Nên không có thông tin đoạn văn liền trước."
 
-    max_len_sum = int(len(chunk_current)*max_length/100)
+    max_len_sum = summary_word_limit(chunk, max_length)
     entity_info = "Các entity quan trọng đã xác định.\n"
     for entity in list_entity:
         entity_info += f"- {entity['label']}: {entity['text']}\n"
@@ -20,4 +29,92 @@ def generate_prompt(chunk, max_length):
     Hãy tóm tắt [ĐOẠN VĂN HIỆN TẠI] của văn bản thành đoạn văn không quá {max_len_sum} từ. 
     Các [ENTITY INFO] bên trên phải xuất hiện trong văn bản tóm tắt được sinh ra.
      '''
-    return combine_prompt
\ No newline at end of file
+    return combine_prompt
+
+def generate_compact_prompt(chunk, max_length, entities, context=""):
+    """
+    Prompt gọn hơn generate_prompt: entity đã gộp (EntityIndex.prompt_entities) được nhóm theo nhãn,
+    kèm ngữ cảnh ngắn về các đoạn văn trước (EntityIndex.context)
+    """
+    max_len_sum = summary_word_limit(chunk, max_length)
+    groups = {}
+    for entity in entities:
+        groups.setdefault(entity['label'], []).append(entity['text'])
+    entity_info = "".join(f"- {label}: {'; '.join(texts)}\n" for label, texts in groups.items())
+
+    context_info = f"[NGỮ CẢNH TRƯỚC]\n    {context}\n    " if context else ""
+    context_note = " [NGỮ CẢNH TRƯỚC] chỉ để hiểu nội dung, không tóm tắt." if context else ""
+
+    combine_prompt = f'''
+    [ENTITY INFO]
+    {entity_info}
+    {context_info}[ĐOẠN VĂN HIỆN TẠI]
+    {chunk['text']}
+
+    Hãy tóm tắt [ĐOẠN VĂN HIỆN TẠI] thành đoạn văn không quá {max_len_sum} từ.
+    Các [ENTITY INFO] bên trên phải xuất hiện trong văn bản tóm tắt được sinh ra.{context_note}
+     '''
+    return combine_prompt
+
+# Hướng dẫn cố định của prompt tóm tắt chunk khi dùng bố cục prefix (generate_prefix_prompt).
+# Nằm cuối system prompt nên mọi request có chung phần đầu, Ollama dùng lại KV cache của phần này
+SUMMARY_INSTRUCTIONS = '''
+Mỗi yêu cầu gồm các phần:
+- [ENTITY INFO]: các entity quan trọng đã xác định, dạng "- nhãn: entity"
+- [NGỮ CẢNH TRƯỚC] (có thể không có): các entity đã nhắc ở các đoạn văn trước, chỉ để hiểu nội dung, không tóm tắt
+- [ĐOẠN VĂN HIỆN TẠI]: đoạn văn cần tóm tắt
+- [ĐỘ DÀI TỐI ĐA]: số từ tối đa của bản tóm tắt
+
+Hãy tóm tắt [ĐOẠN VĂN HIỆN TẠI] thành đoạn văn không vượt quá [ĐỘ DÀI TỐI ĐA].
+Các [ENTITY INFO] phải xuất hiện trong văn bản tóm tắt được sinh ra.'''
+
+def prefix_system_prompt(system):
+    """System prompt cho bố cục prefix: system prompt gốc + SUMMARY_INSTRUCTIONS"""
+    return system.rstrip() + "\n" + SUMMARY_INSTRUCTIONS
+
+def generate_prefix_prompt(chunk, max_length, entities=None, context=""):
+    """
+    Bố cục prefix: prompt chỉ gồm phần thay đổi theo chunk, hướng dẫn cố định nằm trong
+    system prompt (prefix_system_prompt)
+    entities: entity đã gộp (EntityIndex.prompt_entities), được nhóm theo nhãn.
+        None: mọi entity của chunk, mỗi entity một dòng như generate_prompt
+    """
+    max_len_sum = summary_word_limit(chunk, max_length)
+    if entities is None:
+        entity_info = "".join(f"- {entity['label']}: {entity['text']}\n" for entity in chunk["list_entity"])
+    else:
+        groups = {}
+        for entity in entities:
+            groups.setdefault(entity['label'], []).append(entity['text'])
+        entity_info = "".join(f"- {label}: {'; '.join(texts)}\n" for label, texts in groups.items())
+
+    context_info = f"[NGỮ CẢNH TRƯỚC]\n{context}\n" if context else ""
+
+    return (
+        f"[ENTITY INFO]\n{entity_info}{context_info}"
+        f"[ĐOẠN VĂN HIỆN TẠI]\n{chunk['text']}\n"
+        f"[ĐỘ DÀI TỐI ĐA]\n{max_len_sum} từ"
+    )
+
+def generate_reduce_prompt(node, max_length):
+    """
+    Prompt gộp nhiều đoạn tóm tắt liền nhau thành một (map-reduce)
+    node: {'summaries': [...], 'list_entity': [...]}, max_length: số từ tối đa
+    """
+    entity_info = "Các entity quan trọng đã xác định.\n"
+    for entity in node["list_entity"][:MAX_REDUCE_ENTITIES]:
+        entity_info += f"- {entity['label']}: {entity['text']}\n"
+
+    summaries = "\n".join(f"({i + 1}) {summary}" for i, summary in enumerate(node["summaries"]))
+
+    combine_prompt = f'''
+    [ENTITY INFO]
+    {entity_info}
+    [CÁC ĐOẠN TÓM TẮT]
+    {summaries}
+
+    Các đoạn tóm tắt trên là các phần liên tiếp của cùng một văn bản, theo đúng thứ tự.
+    Hãy gộp [CÁC ĐOẠN TÓM TẮT] thành một đoạn văn mạch lạc không quá {max_length} từ.
+    Các [ENTITY INFO] bên trên phải xuất hiện trong văn bản tóm tắt được sinh ra.
+     '''
+    return combine_prompt
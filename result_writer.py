@@ -0,0 +1,151 @@
+"""
+Ghi kết quả từng chunk ra file JSONL ngay khi chunk hoàn thành
+Cho phép chạy tiếp văn bản đang xử lý dở bằng cách bỏ qua các chunk_id đã có trong file
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Iterator, Set, Tuple
+
+
+def make_doc_id(source, *params) -> str:
+    """
+    Hash nội dung văn bản (chuỗi hoặc đường dẫn file) cùng các tham số chunking.
+    Cùng doc_id nghĩa là chunk_id của hai lần chạy trỏ tới cùng một chunk.
+    """
+    h = hashlib.sha1()
+    if isinstance(source, str) and os.path.isfile(source):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    else:
+        h.update(str(source).encode("utf-8"))
+    h.update(json.dumps(params, ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _iter_completed(path: str, doc_id: str) -> Iterator[Tuple[dict, int]]:
+    """(record, vị trí cuối dòng) của các chunk đã ghi cho doc_id, dừng ở dòng ghi dở đầu tiên"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        try:
+            same_doc = json.loads(f.readline()).get("doc_id") == doc_id
+        except ValueError:
+            same_doc = False
+        if not same_doc:
+            return
+        yield None, f.tell()
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                return
+            yield record, f.tell()
+
+
+def completed_chunk_ids(path: str, doc_id: str) -> Set[int]:
+    """chunk_id đã có trong file kết quả của cùng doc_id. Chỉ đọc, không giữ file mở"""
+    return {record["chunk_id"] for record, _ in _iter_completed(path, doc_id) if record is not None}
+
+
+class JsonlResultWriter:
+    def __init__(self, path: str, doc_id: str, fsync_every: int = 10):
+        """
+        Args:
+            path: File JSONL đầu ra. Dòng đầu là header chứa doc_id, mỗi dòng sau là một chunk
+            doc_id: Định danh văn bản (make_doc_id). File của văn bản khác sẽ bị ghi đè
+            fsync_every: Gọi fsync sau mỗi bao nhiêu chunk (0: chỉ fsync khi đóng file)
+        """
+        self.path = path
+        self.doc_id = doc_id
+        self.fsync_every = fsync_every
+        # Kết quả các chunk đã ghi ở lần chạy trước (chỉ giữ id cho các chunk ghi sau đó)
+        self.resumed = self._load_completed()
+        self.completed_ids = set(self.resumed)
+        self._unsynced = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        if self._file.tell() == 0:
+            self._write_line({"doc_id": doc_id})
+            self.flush(fsync=True)
+
+    def _load_completed(self) -> Dict[int, dict]:
+        """Đọc các chunk đã ghi của cùng doc_id, cắt bỏ dòng cuối bị ghi dở (nếu có)"""
+        if not os.path.exists(self.path):
+            return {}
+
+        completed = {}
+        valid_end = 0
+        for record, end in _iter_completed(self.path, self.doc_id):
+            if record is not None:
+                completed[record["chunk_id"]] = record
+            valid_end = end
+
+        with open(self.path, "r+b") as f:
+            f.truncate(valid_end)
+        return completed
+
+    def _write_line(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def write(self, record: dict):
+        """Ghi kết quả một chunk"""
+        self._write_line(record)
+        self.completed_ids.add(record["chunk_id"])
+        self._unsynced += 1
+        self.flush(fsync=bool(self.fsync_every) and self._unsynced >= self.fsync_every)
+
+    def flush(self, fsync: bool = False):
+        self._file.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.flush(fsync=True)
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def export_json(self, json_path: str):
+        """
+        Ghi toàn bộ kết quả ra file JSON, sắp xếp theo chunk_id.
+        Chỉ giữ vị trí từng dòng trong bộ nhớ, record được đọc lại lần lượt khi ghi.
+        """
+        self.flush()
+        offsets = []
+        with open(self.path, "rb") as f:
+            f.readline()
+            offset = f.tell()
+            for line in f:
+                offsets.append((json.loads(line)["chunk_id"], offset))
+                offset += len(line)
+        offsets.sort()
+
+        def _records():
+            with open(self.path, "rb") as f:
+                for _, offset in offsets:
+                    f.seek(offset)
+                    yield json.loads(f.readline())
+
+        write_json(_records(), json_path)
+
+
+def write_json(records: Iterable[dict], json_path: str):
+    """Ghi từng record một, không cần dựng toàn bộ chuỗi JSON trong bộ nhớ"""
+    os.makedirs(os.path.dirname(os.path.abspath(json_path)), exist_ok=True)
+    with open(json_path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for i, record in enumerate(records):
+            if i:
+                f.write(",\n")
+            f.write(json.dumps(record, ensure_ascii=False, indent=2))
+        f.write("\n]\n")
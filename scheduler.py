@@ -0,0 +1,353 @@
+"""
+Pipeline nhiều giai đoạn (producer/consumer) cho từng chunk: chunking -> NER -> dựng prompt -> LLM
+Mỗi giai đoạn có hàng đợi đầu vào giới hạn kích thước và số worker riêng, nên NER (CPU) của
+các chunk sau chạy trong khi LLM (I/O) đang sinh tóm tắt cho các chunk trước.
+Mỗi giai đoạn ghi lại độ sâu hàng đợi và mức độ bận để thấy giai đoạn nào là nút thắt.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from entity_index import EntityIndex
+from executor import Backpressure, Cancelled, TokenBucket, summarize_chunk
+
+# Kích thước mặc định hàng đợi đầu vào của mỗi giai đoạn
+DEFAULT_QUEUE_SIZE = 8
+# Chu kỳ (giây) kiểm tra lệnh dừng khi đang chờ hàng đợi
+_POLL_SECONDS = 0.1
+_DONE = object()
+
+
+class StageStats:
+    """Thống kê của một giai đoạn, cập nhật bởi các worker của giai đoạn đó"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.calls = 0
+        self.busy_seconds = 0.0     # Thời gian chạy hàm xử lý (cộng dồn các worker)
+        self.starved_seconds = 0.0  # Chờ hàng đợi đầu vào (giai đoạn trước chậm)
+        self.blocked_seconds = 0.0  # Chờ hàng đợi đầu ra còn chỗ (giai đoạn sau chậm)
+        self.depth_sum = 0
+        self.depth_samples = 0
+        self.max_depth = 0
+        self._lock = threading.Lock()
+
+    def sample_depth(self, depth: int):
+        with self._lock:
+            self.depth_sum += depth
+            self.depth_samples += 1
+            self.max_depth = max(self.max_depth, depth)
+
+    def add(self, items: int, busy: float, starved: float = 0.0, blocked: float = 0.0):
+        """Ghi một lần gọi hàm xử lý cho items item"""
+        with self._lock:
+            self.items += items
+            self.calls += 1
+            self.busy_seconds += busy
+            self.starved_seconds += starved
+            self.blocked_seconds += blocked
+
+    def as_dict(self, wall_seconds: float) -> dict:
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "calls": self.calls,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "starved_seconds": round(self.starved_seconds, 3),
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            # Tỉ lệ thời gian các worker bận xử lý (1.0: giai đoạn luôn bận, là nút thắt)
+            "utilization": round(self.busy_seconds / (self.workers * wall_seconds), 3) if wall_seconds else 0.0,
+            "mean_queue_depth": round(self.depth_sum / self.depth_samples, 2) if self.depth_samples else 0.0,
+            "max_queue_depth": self.max_depth
+        }
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        fn: Callable,
+        workers: int = 1,
+        batch_size: int = 1,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        executor: Optional[Executor] = None
+    ):
+        """
+        Args:
+            name: Tên giai đoạn trong thống kê
+            fn: Hàm xử lý một item (batch_size=1) hoặc list item, trả về item (list item) cho giai đoạn sau
+            workers: Số thread xử lý của giai đoạn
+            batch_size: Số item tối đa gom lại cho một lần gọi fn (chỉ gom các item đang chờ sẵn)
+            queue_size: Kích thước hàng đợi đầu vào
+            executor: Chạy fn trên pool dùng chung (vd. giới hạn request LLM của cả server)
+        """
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.executor = executor
+
+
+class Pipeline:
+    """
+    Chạy các item của source qua lần lượt các Stage, trả về item ngay khi xong (không theo thứ tự).
+    Item mà is_done(item) đúng sau một giai đoạn (vd. tóm tắt lấy từ cache) bỏ qua các giai đoạn sau.
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        source_name: str = "source",
+        is_done: Optional[Callable[[Any], bool]] = None,
+        cancel_event: Optional[threading.Event] = None
+    ):
+        self.stages = stages
+        self.source_name = source_name
+        self.is_done = is_done
+        self.cancel_event = cancel_event
+        self.stats: Dict[str, StageStats] = {source_name: StageStats(source_name, 1)}
+        for stage in stages:
+            self.stats[stage.name] = StageStats(stage.name, stage.workers)
+        self.wall_seconds = 0.0
+        self._queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+        self._output = queue.Queue()
+        self._stop = threading.Event()
+        self._running = [stage.workers for stage in stages]
+        self._lock = threading.Lock()
+
+    def _stopped(self) -> bool:
+        return self._stop.is_set() or (self.cancel_event is not None and self.cancel_event.is_set())
+
+    def _put(self, index: int, item) -> float:
+        """Đưa item vào hàng đợi của giai đoạn index (hoặc đầu ra), trả về thời gian bị chặn"""
+        if index >= len(self._queues) or (item is not _DONE and self.is_done is not None and self.is_done(item)):
+            self._output.put(item)
+            return 0.0
+        target = self._queues[index]
+        start = time.perf_counter()
+        while True:
+            if self._stopped():
+                raise Cancelled()
+            try:
+                target.put(item, timeout=_POLL_SECONDS)
+                return time.perf_counter() - start
+            except queue.Full:
+                continue
+
+    def _get(self, index: int):
+        source = self._queues[index]
+        while True:
+            if self._stopped():
+                raise Cancelled()
+            try:
+                return source.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+
+    def _run_source(self, source: Iterable):
+        stats = self.stats[self.source_name]
+        try:
+            iterator = iter(source)
+            while True:
+                start = time.perf_counter()
+                item = next(iterator, _DONE)
+                busy = time.perf_counter() - start
+                if item is _DONE:
+                    break
+                blocked = self._put(0, item)
+                stats.add(items=1, busy=busy, blocked=blocked)
+            for _ in range(self.stages[0].workers if self.stages else 0):
+                self._put(0, _DONE)
+        except BaseException as e:
+            self._fail(e)
+
+    def _run_worker(self, index: int):
+        stage = self.stages[index]
+        stats = self.stats[stage.name]
+        source = self._queues[index]
+        try:
+            finished = False
+            while not finished:
+                wait_start = time.perf_counter()
+                item = self._get(index)
+                starved = time.perf_counter() - wait_start
+                if item is _DONE:
+                    break
+                batch = [item]
+                while len(batch) < stage.batch_size:
+                    try:
+                        item = source.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _DONE:
+                        finished = True
+                        break
+                    batch.append(item)
+                stats.sample_depth(source.qsize() + len(batch))
+
+                start = time.perf_counter()
+                arg = batch if stage.batch_size > 1 else batch[0]
+                if stage.executor is not None:
+                    result = stage.executor.submit(stage.fn, arg).result()
+                else:
+                    result = stage.fn(arg)
+                busy = time.perf_counter() - start
+
+                blocked = 0.0
+                for out in (result if stage.batch_size > 1 else [result]):
+                    blocked += self._put(index + 1, out)
+                stats.add(items=len(batch), busy=busy, starved=starved, blocked=blocked)
+        except BaseException as e:
+            self._fail(e)
+            return
+
+        # Worker cuối cùng của giai đoạn báo hết dữ liệu cho giai đoạn sau
+        with self._lock:
+            self._running[index] -= 1
+            last = self._running[index] == 0
+        if last:
+            try:
+                if index + 1 < len(self.stages):
+                    for _ in range(self.stages[index + 1].workers):
+                        self._put(index + 1, _DONE)
+                else:
+                    self._output.put(_DONE)
+            except BaseException as e:
+                self._fail(e)
+
+    def _fail(self, error: BaseException):
+        if not self._stop.is_set():
+            self._stop.set()
+            self._output.put(error)
+
+    def run(self, source: Iterable) -> Iterator:
+        if not self.stages:
+            yield from source
+            return
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._run_source, args=(source,), name=self.source_name, daemon=True)]
+        for index, stage in enumerate(self.stages):
+            for i in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._run_worker, args=(index,), name=f"{stage.name}-{i}", daemon=True
+                ))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                try:
+                    item = self._output.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    if self._stopped() and not any(thread.is_alive() for thread in threads):
+                        raise Cancelled()
+                    continue
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self.wall_seconds = time.perf_counter() - start
+
+    def summary(self) -> Dict[str, dict]:
+        return {name: stats.as_dict(self.wall_seconds) for name, stats in self.stats.items()}
+
+    def bottleneck(self) -> Optional[str]:
+        """Giai đoạn có mức độ bận cao nhất"""
+        summary = self.summary()
+        return max(summary, key=lambda name: summary[name]["utilization"]) if summary else None
+
+    def format_table(self) -> str:
+        lines = [f"{'stage':<10} {'workers':>7} {'items':>6} {'busy':>6} {'queue avg':>9} {'queue max':>9}"
+                 f" {'starved (s)':>11} {'blocked (s)':>11}"]
+        for name, stats in self.summary().items():
+            lines.append(
+                f"{name:<10} {stats['workers']:>7} {stats['items']:>6} {stats['utilization']:>6.0%}"
+                f" {stats['mean_queue_depth']:>9.2f} {stats['max_queue_depth']:>9}"
+                f" {stats['starved_seconds']:>11.2f} {stats['blocked_seconds']:>11.2f}"
+            )
+        return "\n".join(lines)
+
+
+def summary_pipeline(
+    make_agent: Callable,
+    labels: List[str],
+    extract_entities_batch: Callable,
+    ner_workers: int = 1,
+    ner_batch_size: int = 4,
+    llm_workers: int = 4,
+    limiter: Optional[TokenBucket] = None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    cancel_event: Optional[threading.Event] = None,
+    executor: Optional[Executor] = None,
+    entity_index: Optional[EntityIndex] = None,
+    backpressure: Optional[Backpressure] = None
+) -> Pipeline:
+    """
+    Pipeline chunk -> NER -> dựng prompt (+ tra summary cache) -> LLM. Dùng: pipeline.run(chunks)
+
+    Args:
+        make_agent: Hàm tạo Agent mới cho mỗi chunk
+        labels: Các loại entity cần trích xuất
+        extract_entities_batch: Hàm (list đoạn văn, labels) -> list entity của từng đoạn
+            (vd. ner.get_entity_names_batch). Bỏ qua chunk đã có 'list_entity'
+        ner_workers: Số thread chạy NER
+        ner_batch_size: Số chunk tối đa gom vào một lần gọi extract_entities_batch
+        llm_workers: Số request LLM đồng thời của pipeline
+        limiter: Token bucket giới hạn tốc độ gửi request
+        queue_size: Kích thước hàng đợi đầu vào của mỗi giai đoạn
+        cancel_event: Khi được set, các giai đoạn dừng và run() raise Cancelled
+        executor: Thread pool LLM dùng chung giữa nhiều người dùng (giới hạn số request của cả server)
+        entity_index: Chỉ mục entity của văn bản, được cập nhật sau NER của từng chunk (trước khi dựng prompt).
+            Với ner_workers=1 các chunk qua NER theo đúng thứ tự nên prompt không phụ thuộc thời điểm chạy
+        backpressure: Giới hạn số request đang chạy trên server, dùng chung giữa nhiều người dùng
+    """
+    agents = {}
+
+    def ner(chunks):
+        pending = [chunk for chunk in chunks if "list_entity" not in chunk]
+        if pending:
+            entities = extract_entities_batch([chunk["text"] for chunk in pending], labels)
+            for chunk, list_entity in zip(pending, entities):
+                chunk["list_entity"] = list_entity
+        if entity_index is not None:
+            entity_index.add_chunks(chunks)
+        return chunks
+
+    def prompt(chunk):
+        # Dựng prompt một lần, chunk có sẵn tóm tắt trong cache thì không cần tới giai đoạn LLM
+        agent = make_agent()
+        agent.prepare(chunk)
+        cached = agent.cached_summary(chunk)
+        if cached is not None:
+            chunk["summarize"] = cached
+        else:
+            agents[chunk["chunk_id"]] = agent
+        return chunk
+
+    def llm(chunk):
+        return summarize_chunk(
+            chunk, make_agent, limiter=limiter, cancel_event=cancel_event,
+            agent=agents.pop(chunk["chunk_id"], None), backpressure=backpressure
+        )
+
+    stages = [
+        Stage("ner", ner, workers=ner_workers, batch_size=ner_batch_size, queue_size=queue_size),
+        Stage("prompt", prompt, queue_size=queue_size),
+        Stage("llm", llm, workers=llm_workers, queue_size=queue_size, executor=executor)
+    ]
+    return Pipeline(
+        stages,
+        source_name="chunk",
+        is_done=lambda chunk: "summarize" in chunk,
+        cancel_event=cancel_event
+    )
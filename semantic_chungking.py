@@ -3,9 +3,74 @@ Semantic Chunking cho văn bản tin tức tiếng Việt
 Sử dụng sentence embeddings để phát hiện ranh giới ngữ nghĩa
 """
 
+import bisect
 import numpy as np
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+import os
 import re
+import time
+from collections import deque
+
+from embedding_cache import EmbeddingCache
+import model_registry
+from embeddings import DEFAULT_BACKEND, HashingBackend, load_embedding_backend, register_embedding_backend, registry_key
+from sentence_store import SentenceStore
+from tokenizer import TokenCounter
+from tracing import tracer
+
+
+def register_sentence_model(
+    model_name: str,
+    backend: str = DEFAULT_BACKEND,
+    batch_size: int = 32,
+    threads: Optional[int] = None
+) -> str:
+    """Đăng ký model để có thể warm-up trước khi có request, trả về tên trong model_registry"""
+    return register_embedding_backend(backend, model_name, batch_size=batch_size, threads=threads)
+
+
+def load_sentence_model(model_name: str, backend: str = DEFAULT_BACKEND, fallback=None):
+    """Backend embedding dùng chung trong process, chỉ load một lần cho mỗi (backend, model_name)"""
+    return load_embedding_backend(backend, model_name, fallback=fallback)
+
+# Từ khóa chuyển đoạn
+TRANSITION_KEYWORDS = [
+    'tiếp theo', 'bên cạnh đó', 'trong khi đó', 'một tin khác',
+    'chuyển sang', 'theo đó', 'ngoài ra', 'mặt khác', 'về vấn đề'
+]
+
+
+# Một regex duy nhất khớp mọi từ khóa chuyển đoạn
+_TRANSITION_PATTERN = re.compile("|".join(re.escape(keyword) for keyword in TRANSITION_KEYWORDS))
+
+# Số câu lấy ra từ SentenceStore cho mỗi lần gọi get_embeddings trong chunk()
+EMBED_BLOCK_SENTENCES = 1024
+
+
+def topic_boundaries(below_threshold: np.ndarray, has_keyword: np.ndarray) -> List[int]:
+    """
+    Ranh giới chủ đề giống vòng lặp trong detect_topic_boundaries nhưng chỉ duyệt qua các ranh giới:
+    sau ranh giới trước (last), ranh giới tiếp theo là vị trí i nhỏ nhất có similarity thấp với i >= last + 3
+    hoặc câu i + 1 có từ khóa chuyển đoạn với i >= last + 2, tìm bằng bisect trên vị trí các câu đó
+
+    Args:
+        below_threshold: similarity[i] < ngưỡng, với mỗi cặp câu (i, i + 1)
+        has_keyword: câu i có từ khóa chuyển đoạn (transition_mask)
+    """
+    low = np.flatnonzero(below_threshold).tolist()
+    keyword = np.flatnonzero(has_keyword[1:len(below_threshold) + 1]).tolist()
+    boundaries = [0]
+    last = 0
+    while True:
+        a = bisect.bisect_left(low, last + 3)
+        b = bisect.bisect_left(keyword, last + 2)
+        i = min(low[a] if a < len(low) else len(below_threshold),
+                keyword[b] if b < len(keyword) else len(below_threshold))
+        if i >= len(below_threshold):
+            return boundaries
+        last = i + 1
+        boundaries.append(last)
+
 
 class SemanticNewsChunker:
     def __init__(
@@ -14,28 +79,63 @@ class SemanticNewsChunker:
         similarity_threshold: float = 0.75,
         min_chunk_size: int = 50,
         max_chunk_size: int = 400,
-        window_size: int = 3
+        window_size: int = 3,
+        vectorized: bool = True,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        token_counter: Optional[TokenCounter] = None,
+        context_limit: Optional[int] = None,
+        embedding_backend: str = DEFAULT_BACKEND,
+        embedding_batch_size: int = 32
     ):
         """
         Args:
             model_name: Tên model sentence transformers (PhoBERT-based)
             similarity_threshold: Ngưỡng similarity để tách chunk (0-1)
-            min_chunk_size: Số từ tối thiểu trong một chunk
-            max_chunk_size: Số từ tối đa trong một chunk
+            min_chunk_size: Số từ (số token nếu có token_counter) tối thiểu trong một chunk
+            max_chunk_size: Số từ (số token nếu có token_counter) tối đa trong một chunk
             window_size: Số câu để tính moving average similarity
+            vectorized: Dùng NumPy thay cho vòng lặp Python khi tính similarity
+            embedding_cache: Cache embedding trên đĩa, chỉ encode các câu chưa có trong cache
+            token_counter: Đếm kích thước chunk theo token của LLM thay cho số từ
+            context_limit: Kích thước tối đa của đoạn văn trong một lần gọi LLM. Nếu có,
+                các chunk liền nhau được gộp lại cho tới giới hạn này để giảm số lần gọi
+            embedding_backend: "sentence-transformers", "onnx" (int8, CPU) hoặc "hashing" (không cần model)
+            embedding_batch_size: Số câu mỗi lần gọi model embedding
         """
+        self.model_name = model_name
         self.similarity_threshold = similarity_threshold
         self.min_chunk_size = min_chunk_size
-        self.max_chunk_size = max_chunk_size
+        self.max_chunk_size = max_chunk_size if context_limit is None else min(max_chunk_size, context_limit)
         self.window_size = window_size
-
-        # Load model
-        try:
-            from sentence_transformers import SentenceTransformer
-            self.model = SentenceTransformer(model_name)
-        except:
-            print("Cảnh báo: Không thể load model. Sử dụng dummy embeddings.")
-            self.model = None
+        self.vectorized = vectorized
+        self.embedding_cache = embedding_cache
+        self.token_counter = token_counter
+        self.context_limit = context_limit
+        self.embedding_backend = embedding_backend
+        self.embedding_batch_size = embedding_batch_size
+        # Tổng embedding câu của từng chunk trước khi pack: start_sentence -> (end_sentence, tổng vector)
+        self._range_sums = {}
+
+        # Model được load ở lần dùng đầu tiên qua model_registry
+        self._model = None
+        self._model_loaded = False
+
+    @property
+    def model(self):
+        if not self._model_loaded:
+            # Load lỗi: model_registry giữ HashingBackend thay cho model này, các chunker sau không load lại.
+            # Hashing embedding vẫn cho ranh giới theo từ vựng chung, không ngẫu nhiên như trước
+            self._model = load_sentence_model(self.model_name, self.embedding_backend, fallback=HashingBackend)
+            if model_registry.fallback_error(registry_key(self.embedding_backend, self.model_name)) is not None:
+                # Vector hashing không được ghi lẫn vào cache của model gốc
+                self.embedding_cache = None
+            self._model_loaded = True
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+        self._model_loaded = True
 
     def split_sentences(self, text: str) -> List[str]:
         """Tách văn bản thành các câu"""
@@ -44,20 +144,56 @@ class SemanticNewsChunker:
         sentences = [s.strip() for s in sentences if s.strip()]
         return sentences
 
-    def get_embeddings(self, sentences: List[str]) -> np.ndarray:
-        """Chuyển câu thành vector embeddings"""
-        if self.model is None:
-            # Dummy embeddings cho testing
-            return np.random.rand(len(sentences), 384)
-        return self.model.encode(sentences, convert_to_numpy=True)
+    def get_embeddings(self, sentences: List[str], flush: bool = True) -> np.ndarray:
+        """Chuyển câu thành vector embeddings (flush=False: chưa ghi index của cache xuống đĩa)"""
+        model = self.model
+        if model is None:
+            model = self.model = HashingBackend()
+        if self.embedding_cache is None:
+            return model.encode(sentences, convert_to_numpy=True, batch_size=self.embedding_batch_size)
+        embeddings = self.embedding_cache.encode(
+            sentences,
+            lambda misses: model.encode(misses, convert_to_numpy=True, batch_size=self.embedding_batch_size)
+        )
+        if flush:
+            self.embedding_cache.flush()
+        return embeddings
+
+    def embed_store(self, store: SentenceStore) -> np.ndarray:
+        """Embedding mọi câu của store, mỗi lần chỉ tạo chuỗi cho một khối câu"""
+        embeddings = None
+        start = 0
+        for block in store.iter_batches(EMBED_BLOCK_SENTENCES):
+            part = np.asarray(self.get_embeddings(block, flush=False))
+            if embeddings is None:
+                embeddings = np.empty((len(store), part.shape[1]), dtype=part.dtype)
+            embeddings[start:start + len(part)] = part
+            start += len(part)
+        if embeddings is None:
+            return self.get_embeddings([])
+        if self.embedding_cache is not None:
+            self.embedding_cache.flush()
+        return embeddings
 
     def calculate_similarities(self, embeddings: np.ndarray) -> np.ndarray:
         """Tính cosine similarity giữa các câu liền kề"""
+        if not self.vectorized:
+            return self._calculate_similarities_loop(embeddings)
+        if len(embeddings) < 2:
+            return np.array([])
+        # Tính norm một lần cho mỗi câu, tích vô hướng theo từng hàng
+        embeddings = np.asarray(embeddings)
+        norms = np.sqrt(np.einsum('ij,ij->i', embeddings, embeddings))
+        dots = np.einsum('ij,ij->i', embeddings[:-1], embeddings[1:])
+        # Vector 0 (vd. câu chỉ có dấu câu) cho similarity 0 thay vì NaN
+        denom = norms[:-1] * norms[1:]
+        return np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+
+    def _calculate_similarities_loop(self, embeddings: np.ndarray) -> np.ndarray:
         similarities = []
         for i in range(len(embeddings) - 1):
-            sim = np.dot(embeddings[i], embeddings[i+1]) / (
-                np.linalg.norm(embeddings[i]) * np.linalg.norm(embeddings[i+1])
-            )
+            denom = np.linalg.norm(embeddings[i]) * np.linalg.norm(embeddings[i+1])
+            sim = np.dot(embeddings[i], embeddings[i+1]) / denom if denom > 0 else 0.0
             similarities.append(sim)
         return np.array(similarities)
 
@@ -65,7 +201,25 @@ class SemanticNewsChunker:
         """Làm mượt similarity scores bằng moving average"""
         if len(similarities) < self.window_size:
             return similarities
-
+        if not self.vectorized:
+            return self._smooth_similarities_loop(similarities)
+
+        # Moving average bằng tổng tích luỹ, cửa sổ bị cắt ở hai đầu.
+        # NaN không được cộng dồn (sẽ lan tới mọi vị trí sau), chỉ làm NaN các cửa sổ chứa nó như np.mean
+        similarities = np.asarray(similarities, dtype=np.float64)
+        n = len(similarities)
+        half = self.window_size // 2
+        nan = np.isnan(similarities)
+        cumsum = np.concatenate(([0.0], np.cumsum(np.where(nan, 0.0, similarities))))
+        nan_count = np.concatenate(([0], np.cumsum(nan)))
+        idx = np.arange(n)
+        start = np.maximum(0, idx - half)
+        end = np.minimum(n, idx + half + 1)
+        smoothed = (cumsum[end] - cumsum[start]) / (end - start)
+        smoothed[nan_count[end] > nan_count[start]] = np.nan
+        return smoothed
+
+    def _smooth_similarities_loop(self, similarities: np.ndarray) -> np.ndarray:
         smoothed = []
         for i in range(len(similarities)):
             start = max(0, i - self.window_size // 2)
@@ -73,33 +227,57 @@ class SemanticNewsChunker:
             smoothed.append(np.mean(similarities[start:end]))
         return np.array(smoothed)
 
+    def has_transition_keyword(self, sentence: str) -> bool:
+        """Câu có chứa từ khóa chuyển đoạn hay không"""
+        return _TRANSITION_PATTERN.search(sentence.lower()) is not None
+
+    def transition_mask(self, sentences: Union[List[str], SentenceStore]) -> np.ndarray:
+        """
+        Đánh dấu các câu chứa từ khóa chuyển đoạn bằng một lần quét regex trên toàn văn bản
+        (các câu viết thường được nối bằng '\n', từ khóa không chứa '\n' nên không khớp qua hai câu)
+        """
+        if isinstance(sentences, SentenceStore):
+            return sentences.match_mask(_TRANSITION_PATTERN)
+        lowered = [s.lower() for s in sentences]
+        starts = np.cumsum([0] + [len(s) + 1 for s in lowered[:-1]]) if lowered else np.array([], dtype=int)
+        mask = np.zeros(len(sentences), dtype=bool)
+        positions = [m.start() for m in _TRANSITION_PATTERN.finditer("\n".join(lowered))]
+        if positions:
+            mask[np.searchsorted(starts, positions, side='right') - 1] = True
+        return mask
+
     def detect_topic_boundaries(
         self,
-        sentences: List[str],
-        similarities: np.ndarray
+        sentences: Union[List[str], SentenceStore],
+        similarities: np.ndarray,
+        has_keyword: Optional[np.ndarray] = None
     ) -> List[int]:
-        """Phát hiện ranh giới chủ đề dựa trên similarity drops"""
+        """
+        Phát hiện ranh giới chủ đề dựa trên similarity drops
+        has_keyword: transition_mask(sentences) đã tính sẵn
+        """
         boundaries = [0]  # Bắt đầu từ câu đầu tiên
-
-        # Phát hiện từ khóa chuyển đoạn
-        transition_keywords = [
-            'tiếp theo', 'bên cạnh đó', 'trong khi đó', 'một tin khác',
-            'chuyển sang', 'theo đó', 'ngoài ra', 'mặt khác', 'về vấn đề'
-        ]
+        below_threshold = np.asarray(similarities) < self.similarity_threshold
+        if has_keyword is None:
+            has_keyword = self.transition_mask(sentences)
+        if self.vectorized:
+            return topic_boundaries(below_threshold, has_keyword)
+        last = 0
 
         for i in range(len(similarities)):
             # Điều kiện 1: Similarity thấp hơn ngưỡng
-            if similarities[i] < self.similarity_threshold:
+            if below_threshold[i]:
                 # Tránh tạo chunk quá nhỏ
-                if i > 0 and i - boundaries[-1] >= 3:
-                    boundaries.append(i + 1)
+                if i > 0 and i - last >= 3:
+                    last = i + 1
+                    boundaries.append(last)
+                    continue
 
             # Điều kiện 2: Phát hiện từ khóa chuyển đoạn
-            if i + 1 < len(sentences):
-                sentence_lower = sentences[i + 1].lower()
-                if any(keyword in sentence_lower for keyword in transition_keywords):
-                    if i - boundaries[-1] >= 2:
-                        boundaries.append(i + 1)
+            if i + 1 < len(sentences) and has_keyword[i + 1]:
+                if i - last >= 2:
+                    last = i + 1
+                    boundaries.append(last)
 
         return boundaries
 
@@ -107,6 +285,83 @@ class SemanticNewsChunker:
         """Đếm số từ trong văn bản"""
         return len(text.split())
 
+    def size_of(self, text: str) -> int:
+        """Kích thước dùng cho min_chunk_size/max_chunk_size: số token nếu có token_counter, không thì số từ"""
+        if self.token_counter is None:
+            return self.count_words(text)
+        return self.token_counter.count(text)
+
+    def sentence_sizes(self, sentences: List[str]) -> List[int]:
+        if self.token_counter is None:
+            return [self.count_words(s) for s in sentences]
+        return self.token_counter.count_batch(sentences)
+
+    def store_sizes(self, store: SentenceStore, word_counts: np.ndarray) -> np.ndarray:
+        """Kích thước từng câu của store (đếm token theo từng khối câu)"""
+        if self.token_counter is None:
+            return word_counts
+        sizes = np.empty(len(store), dtype=np.int64)
+        for start in range(0, len(store), EMBED_BLOCK_SENTENCES):
+            block = store.sentences(start, start + EMBED_BLOCK_SENTENCES)
+            sizes[start:start + len(block)] = self.token_counter.count_batch(block)
+        return sizes
+
+    def merge_small_ranges(
+        self,
+        ranges: List[Tuple[int, int]],
+        size_prefix: np.ndarray
+    ) -> List[Tuple[int, int]]:
+        """
+        Giống merge_small_chunks nhưng trên khoảng chỉ số câu [start, end).
+        size_prefix[i] là tổng kích thước của i câu đầu tiên.
+        """
+        merged = []
+        i = 0
+
+        while i < len(ranges):
+            start, end = ranges[i]
+
+            # Nếu chunk hiện tại quá nhỏ và không phải chunk cuối
+            if size_prefix[end] - size_prefix[start] < self.min_chunk_size and i < len(ranges) - 1:
+                # Gộp với chunk tiếp theo
+                end = ranges[i + 1][1]
+                i += 2
+            else:
+                i += 1
+
+            merged.append((start, end))
+
+        return merged
+
+    def split_large_ranges(
+        self,
+        ranges: List[Tuple[int, int]],
+        sizes: np.ndarray,
+        size_prefix: np.ndarray
+    ) -> List[Tuple[int, int]]:
+        """Giống split_large_chunks nhưng trên khoảng chỉ số câu, không cần tách câu lại"""
+        result = []
+
+        for start, end in ranges:
+            if size_prefix[end] - size_prefix[start] <= self.max_chunk_size:
+                result.append((start, end))
+                continue
+
+            # Chia chunk lớn thành các sub-chunks
+            sub_start = start
+            current_size = 0
+            for i in range(start, end):
+                sent_size = sizes[i]
+                if current_size + sent_size > self.max_chunk_size and i > sub_start:
+                    result.append((sub_start, i))
+                    sub_start = i
+                    current_size = sent_size
+                else:
+                    current_size += sent_size
+            result.append((sub_start, end))
+
+        return result
+
     def merge_small_chunks(
         self,
         chunks: List[str]
@@ -119,7 +374,7 @@ class SemanticNewsChunker:
             current_chunk = chunks[i]
 
             # Nếu chunk hiện tại quá nhỏ và không phải chunk cuối
-            if self.count_words(current_chunk) < self.min_chunk_size and i < len(chunks) - 1:
+            if self.size_of(current_chunk) < self.min_chunk_size and i < len(chunks) - 1:
                 # Gộp với chunk tiếp theo
                 current_chunk = current_chunk + " " + chunks[i + 1]
                 i += 2
@@ -138,7 +393,7 @@ class SemanticNewsChunker:
         result = []
 
         for chunk in chunks:
-            if self.count_words(chunk) <= self.max_chunk_size:
+            if self.size_of(chunk) <= self.max_chunk_size:
                 result.append(chunk)
             else:
                 # Chia chunk lớn thành các sub-chunks
@@ -147,7 +402,7 @@ class SemanticNewsChunker:
                 current_size = 0
 
                 for sent in sentences:
-                    sent_size = self.count_words(sent)
+                    sent_size = self.size_of(sent)
 
                     if current_size + sent_size > self.max_chunk_size and sub_chunk:
                         result.append(" ".join(sub_chunk))
@@ -169,57 +424,379 @@ class SemanticNewsChunker:
         Returns:
             List of dicts với keys: 'text', 'start_sentence', 'end_sentence', 'word_count'
         """
-        # Bước 1: Tách câu
-        sentences = self.split_sentences(text)
+        # Bước 1: Tách câu thành các khoảng vị trí ký tự trong text (không tạo chuỗi cho từng câu)
+        with tracer.span("split_sentences") as span:
+            store = SentenceStore(text)
+            span.count = len(store)
         if verbose:
-            print(f"Số câu: {len(sentences)}")
+            print(f"Số câu: {len(store)}")
 
         # Bước 2: Tạo embeddings
-        embeddings = self.get_embeddings(sentences)
+        with tracer.span("embedding", count=len(store)):
+            embeddings = self.embed_store(store)
         if verbose:
             print(f"Embeddings shape: {embeddings.shape}")
 
         # Bước 3: Tính similarity
-        similarities = self.calculate_similarities(embeddings)
-        smoothed_sims = self.smooth_similarities(similarities)
+        with tracer.span("similarity", count=len(store)):
+            similarities = self.calculate_similarities(embeddings)
+            smoothed_sims = self.smooth_similarities(similarities)
         if verbose:
             print(f"Similarity trung bình: {np.mean(smoothed_sims):.3f}")
             print(f"Similarity min: {np.min(smoothed_sims):.3f}, max: {np.max(smoothed_sims):.3f}")
 
         # Bước 4: Phát hiện ranh giới
-        boundaries = self.detect_topic_boundaries(sentences, smoothed_sims)
-        boundaries.append(len(sentences))  # Thêm điểm kết thúc
+        with tracer.span("boundary_detection", count=len(store)):
+            boundaries = self.detect_topic_boundaries(store, smoothed_sims)
+        boundaries.append(len(store))  # Thêm điểm kết thúc
         if verbose:
             print(f"Số chunk ban đầu: {len(boundaries) - 1}")
             print(f"Ranh giới: {boundaries}")
 
-        # Bước 5: Tạo chunks
-        initial_chunks = []
-        for i in range(len(boundaries) - 1):
-            start = boundaries[i]
-            end = boundaries[i + 1]
-            chunk_text = " ".join(sentences[start:end])
-            initial_chunks.append(chunk_text)
+        # Bước 5: Tạo chunks dưới dạng khoảng chỉ số câu [start, end)
+        merge_start = time.perf_counter()
+        word_counts = store.word_counts()
+        word_prefix = np.concatenate(([0], np.cumsum(word_counts)))
+        sizes = self.store_sizes(store, word_counts)
+        size_prefix = word_prefix if sizes is word_counts else np.concatenate(([0], np.cumsum(sizes)))
+        initial_ranges = [(boundaries[i], boundaries[i + 1]) for i in range(len(boundaries) - 1)]
 
         # Bước 6: Merge chunks nhỏ
-        merged_chunks = self.merge_small_chunks(initial_chunks)
+        merged_ranges = self.merge_small_ranges(initial_ranges, size_prefix)
         if verbose:
-            print(f"Sau merge: {len(merged_chunks)} chunks")
+            print(f"Sau merge: {len(merged_ranges)} chunks")
 
         # Bước 7: Split chunks lớn
-        final_chunks = self.split_large_chunks(merged_chunks)
+        final_ranges = self.split_large_ranges(merged_ranges, sizes, size_prefix)
+        tracer.record("merge_split", merge_start, time.perf_counter(), count=len(initial_ranges))
         if verbose:
-            print(f"Sau split: {len(final_chunks)} chunks")
+            print(f"Sau split: {len(final_ranges)} chunks")
 
-        # Bước 8: Format kết quả
+        # Bước 8: Format kết quả, văn bản chỉ được tạo một lần cho mỗi chunk cuối cùng
         results = []
-        for i, chunk_text in enumerate(final_chunks):
-            results.append({
+        for i, (start, end) in enumerate(final_ranges):
+            chunk = {
                 'chunk_id': i + 1,
-                'text': chunk_text,
-                'word_count': self.count_words(chunk_text),
-                'sentence_count': len(self.split_sentences(chunk_text))
-            })
-
+                'text': store.text_of(start, end),
+                'word_count': int(word_prefix[end] - word_prefix[start]),
+                'sentence_count': end - start,
+                'start_sentence': start,
+                'end_sentence': end
+            }
+            if self.token_counter is not None:
+                chunk['token_count'] = int(size_prefix[end] - size_prefix[start])
+            results.append(chunk)
+
+        self._range_sums = {
+            start: (end, np.asarray(embeddings[start:end], dtype=np.float32).sum(axis=0))
+            for start, end in final_ranges
+        }
+        if self.context_limit is not None:
+            results = list(self.pack_chunks(results))
         return results
 
+    def chunk_centroids(self, chunks: List[dict]) -> np.ndarray:
+        """
+        Vector trung bình (đã chuẩn hoá) các embedding câu của từng chunk,
+        dùng lại embedding đã tính trong lần chunk()/chunk_stream() gần nhất
+        """
+        centroids = []
+        for chunk in chunks:
+            start, end = chunk['start_sentence'], chunk['end_sentence']
+            total = None
+            while start < end:
+                start_next, part = self._range_sums[start]
+                total = part.copy() if total is None else total + part
+                start = start_next
+            norm = np.linalg.norm(total)
+            centroids.append(total / norm if norm > 0 else total)
+        return np.vstack(centroids) if centroids else np.zeros((0, 0), dtype=np.float32)
+
+    def pack_chunks(self, chunks: Iterable[dict]) -> Iterator[dict]:
+        """
+        Gộp tham lam các chunk liền nhau cho tới context_limit để mỗi lần gọi LLM
+        xử lý được nhiều token nhất. Ranh giới chủ đề giữa các chunk được giữ bằng dòng trống.
+        """
+        size_key = 'word_count' if self.token_counter is None else 'token_count'
+        group = []
+        group_size = 0
+        chunk_id = 0
+
+        def merge(group):
+            nonlocal chunk_id
+            chunk_id += 1
+            packed = {
+                'chunk_id': chunk_id,
+                'text': "\n\n".join(c['text'] for c in group),
+                'word_count': sum(c['word_count'] for c in group),
+                'sentence_count': sum(c['sentence_count'] for c in group),
+                'start_sentence': group[0]['start_sentence'],
+                'end_sentence': group[-1]['end_sentence']
+            }
+            if size_key == 'token_count':
+                packed['token_count'] = group_size
+            return packed
+
+        for chunk in chunks:
+            size = chunk[size_key]
+            if group and group_size + size > self.context_limit:
+                yield merge(group)
+                group, group_size = [], 0
+            group.append(chunk)
+            group_size += size
+        if group:
+            yield merge(group)
+
+    def _iter_text_blocks(
+        self,
+        source: Union[str, os.PathLike, Iterable[str]],
+        block_size: int
+    ) -> Iterator[str]:
+        """Đọc input theo từng khối: đường dẫn file, file object hoặc iterable các chuỗi"""
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "r", encoding="utf-8") as f:
+                yield from self._iter_text_blocks(f, block_size)
+        elif hasattr(source, "read"):
+            while True:
+                block = source.read(block_size)
+                if not block:
+                    break
+                yield block
+        else:
+            yield from source
+
+    def iter_sentences(self, blocks: Iterable[str]) -> Iterator[str]:
+        """Tách câu từ các khối văn bản, phần cuối chưa kết thúc câu được giữ lại cho khối sau"""
+        tail = ""
+        for block in blocks:
+            parts = re.split(r'(?<=[.!?])\s+', tail + block)
+            tail = parts.pop()
+            for part in parts:
+                part = part.strip()
+                if part:
+                    yield part
+        tail = tail.strip()
+        if tail:
+            yield tail
+
+    def chunk_stream(
+        self,
+        file_or_iterable: Union[str, os.PathLike, Iterable[str]],
+        batch_size: int = 64,
+        block_size: int = 1 << 16
+    ) -> Iterator[dict]:
+        """
+        Giống chunk() nhưng đọc input dần dần và trả về từng chunk ngay khi ranh giới đã cố định.
+        Bộ nhớ chỉ phụ thuộc vào batch_size, window_size và kích thước chunk, không phụ thuộc độ dài văn bản.
+
+        Args:
+            file_or_iterable: Đường dẫn file, file object hoặc iterable các đoạn văn bản
+            batch_size: Số câu được embed mỗi lần
+            block_size: Số ký tự đọc mỗi lần từ file
+        """
+        chunks = self._chunk_stream(file_or_iterable, batch_size, block_size)
+        if self.context_limit is not None:
+            chunks = self.pack_chunks(chunks)
+        yield from chunks
+
+    def _chunk_stream(self, file_or_iterable, batch_size: int, block_size: int) -> Iterator[dict]:
+        half = self.window_size // 2
+        self._range_sums = {}
+        unassigned = deque()        # Embedding của các câu chưa thuộc chunk nào đã trả về
+        assembler = _ChunkAssembler(self.min_chunk_size, self.max_chunk_size, self.size_of)
+        chunk_id = 0
+        next_sentence = 0
+
+        batch = []                  # Câu chờ embed
+        waiting = deque()           # Câu đã embed, chờ quyết định ranh giới trước khi đưa vào assembler
+        last_embedding = None
+        sims = []                   # Similarity thô, sims[0] ứng với chỉ số sims_base
+        sims_base = 0
+        n_sims = 0
+        next_i = 0                  # Chỉ số similarity tiếp theo cần quyết định ranh giới
+        last_boundary = 0
+        finished = False
+
+        def decide_ready():
+            """Quyết định ranh giới cho các vị trí đã đủ similarity để làm mượt"""
+            nonlocal next_i, last_boundary, sims, sims_base
+            out = []
+            # Như smooth_similarities: ít hơn window_size similarity thì không làm mượt,
+            # nên chưa thể quyết định cho tới khi biết đủ window_size giá trị hoặc hết văn bản
+            if not finished and n_sims < self.window_size:
+                return out
+            while next_i < n_sims and (finished or next_i + half < n_sims):
+                i = next_i
+                if n_sims < self.window_size:
+                    smoothed = sims[i - sims_base]
+                else:
+                    start = max(0, i - half) - sims_base
+                    end = min(n_sims, i + half + 1) - sims_base
+                    smoothed = float(np.mean(sims[start:end]))
+
+                sentence = waiting.popleft()
+                is_boundary = False
+                if smoothed < self.similarity_threshold and i > 0 and i - last_boundary >= 3:
+                    is_boundary = True
+                elif self.has_transition_keyword(sentence) and i - last_boundary >= 2:
+                    is_boundary = True
+                if is_boundary:
+                    last_boundary = i + 1
+                    out.extend(assembler.end_chunk())
+                out.extend(assembler.add(sentence))
+                next_i += 1
+
+            # Chỉ giữ lại các similarity còn nằm trong cửa sổ làm mượt
+            drop = max(0, next_i - half) - sims_base
+            if drop > 0:
+                sims = sims[drop:]
+                sims_base += drop
+            return out
+
+        def embed_batch():
+            nonlocal last_embedding, n_sims
+            with tracer.span("embedding", count=len(batch)):
+                embeddings = self.get_embeddings(batch, flush=False)
+            unassigned.extend(np.asarray(embeddings, dtype=np.float32))
+            out = []
+            if last_embedding is None:
+                # Câu đầu tiên của văn bản luôn bắt đầu chunk đầu tiên
+                out.extend(assembler.add(batch[0]))
+                pair_source = embeddings
+                waiting.extend(batch[1:])
+            else:
+                pair_source = np.vstack([last_embedding[None, :], embeddings])
+                waiting.extend(batch)
+            with tracer.span("similarity", count=len(batch)):
+                new_sims = self.calculate_similarities(pair_source)
+            sims.extend(float(x) for x in new_sims)
+            n_sims += len(new_sims)
+            last_embedding = np.asarray(embeddings[-1])
+            batch.clear()
+            return out
+
+        def to_dicts(finalized):
+            nonlocal chunk_id, next_sentence
+            for sentences in finalized:
+                chunk_id += 1
+                start = next_sentence
+                next_sentence += len(sentences)
+                chunk = {
+                    'chunk_id': chunk_id,
+                    'text': " ".join(sentences),
+                    'word_count': sum(self.count_words(s) for s in sentences),
+                    'sentence_count': len(sentences),
+                    'start_sentence': start,
+                    'end_sentence': next_sentence
+                }
+                if self.token_counter is not None:
+                    chunk['token_count'] = sum(self.size_of(s) for s in sentences)
+                self._range_sums[start] = (next_sentence, sum(unassigned.popleft() for _ in sentences))
+                yield chunk
+
+        # Index của embedding cache chỉ được ghi xuống đĩa một lần khi hết văn bản (hoặc khi dừng giữa chừng)
+        try:
+            blocks = self._iter_text_blocks(file_or_iterable, block_size)
+            for sentence in self.iter_sentences(blocks):
+                batch.append(sentence)
+                if len(batch) >= batch_size:
+                    yield from to_dicts(embed_batch())
+                    yield from to_dicts(decide_ready())
+
+            if batch:
+                yield from to_dicts(embed_batch())
+        finally:
+            if self.embedding_cache is not None:
+                self.embedding_cache.flush()
+        finished = True
+        yield from to_dicts(decide_ready())
+        yield from to_dicts(assembler.finish())
+
+
+class _ChunkAssembler:
+    """
+    Gộp chunk nhỏ + chia chunk lớn theo luồng, cho kết quả giống
+    merge_small_chunks + split_large_chunks trên toàn bộ văn bản
+    """
+
+    def __init__(self, min_chunk_size: int, max_chunk_size: int, count_words):
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.count_words = count_words
+        self.pending = None         # Chunk nhỏ đang chờ gộp với chunk kế tiếp
+        self.pending_words = 0
+        self.current = []           # Chunk ban đầu đang mở
+        self.current_words = 0
+        self.splitting = False      # Chunk đang mở chắc chắn vượt max_chunk_size
+        self.split_words = 0        # Tổng số từ của chunk ban đầu đang bị chia
+        self.split_merged = False   # Chunk đang bị chia đã được gộp với chunk nhỏ phía trước
+        self.sub_chunk = []
+        self.sub_words = 0
+
+    def _pack(self, sentence: str, words: int) -> List[List[str]]:
+        """Chia tham lam như split_large_chunks"""
+        if self.sub_words + words > self.max_chunk_size and self.sub_chunk:
+            out = [self.sub_chunk]
+            self.sub_chunk = [sentence]
+            self.sub_words = words
+            return out
+        self.sub_chunk.append(sentence)
+        self.sub_words += words
+        return []
+
+    def add(self, sentence: str) -> List[List[str]]:
+        words = self.count_words(sentence)
+        if self.splitting:
+            self.split_words += words
+            return self._pack(sentence, words)
+
+        self.current.append(sentence)
+        self.current_words += words
+        if self.current_words + self.pending_words <= self.max_chunk_size:
+            return []
+
+        # Chunk (đã gộp) chắc chắn bị chia: các sub-chunk phía trước đã cố định
+        sentences = (self.pending or []) + self.current
+        self.split_merged = self.pending is not None
+        self.split_words = self.current_words + self.pending_words
+        self.pending, self.pending_words = None, 0
+        self.current, self.current_words = [], 0
+        self.splitting = True
+        out = []
+        for s in sentences:
+            out.extend(self._pack(s, self.count_words(s)))
+        return out
+
+    def end_chunk(self) -> List[List[str]]:
+        """Kết thúc chunk ban đầu hiện tại (gặp ranh giới chủ đề)"""
+        out = []
+        if self.splitting:
+            if not self.split_merged and self.split_words < self.min_chunk_size:
+                # Chunk vẫn bị coi là nhỏ (khi min_chunk_size > max_chunk_size): gộp tiếp với chunk sau
+                self.split_merged = True
+                return out
+            out.extend(self._flush_split())
+        elif self.pending is not None:
+            out.append(self.pending + self.current)
+            self.pending, self.pending_words = None, 0
+        elif self.current_words < self.min_chunk_size:
+            self.pending, self.pending_words = self.current, self.current_words
+        else:
+            out.append(self.current)
+        self.current, self.current_words = [], 0
+        return out
+
+    def _flush_split(self) -> List[List[str]]:
+        out = [self.sub_chunk] if self.sub_chunk else []
+        self.splitting = False
+        self.sub_chunk, self.sub_words = [], 0
+        return out
+
+    def finish(self) -> List[List[str]]:
+        if self.splitting:
+            return self._flush_split()
+        out = self.end_chunk() if self.current else []
+        if self.pending is not None:
+            out.append(self.pending)
+            self.pending, self.pending_words = None, 0
+        return out
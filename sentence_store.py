@@ -0,0 +1,109 @@
+"""
+Lưu các câu của văn bản dưới dạng vị trí (start, end) trong một chuỗi nguồn duy nhất
+thay vì một list chuỗi riêng cho mỗi câu. Văn bản của câu/chunk chỉ được tạo khi cần.
+Tách câu giống SemanticNewsChunker.split_sentences.
+"""
+
+import re
+from array import array
+from typing import Iterator, List, Pattern, Tuple
+
+import numpy as np
+
+# Ranh giới câu: khoảng trắng sau dấu câu (giống split_sentences)
+SENTENCE_SEPARATOR = re.compile(r'(?<=[.!?])\s+')
+# Số câu mỗi lần quét trong word_counts/match_mask (giới hạn bộ nhớ tạm)
+SCAN_BLOCK_SENTENCES = 4096
+
+
+class SentenceStore:
+    def __init__(self, text: str):
+        self.text = text
+        starts, ends = array('q'), array('q')
+        segment_start = 0
+        for match in SENTENCE_SEPARATOR.finditer(text):
+            self._add_segment(segment_start, match.start(), starts, ends)
+            segment_start = match.end()
+        self._add_segment(segment_start, len(text), starts, ends)
+
+        # Vị trí ký tự [starts[i], ends[i]) của câu i (đã bỏ khoảng trắng hai đầu)
+        self.starts = np.frombuffer(starts, dtype=np.int64)
+        self.ends = np.frombuffer(ends, dtype=np.int64)
+        # plain_gap[i]: giữa câu i và câu i+1 đúng một dấu cách, nên " ".join hai câu bằng một lát cắt của text
+        self.plain_gap = (self.starts[1:] - self.ends[:-1]) == 1
+        self.plain_gap[self.plain_gap] = [text[i] == " " for i in self.ends[:-1][self.plain_gap].tolist()]
+        self._plain_prefix = np.concatenate(([0], np.cumsum(~self.plain_gap)))
+
+    def _add_segment(self, start: int, end: int, starts: array, ends: array):
+        segment = self.text[start:end]
+        stripped = segment.strip()
+        if stripped:
+            offset = start + len(segment) - len(segment.lstrip())
+            starts.append(offset)
+            ends.append(offset + len(stripped))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, i: int) -> str:
+        return self.text[self.starts[i]:self.ends[i]]
+
+    def sentences(self, start: int = 0, end: int = None) -> List[str]:
+        """Danh sách chuỗi các câu [start, end), chỉ nên dùng cho từng lô nhỏ"""
+        end = len(self) if end is None else end
+        return [self.text[s:e] for s, e in zip(self.starts[start:end].tolist(), self.ends[start:end].tolist())]
+
+    def iter_batches(self, batch_size: int) -> Iterator[List[str]]:
+        for start in range(0, len(self), batch_size):
+            yield self.sentences(start, start + batch_size)
+
+    def text_of(self, start: int, end: int) -> str:
+        """
+        Văn bản của các câu [start, end) nối bằng dấu cách (giống " ".join(sentences[start:end])).
+        Nếu giữa các câu chỉ có một dấu cách thì chỉ cần cắt một lần từ chuỗi nguồn.
+        """
+        if start >= end:
+            return ""
+        if self._plain_prefix[end - 1] == self._plain_prefix[start]:
+            return self.text[self.starts[start]:self.ends[end - 1]]
+        return " ".join(self.sentences(start, end))
+
+    def _blocks(self) -> Iterator[Tuple[int, int]]:
+        """Các khối câu [first, last) để quét văn bản từng phần"""
+        for first in range(0, len(self), SCAN_BLOCK_SENTENCES):
+            yield first, min(first + SCAN_BLOCK_SENTENCES, len(self))
+
+    def _sentence_of(self, positions: np.ndarray, first: int, last: int) -> np.ndarray:
+        """Chỉ số câu tính từ first (trong khối [first, last)) chứa từng vị trí ký tự, -1 nếu nằm ngoài mọi câu"""
+        starts, ends = self.starts[first:last], self.ends[first:last]
+        index = np.searchsorted(starts, positions, side='right') - 1
+        inside = (index >= 0) & (positions < ends[np.maximum(index, 0)])
+        return np.where(inside, index, -1)
+
+    def word_counts(self) -> np.ndarray:
+        """Số từ (theo khoảng trắng, như count_words) của từng câu, chuỗi câu chỉ tồn tại tạm thời"""
+        counts = np.empty(len(self), dtype=np.int64)
+        for first, last in self._blocks():
+            spans = zip(self.starts[first:last].tolist(), self.ends[first:last].tolist())
+            counts[first:last] = [len(self.text[s:e].split()) for s, e in spans]
+        return counts
+
+    def match_mask(self, pattern: Pattern) -> np.ndarray:
+        """
+        Câu nào chứa pattern (so khớp trên chữ thường, như has_transition_keyword).
+        pattern không được khớp qua ranh giới câu (không chứa khoảng trắng sau dấu câu).
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        for first, last in self._blocks():
+            offset = int(self.starts[first])
+            block = self.text[offset:int(self.ends[last - 1])]
+            lowered = block.lower()
+            if len(lowered) != len(block):
+                # Một số ký tự Unicode đổi độ dài khi viết thường: so khớp từng câu
+                for i in range(first, last):
+                    mask[i] = pattern.search(self[i].lower()) is not None
+                continue
+            positions = np.fromiter((m.start() + offset for m in pattern.finditer(lowered)), dtype=np.int64)
+            index = self._sentence_of(positions, first, last)
+            mask[index[index >= 0] + first] = True
+        return mask
@@ -0,0 +1,96 @@
+"""
+Cache kết quả tóm tắt trên đĩa (SQLite)
+Key là hash của toàn bộ messages gửi tới LLM (system prompt + prompt đã render), tên model và sampling options
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+
+class SummaryCache:
+    def __init__(self, path: str, max_entries: int = 20000):
+        """
+        Args:
+            path: File SQLite lưu cache
+            max_entries: Số kết quả tối đa, vượt quá sẽ xoá các kết quả lâu không dùng nhất
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.seconds_saved = 0.0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " key TEXT PRIMARY KEY,"
+            " summary TEXT NOT NULL,"
+            " tokens INTEGER NOT NULL,"
+            " seconds REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON summaries(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(messages: List[dict], model: str, options: dict) -> str:
+        payload = json.dumps(
+            {"messages": messages, "model": model, "options": options},
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, tokens, seconds FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            summary, tokens, seconds = row
+            self.hits += 1
+            self.tokens_saved += tokens
+            self.seconds_saved += seconds
+            return summary
+
+    def put(self, key: str, summary: str, tokens: int = 0, seconds: float = 0.0):
+        """
+        Args:
+            tokens: Số token LLM đã sinh cho kết quả này
+            seconds: Thời gian sinh kết quả, dùng để thống kê thời gian tiết kiệm được
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, tokens, seconds, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, summary, tokens, seconds, time.time())
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM summaries WHERE key IN"
+                    " (SELECT key FROM summaries ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "seconds_saved": self.seconds_saved
+        }
@@ -0,0 +1,24 @@
+import numpy as np
+
+from dedup import mark_duplicates
+
+BULLETIN = ("Giá vàng trong nước sáng nay tăng mạnh theo đà tăng của thị trường thế giới, "
+            "vàng miếng được niêm yết ở mức cao nhất từ đầu năm tại các doanh nghiệp lớn.")
+SAME_TOPIC = ("Tại các doanh nghiệp lớn, vàng nhẫn giảm nhẹ trong phiên chiều sau khi nhà đầu tư "
+              "chốt lời, giá thế giới đứng yên quanh mức cũ của tuần trước.")
+
+
+def make_chunks(texts):
+    return [
+        {"chunk_id": i, "text": text, "word_count": len(text.split())}
+        for i, text in enumerate(texts, start=1)
+    ]
+
+
+def test_text_check_keeps_same_topic_chunks_apart():
+    chunks = make_chunks([BULLETIN, SAME_TOPIC, BULLETIN, BULLETIN.replace("sáng nay", "chiều nay")])
+    # Cùng một centroid: chỉ văn bản phân biệt được chunk 2 với chunk 1
+    centroids = np.tile(np.eye(1, 8, dtype=np.float32), (len(chunks), 1))
+    duplicates = mark_duplicates(chunks, centroids, threshold=0.95)
+    assert duplicates == {3: 1, 4: 1}
+    assert "duplicate_of" not in chunks[1]
@@ -0,0 +1,91 @@
+import numpy as np
+
+import model_registry
+from embeddings import HashingBackend, registry_key
+from semantic_chungking import SemanticNewsChunker
+
+TOPICS = [
+    "Quốc hội thảo luận dự án luật đất đai sửa đổi tại phiên họp sáng nay.",
+    "Giá vàng trong nước tăng mạnh theo đà tăng của thị trường thế giới.",
+    "Đội tuyển bóng đá Việt Nam chuẩn bị cho trận đấu vòng loại sắp tới.",
+    "Mưa lớn kéo dài gây ngập úng nhiều tuyến phố ở thành phố Hồ Chí Minh.",
+]
+
+
+class ZeroRowModel(HashingBackend):
+    """HashingBackend nhưng câu chỉ gồm dấu câu có embedding bằng 0"""
+
+    def encode(self, sentences, convert_to_numpy=True, batch_size=None, **kwargs):
+        vectors = super().encode(sentences, convert_to_numpy=convert_to_numpy, batch_size=batch_size)
+        vectors[[not any(c.isalnum() for c in s) for s in sentences]] = 0.0
+        return vectors
+
+
+def make_text(n_sentences=120):
+    sentences = []
+    for i in range(n_sentences):
+        sentences.append(TOPICS[(i // 8) % len(TOPICS)].replace(".", f" lần {i}."))
+        if i in (10, 11, 40):
+            sentences.append("...")
+    return " ".join(sentences)
+
+
+def make_chunker(vectorized):
+    chunker = SemanticNewsChunker(similarity_threshold=0.8, min_chunk_size=20, max_chunk_size=1000, vectorized=vectorized)
+    chunker.model = ZeroRowModel()
+    return chunker
+
+
+def test_similarities_with_zero_vector():
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((50, 16))
+    embeddings[[0, 7, 8, 30]] = 0.0
+    fast, loop = make_chunker(True), make_chunker(False)
+    sims = fast.calculate_similarities(embeddings)
+    assert not np.isnan(sims).any()
+    np.testing.assert_allclose(sims, loop.calculate_similarities(embeddings))
+    np.testing.assert_allclose(fast.smooth_similarities(sims), loop.smooth_similarities(sims))
+
+
+def test_smoothing_nan_stays_in_window():
+    sims = np.linspace(0.1, 0.9, 30)
+    sims[5] = np.nan
+    fast, loop = make_chunker(True), make_chunker(False)
+    smoothed = fast.smooth_similarities(sims)
+    np.testing.assert_array_equal(np.isnan(smoothed), np.isnan(loop.smooth_similarities(sims)))
+    np.testing.assert_allclose(smoothed[7:], loop.smooth_similarities(sims)[7:])
+
+
+def test_chunk_boundaries_match_loop_with_zero_vector():
+    text = make_text()
+    ranges = lambda chunks: [(chunk["start_sentence"], chunk["end_sentence"]) for chunk in chunks]
+    fast = ranges(make_chunker(True).chunk(text))
+    assert fast == ranges(make_chunker(False).chunk(text))
+    assert fast == ranges(make_chunker(True).chunk_stream([text]))
+    assert fast[-1][1] == len(make_chunker(True).split_sentences(text))
+    assert len(fast) > 4
+
+
+def test_hashing_punctuation_only_sentences():
+    sentences = ["...", "—!", "***", "...", "Giá vàng tăng."]
+    vectors = HashingBackend().encode(sentences)
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+    np.testing.assert_array_equal(vectors[0], vectors[3])
+    np.testing.assert_array_equal(vectors[0], HashingBackend().encode(["..."])[0])
+
+
+def test_model_load_fallback_recorded_once():
+    calls = []
+
+    def broken_loader():
+        calls.append(1)
+        raise OSError("model not found")
+
+    model_name = "test/broken-model"
+    model_registry.register(registry_key("sentence-transformers", model_name), broken_loader)
+    for _ in range(3):
+        chunker = SemanticNewsChunker(model_name=model_name, embedding_cache=object())
+        assert isinstance(chunker.model, HashingBackend)
+        assert chunker.embedding_cache is None
+    assert len(calls) == 1
+    assert model_registry.fallback_error(registry_key("sentence-transformers", model_name)) == "model not found"
@@ -0,0 +1,119 @@
+"""
+Đếm token theo tokenizer thật của LLM thay cho đếm từ theo khoảng trắng
+(tiếng Việt tách theo âm tiết nên số "từ" khác xa số token mà model phải xử lý)
+
+Tokenizer (thư viện `tokenizers`, viết bằng Rust) được load một lần qua model_registry,
+kết quả đếm của từng câu được cache để các lần chunking sau không phải encode lại.
+"""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import model_registry
+
+# Tỉ lệ dư cho số token sinh ra so với độ dài tóm tắt yêu cầu
+SUMMARY_TOKEN_SLACK = 1.3
+
+
+class TokenCounter:
+    """
+    Đếm token có cache LRU theo nội dung câu.
+    encode_batch: hàm nhận danh sách câu, trả về số token của từng câu
+    """
+
+    def __init__(self, encode_batch: Callable[[List[str]], List[int]], name: str = "", max_entries: int = 100000):
+        self.encode_batch = encode_batch
+        self.name = name
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, text: str) -> int:
+        return self.count(text)
+
+    def count(self, text: str) -> int:
+        if not self.max_entries:
+            return self.encode_batch([text])[0]
+        with self._lock:
+            n = self._cache.get(text)
+            if n is not None:
+                self._cache.move_to_end(text)
+                return n
+        return self.count_batch([text])[0]
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        """Đếm nhiều câu một lần, chỉ encode các câu chưa có trong cache"""
+        if not self.max_entries:
+            return list(self.encode_batch(texts))
+        counts: List[Optional[int]] = [None] * len(texts)
+        misses = {}
+        with self._lock:
+            for i, text in enumerate(texts):
+                n = self._cache.get(text)
+                if n is None:
+                    misses.setdefault(text, []).append(i)
+                else:
+                    self._cache.move_to_end(text)
+                    counts[i] = n
+
+        if misses:
+            miss_texts = list(misses)
+            miss_counts = self.encode_batch(miss_texts)
+            with self._lock:
+                for text, n in zip(miss_texts, miss_counts):
+                    for i in misses[text]:
+                        counts[i] = n
+                    self._cache[text] = n
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return counts
+
+
+def whitespace_counter() -> TokenCounter:
+    """Đếm theo khoảng trắng (giống count_words), dùng khi không có tokenizer"""
+    return TokenCounter(lambda texts: [len(text.split()) for text in texts], name="whitespace", max_entries=0)
+
+
+def _tokenizer_loader(name: str):
+    def _load():
+        from tokenizers import Tokenizer
+        if os.path.exists(name):
+            return Tokenizer.from_file(name)
+        return Tokenizer.from_pretrained(name)
+    return _load
+
+
+def load_token_counter(name: str) -> TokenCounter:
+    """
+    TokenCounter dùng chung trong process cho tokenizer `name`
+    (đường dẫn tới tokenizer.json hoặc tên repo trên HuggingFace Hub)
+    """
+    key = f"tokenizer:{name}"
+
+    def _load():
+        tokenizer = _tokenizer_loader(name)()
+        return TokenCounter(
+            lambda texts: [len(encoding.ids) for encoding in tokenizer.encode_batch(texts, add_special_tokens=False)],
+            name=name
+        )
+
+    return model_registry.get(key, loader=_load)
+
+
+def summary_token_budget(n_tokens: int, summary_ratio: float) -> int:
+    """Số token tối đa cho phần tóm tắt (num_predict) của đoạn văn n_tokens token"""
+    return max(16, math.ceil(n_tokens * summary_ratio * SUMMARY_TOKEN_SLACK))
+
+
+def chunk_token_budget(context_tokens: int, summary_ratio: float, overhead_tokens: int) -> int:
+    """
+    Số token tối đa của một chunk để prompt + tóm tắt vừa context của model:
+    chunk + overhead + chunk * summary_ratio * slack <= context_tokens
+    """
+    budget = (context_tokens - overhead_tokens) / (1 + summary_ratio * SUMMARY_TOKEN_SLACK)
+    if budget <= 0:
+        raise ValueError(f"Context {context_tokens} token không đủ cho phần prompt cố định ({overhead_tokens} token)")
+    return int(budget)
@@ -0,0 +1,144 @@
+"""
+Đo thời gian từng giai đoạn của pipeline (tách câu, embedding, NER, LLM, ...)
+Tắt mặc định, bật bằng biến môi trường TRACE=1 hoặc tracer.enable().
+Khi tắt, span() trả về một object dùng chung nên gần như không tốn chi phí.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class Span:
+    __slots__ = ("tracer", "stage", "count", "tokens", "start")
+
+    def __init__(self, tracer, stage: str, count: int = 0, tokens: int = 0):
+        self.tracer = tracer
+        self.stage = stage
+        self.count = count
+        self.tokens = tokens
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.stage, self.start, time.perf_counter(), self.count, self.tokens)
+
+
+class _NoopSpan:
+    """Span khi tracing tắt: mọi thao tác đều bị bỏ qua"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+    count = 0
+    tokens = 0
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._events: List[dict] = []
+        self._stages: Dict[str, dict] = {}
+        self._origin = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._events = []
+            self._stages = {}
+            self._origin = time.perf_counter()
+
+    def span(self, stage: str, count: int = 0, tokens: int = 0):
+        """
+        Đo một giai đoạn: with tracer.span("embedding", count=len(sentences)): ...
+        count/tokens có thể được cập nhật bên trong khối with
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, stage, count, tokens)
+
+    def record(self, stage: str, start: float, end: float, count: int = 0, tokens: int = 0):
+        """Ghi một giai đoạn đã đo sẵn (start/end theo time.perf_counter)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._stages.setdefault(
+                stage, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "count": 0, "tokens": 0}
+            )
+            duration = end - start
+            stats["calls"] += 1
+            stats["seconds"] += duration
+            stats["max_seconds"] = max(stats["max_seconds"], duration)
+            stats["count"] += count
+            stats["tokens"] += tokens
+            self._events.append({
+                "name": stage,
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": duration * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {"count": count, "tokens": tokens}
+            })
+
+    def summary(self) -> Dict[str, dict]:
+        with self._lock:
+            result = {}
+            for stage, stats in self._stages.items():
+                stats = dict(stats)
+                stats["mean_seconds"] = stats["seconds"] / stats["calls"]
+                if stats["tokens"]:
+                    stats["tokens_per_second"] = stats["tokens"] / stats["seconds"] if stats["seconds"] else 0.0
+                result[stage] = stats
+            return result
+
+    def format_table(self) -> str:
+        """Bảng tổng hợp theo giai đoạn, sắp xếp theo tổng thời gian"""
+        rows = sorted(self.summary().items(), key=lambda item: -item[1]["seconds"])
+        lines = [f"{'stage':<20} {'calls':>6} {'total (s)':>10} {'mean (s)':>9} {'max (s)':>8} {'count':>8} {'tok/s':>8}"]
+        for stage, stats in rows:
+            tok_s = f"{stats['tokens_per_second']:.1f}" if "tokens_per_second" in stats else "-"
+            lines.append(
+                f"{stage:<20} {stats['calls']:>6} {stats['seconds']:>10.3f} {stats['mean_seconds']:>9.3f}"
+                f" {stats['max_seconds']:>8.3f} {stats['count']:>8} {tok_s:>8}"
+            )
+        return "\n".join(lines)
+
+    def write_trace(self, path: str, metadata: Optional[dict] = None):
+        """
+        Ghi trace dạng Chrome Trace Event (mở bằng chrome://tracing hoặc Perfetto)
+        kèm bảng tổng hợp trong trường 'summary'
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            events = list(self._events)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "traceEvents": events,
+                "summary": self.summary(),
+                "metadata": metadata or {}
+            }, f, ensure_ascii=False)
+
+
+tracer = Tracer(enabled=os.environ.get("TRACE", "0") == "1")